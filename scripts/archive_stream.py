@@ -0,0 +1,79 @@
+"""
+Lecture en flux des archives zip et tar déposées dans la boîte surveillée.
+
+Chaque membre exploitable devient un job à part entière. L'archive n'est
+jamais extraite d'un coup : les membres sont copiés un par un, au moment où le
+pipeline demande le suivant, dans un dossier de travail d'où ils sont lus puis
+supprimés une fois traités. L'espace temporaire est donc borné par le nombre de
+membres en cours de traitement, pas par la taille de l'archive. Les tar
+(compressés ou non) sont lus séquentiellement ('r|*'), sans retour en arrière.
+"""
+
+import os
+import shutil
+import tarfile
+import zipfile
+import logging
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+COPY_BUFFER = 1024 * 1024
+
+def is_archive(path):
+    """Vrai pour une archive zip ou tar (éventuellement compressée)"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def _skipped(name):
+    """Métadonnées macOS et fichiers cachés"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part]
+    return not parts or parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts)
+
+def iter_members(archive_path):
+    """Générer (nom du membre, flux en lecture) dans l'ordre de l'archive ; un flux n'est lisible que jusqu'au membre suivant"""
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skipped(info.filename):
+                    continue
+                with archive.open(info) as stream:
+                    yield info.filename, stream
+        return
+    with tarfile.open(archive_path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or _skipped(member.name):
+                continue
+            yield member.name, archive.extractfile(member)
+
+def _unique_path(directory, filename):
+    stem, ext = os.path.splitext(filename)
+    path = os.path.join(directory, filename)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(directory, f"{stem}_{suffix}{ext}")
+    return path
+
+def spool_members(archive_path, spool_dir, accept=None):
+    """Copier un à un dans spool_dir les membres acceptés (accept(nom)), à la demande ; générer leurs chemins"""
+    os.makedirs(spool_dir, exist_ok=True)
+    archive_name = os.path.basename(archive_path)
+    spooled = 0
+    for name, stream in iter_members(archive_path):
+        filename = os.path.basename(name)
+        if accept and not accept(filename):
+            logging.info(f"ARCHIVE | {archive_name} | membre ignoré: {name}")
+            continue
+        path = _unique_path(spool_dir, filename)
+        # Copie partielle invisible pour le pipeline, publiée une fois complète
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, COPY_BUFFER)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        spooled += 1
+        logging.info(f"ARCHIVE | {archive_name} | {name} → {os.path.basename(path)}")
+        yield path
+    logging.info(f"ARCHIVE | {archive_name} | {spooled} membres transmis au pipeline")
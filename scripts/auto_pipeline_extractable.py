@@ -2,11 +2,13 @@ import os
 import time
 import shutil
 import sys
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 import subprocess
 import argparse
 
+from status_counters import StatusCounters, format_eta
+from inbox_events import start_watching, stop_watching
+from file_scheduler import order_files
+
 WATCH_DIRECTORY = "/home/koffi/rag_project/extractable_files"
 DONE_DIRECTORY = os.path.join(WATCH_DIRECTORY, "done")
 os.makedirs(DONE_DIRECTORY, exist_ok=True)
@@ -18,11 +20,25 @@ ARTICLE_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "generate_articles_from_supabase.
 
 SUPPORTED_EXTENSIONS = (".pdf", ".epub", ".mobi", ".azw3", ".txt", ".docx")
 
+# Compteurs en attente / terminés, initialisés par un seul parcours des dossiers
+_counters = None
+
+def get_counters():
+    """Créer (une fois) les compteurs de fichiers par statut"""
+    global _counters
+    if _counters is None:
+        _counters = StatusCounters(
+            {'pending': WATCH_DIRECTORY, 'done': DONE_DIRECTORY},
+            accept=lambda filename: filename.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
+    return _counters
+
 def safe_file_move(src, dst):
     """Déplacement sécurisé des fichiers avec gestion d'erreurs"""
     try:
         if os.path.exists(src):
             shutil.move(src, dst)
+            get_counters().record_move(src, dst)
             return True
         else:
             print(f"⚠️ Fichier source non trouvé: {src}")
@@ -32,30 +48,9 @@ def safe_file_move(src, dst):
         return False
 
 def count_remaining_files():
-    """Compter les fichiers restants à traiter"""
-    if not os.path.exists(WATCH_DIRECTORY):
-        return 0, 0
-    
-    total_files = 0
-    done_files = 0
-    
-    # Compter tous les fichiers dans le répertoire principal
-    for filename in os.listdir(WATCH_DIRECTORY):
-        if filename == "done":
-            continue
-        full_path = os.path.join(WATCH_DIRECTORY, filename)
-        if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
-            total_files += 1
-    
-    # Compter les fichiers terminés
-    done_dir = os.path.join(WATCH_DIRECTORY, "done")
-    if os.path.exists(done_dir):
-        for filename in os.listdir(done_dir):
-            full_path = os.path.join(done_dir, filename)
-            if os.path.isfile(full_path):
-                done_files += 1
-    
-    return total_files, done_files
+    """Compter les fichiers restants à traiter (compteurs, sans relister les dossiers)"""
+    counts = get_counters().snapshot()['counts']
+    return counts['pending'], counts['done']
 
 def process_pdf(file_path):
     filename = os.path.basename(file_path)
@@ -68,7 +63,7 @@ def process_pdf(file_path):
     print(f"\n" + "="*80)
     print(f"🚀 TRAITEMENT FICHIER: {filename}")
     print(f"📊 PROGRESSION: {done}/{total} fichiers terminés ({progress:.1f}%)")
-    print(f"⏳ RESTANTS: {remaining} fichiers")
+    print(f"⏳ RESTANTS: {remaining} fichiers (ETA: {format_eta(get_counters().snapshot())})")
     print(f"📁 CHEMIN: {file_path}")
     print(f"⏰ DÉBUT: {time.strftime('%H:%M:%S')}")
     print("="*80)
@@ -144,7 +139,7 @@ def process_pdf(file_path):
             
             print(f"✅ SUCCÈS COMPLET pour {filename}")
             print(f"📊 NOUVELLE PROGRESSION: {done_after}/{total_after} fichiers terminés ({progress_after:.1f}%)")
-            print(f"⏳ NOUVEAUX RESTANTS: {remaining_after} fichiers")
+            print(f"⏳ NOUVEAUX RESTANTS: {remaining_after} fichiers (ETA: {format_eta(get_counters().snapshot())})")
             print(f"📁 Fichier déplacé: {dest}")
             print(f"⏰ Fin: {time.strftime('%H:%M:%S')}")
             print("="*80 + "\n")
@@ -162,13 +157,15 @@ def process_pdf(file_path):
         dest = os.path.join(DONE_DIRECTORY, filename)
         safe_file_move(file_path, dest)
 
-class PDFHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if not event.is_directory:
-            # Attendre un peu pour s'assurer que le fichier est complètement écrit
-            time.sleep(2)
-            if os.path.exists(event.src_path):
-                process_pdf(event.src_path)
+def process_new_files(file_paths):
+    """Traiter un lot de nouveaux fichiers dont l'écriture est terminée"""
+    print(f"📥 {len(file_paths)} nouveau(x) fichier(s) détecté(s)")
+    # Compter tout le lot d'abord : la progression affichée inclut les fichiers à venir
+    for file_path in file_paths:
+        get_counters().record_added(file_path)
+    for file_path in order_files(file_paths):
+        if os.path.exists(file_path):
+            process_pdf(file_path)
 
 def process_existing_pdfs(only_one=False):
     print("🔁 Vérification des fichiers déjà présents...")
@@ -178,17 +175,24 @@ def process_existing_pdfs(only_one=False):
     
     files = os.listdir(WATCH_DIRECTORY)
     processed = 0
+    # Parcours initial des dossiers ; ensuite les compteurs suivent les déplacements
+    get_counters()
     
+    pending = []
     for filename in files:
         if filename == "done":  # Ignorer le répertoire done
             continue
             
         full_path = os.path.join(WATCH_DIRECTORY, filename)
         if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
-            process_pdf(full_path)
-            processed += 1
-            if only_one:
-                break
+            pending.append(full_path)
+    
+    # Plus courts d'abord : les premiers articles sortent plus vite
+    for full_path in order_files(pending):
+        process_pdf(full_path)
+        processed += 1
+        if only_one:
+            break
     
     print(f"📊 {processed} fichiers traités")
 
@@ -202,14 +206,14 @@ if __name__ == "__main__":
     process_existing_pdfs(only_one=args.one)
 
     if not args.one:
-        event_handler = PDFHandler()
-        observer = Observer()
-        observer.schedule(event_handler, WATCH_DIRECTORY, recursive=False)
-        observer.start()
+        observer, batcher = start_watching(
+            WATCH_DIRECTORY, process_new_files,
+            accept=lambda path: path.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
 
         try:
             while True:
                 time.sleep(10)
         except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
+            pass
+        stop_watching(observer, batcher)
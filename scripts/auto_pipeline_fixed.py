@@ -2,11 +2,12 @@ import os
 import time
 import shutil
 import sys
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 import subprocess
 import argparse
 
+from inbox_events import start_watching, stop_watching
+from file_scheduler import order_files
+
 WATCH_DIRECTORY = "/home/koffi/rag_project/watched_inbox"
 DONE_DIRECTORY = os.path.join(WATCH_DIRECTORY, "done")
 os.makedirs(DONE_DIRECTORY, exist_ok=True)
@@ -78,13 +79,12 @@ def process_pdf(file_path):
         dest = os.path.join(DONE_DIRECTORY, filename)
         safe_file_move(file_path, dest)
 
-class PDFHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if not event.is_directory:
-            # Attendre un peu pour s'assurer que le fichier est complètement écrit
-            time.sleep(2)
-            if os.path.exists(event.src_path):
-                process_pdf(event.src_path)
+def process_new_files(file_paths):
+    """Traiter un lot de nouveaux fichiers dont l'écriture est terminée"""
+    print(f"📥 {len(file_paths)} nouveau(x) fichier(s) détecté(s)")
+    for file_path in order_files(file_paths):
+        if os.path.exists(file_path):
+            process_pdf(file_path)
 
 def process_existing_pdfs(only_one=False):
     print("🔁 Vérification des fichiers déjà présents...")
@@ -95,16 +95,21 @@ def process_existing_pdfs(only_one=False):
     files = os.listdir(WATCH_DIRECTORY)
     processed = 0
     
+    pending = []
     for filename in files:
         if filename == "done":  # Ignorer le répertoire done
             continue
             
         full_path = os.path.join(WATCH_DIRECTORY, filename)
         if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
-            process_pdf(full_path)
-            processed += 1
-            if only_one:
-                break
+            pending.append(full_path)
+    
+    # Plus courts d'abord : les premiers articles sortent plus vite
+    for full_path in order_files(pending):
+        process_pdf(full_path)
+        processed += 1
+        if only_one:
+            break
     
     print(f"📊 {processed} fichiers traités")
 
@@ -118,14 +123,14 @@ if __name__ == "__main__":
     process_existing_pdfs(only_one=args.one)
 
     if not args.one:
-        event_handler = PDFHandler()
-        observer = Observer()
-        observer.schedule(event_handler, WATCH_DIRECTORY, recursive=False)
-        observer.start()
+        observer, batcher = start_watching(
+            WATCH_DIRECTORY, process_new_files,
+            accept=lambda path: path.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
 
         try:
             while True:
                 time.sleep(10)
         except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
+            pass
+        stop_watching(observer, batcher)
@@ -9,12 +9,18 @@ import shutil
 import sys
 import subprocess
 import logging
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import signal
 import threading
 
+import stage_workers
+import backup_store
+from job_ledger import JobLedger, compute_content_hash, has_completed
+from embedding_store import source_in_store
+from status_counters import StatusCounters, format_eta
+from file_scheduler import URGENT_DIRNAME, POLICIES, order_files
+
 # Configuration des logs
 LOG_FILE = os.path.join(os.path.dirname(__file__), '..', 'resilient_pipeline.log')
 logging.basicConfig(
@@ -30,21 +36,30 @@ DONE_DIRECTORY = os.path.join(WATCH_DIRECTORY, "done")
 PROCESSING_DIRECTORY = os.path.join(WATCH_DIRECTORY, "processing")
 FAILED_DIRECTORY = os.path.join(WATCH_DIRECTORY, "failed")
 BACKUP_DIRECTORY = os.path.join(WATCH_DIRECTORY, "backup")
-
-# Scripts du pipeline
-RAG_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
-VECTORIZE_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "vectorize_books.py")
-TOPIC_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "topic_generator.py")
-ARTICLE_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "generate_articles_from_supabase.py")
+# Fichiers urgents : voie interactive, traités avant le stock
+URGENT_DIRECTORY = os.path.join(WATCH_DIRECTORY, URGENT_DIRNAME)
 
 SUPPORTED_EXTENSIONS = (".pdf", ".epub", ".mobi", ".azw3", ".txt", ".docx")
 
-# État de traitement par fichier
-processing_state = {}
+# Ordre de traitement des fichiers en attente : 'sjf' (plus court d'abord) ou 'fifo'
+SCHEDULING_POLICY = 'sjf'
+
+# Relances après un timeout (l'étape reprend à son dernier point de reprise)
+TIMEOUT_RETRIES = 2
+
+# Registre SQLite des jobs (statut, étape, tentatives, durées)
+JOB_LEDGER_PATH = os.path.join(WATCH_DIRECTORY, "pipeline_jobs.db")
+_ledger = None
+
+# Issue d'une copie dont le contenu est déjà en cours sous un autre nom : ni succès ni échec
+DEFERRED = 'deferred'
+
+# Compteurs de fichiers par dossier, mis à jour à chaque safe_file_move
+_counters = None
 
 def setup_directories():
     """Créer tous les répertoires nécessaires"""
-    directories = [DONE_DIRECTORY, PROCESSING_DIRECTORY, FAILED_DIRECTORY, BACKUP_DIRECTORY]
+    directories = [DONE_DIRECTORY, PROCESSING_DIRECTORY, FAILED_DIRECTORY, BACKUP_DIRECTORY, URGENT_DIRECTORY]
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
         logging.info(f"Répertoire créé/vérifié: {directory}")
@@ -54,12 +69,12 @@ def safe_file_move(src, dst, max_retries=3):
     for attempt in range(max_retries):
         try:
             if os.path.exists(src):
-                # Créer un backup avant déplacement
-                backup_path = os.path.join(BACKUP_DIRECTORY, os.path.basename(src))
-                shutil.copy2(src, backup_path)
+                # Créer un backup avant déplacement (lien ou magasin dédupliqué selon le mode)
+                backup_store.backup_file(src, BACKUP_DIRECTORY)
                 
                 # Déplacer le fichier
                 shutil.move(src, dst)
+                get_counters().record_move(src, dst)
                 logging.info(f"Fichier déplacé avec succès: {src} → {dst}")
                 return True
             else:
@@ -74,209 +89,229 @@ def safe_file_move(src, dst, max_retries=3):
                 return False
     return False
 
-def check_file_in_chroma(filename):
-    """Vérifier si un fichier est déjà vectorisé dans ChromaDB"""
+def get_counters():
+    """Créer (une fois) les compteurs de fichiers par statut"""
+    global _counters
+    if _counters is None:
+        _counters = StatusCounters(
+            {'pending': (WATCH_DIRECTORY, URGENT_DIRECTORY), 'processing': PROCESSING_DIRECTORY,
+             'done': DONE_DIRECTORY, 'failed': FAILED_DIRECTORY},
+            accept=lambda filename: filename.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
+    return _counters
+
+def get_ledger():
+    """Ouvrir (une fois) le registre SQLite des jobs"""
+    global _ledger
+    if _ledger is None:
+        os.makedirs(os.path.dirname(JOB_LEDGER_PATH), exist_ok=True)
+        _ledger = JobLedger(JOB_LEDGER_PATH)
+    return _ledger
+
+def find_previous_job(ledger, filename, file_path, content_hash):
+    """Job déjà connu pour ce contenu ; un fichier vectorisé avant le registre (source présente
+    dans Chroma, nom inconnu du registre) y est enregistré comme terminé"""
+    previous = ledger.find_by_hash(content_hash)
+    if previous or ledger.has_filename(filename):
+        return previous
     try:
-        from langchain_community.vectorstores import Chroma
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        
-        CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
-        embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
-        
-        # Récupérer tous les documents
-        docs = vectorstore.get()["metadatas"]
-        texts = vectorstore.get()["documents"]
-        
-        # Vérifier si le fichier est présent
-        for meta in docs:
-            if meta.get("source") == filename:
-                return True
-        return False
+        if not source_in_store(filename):
+            return None
     except Exception as e:
         logging.error(f"Erreur lors de la vérification ChromaDB: {e}")
-        return False
+        return None
+    logging.info(f"LEGACY | {filename} | déjà vectorisé avant le registre, enregistré comme terminé")
+    return ledger.record_done(filename, file_path, content_hash)
+
+def move_to_failed(job_id, file_path):
+    """Déplacer le fichier vers failed et clore le job en échec"""
+    failed_path = os.path.join(FAILED_DIRECTORY, os.path.basename(file_path))
+    moved = safe_file_move(file_path, failed_path)
+    get_ledger().set_status(job_id, 'failed', failed_path if moved else None)
+    return False
 
 def process_file_resilient(file_path):
-    """Traitement résilient d'un fichier avec déplacement après chaque étape"""
+    """Traitement résilient d'un fichier, repris à la dernière étape terminée s'il est connu du registre"""
     filename = os.path.basename(file_path)
-    file_id = f"{filename}_{int(time.time())}"
-    
-    print(f"\n" + "="*80)
-    print(f"🚀 TRAITEMENT RÉSILIENT: {filename}")
-    print(f"🆔 ID: {file_id}")
-    print(f"⏰ DÉBUT: {datetime.now().strftime('%H:%M:%S')}")
-    print("="*80)
-    
-    # Initialiser l'état de traitement
-    processing_state[file_id] = {
-        'filename': filename,
-        'start_time': datetime.now(),
-        'steps_completed': [],
-        'current_step': 'init',
-        'errors': []
-    }
     
     # Vérifier que le fichier existe
     if not os.path.exists(file_path):
         error_msg = f"Fichier non trouvé: {file_path}"
-        processing_state[file_id]['errors'].append(error_msg)
         logging.error(error_msg)
         print(f"❌ {error_msg}")
         return False
     
-    # Vérifier si déjà vectorisé
-    if check_file_in_chroma(filename):
-        print(f"✅ Fichier déjà vectorisé: {filename}")
-        # Déplacer directement vers done
+    ledger = get_ledger()
+    content_hash = compute_content_hash(file_path)
+    previous = find_previous_job(ledger, filename, file_path, content_hash)
+    
+    # Registre d'ingestion : mêmes octets déjà traités jusqu'au bout (même renommés),
+    # toutes les étapes sont sautées
+    if previous and previous['status'] == 'done':
+        print(f"✅ Fichier déjà traité (job {previous['id']}): {filename}")
+        if previous['filename'] != filename:
+            print(f"📎 Contenu identique à '{previous['filename']}'")
+            logging.info(f"DUPLICATE | {filename} | même contenu que {previous['filename']} (job {previous['id']})")
         dest = os.path.join(DONE_DIRECTORY, filename)
         if safe_file_move(file_path, dest):
-            processing_state[file_id]['steps_completed'].append('already_vectorized')
+            ledger.update_path(previous['id'], dest)
             print(f"📦 Fichier déplacé vers done: {dest}")
-            return True
+        return True
+    
+    # Même contenu déjà en cours de traitement sous un autre nom : ne pas le traiter deux fois,
+    # la copie reste en attente (reportée, ni traitée ni en échec) et partira vers done au prochain passage
+    if (previous and previous['status'] == 'processing' and previous['path']
+            and os.path.abspath(previous['path']) != os.path.abspath(file_path)
+            and os.path.exists(previous['path'])):
+        print(f"⏭️ Contenu identique à '{previous['filename']}' déjà en cours (job {previous['id']}): {filename}")
+        return DEFERRED
+    
+    job = ledger.begin_attempt(filename, file_path, content_hash)
+    job_id = job['id']
+    
+    print(f"\n" + "="*80)
+    print(f"🚀 TRAITEMENT RÉSILIENT: {filename}")
+    print(f"🆔 JOB: {job_id} (tentative {job['attempts']})")
+    if job['stage']:
+        print(f"♻️ REPRISE après l'étape: {job['stage']}")
+    print(f"⏰ DÉBUT: {datetime.now().strftime('%H:%M:%S')}")
+    print("="*80)
     
     try:
         # ÉTAPE 1: Vectorisation
-        processing_state[file_id]['current_step'] = 'vectorization'
-        print(f"\n🔄 [ÉTAPE 1/3] VECTORISATION")
-        
-        result = subprocess.run([sys.executable, VECTORIZE_SCRIPT, file_path], 
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0:
-            print(f"✅ Vectorisation réussie")
-            processing_state[file_id]['steps_completed'].append('vectorization')
-            
-            # Déplacer vers processing après vectorisation réussie
-            processing_path = os.path.join(PROCESSING_DIRECTORY, filename)
-            if safe_file_move(file_path, processing_path):
-                file_path = processing_path  # Mettre à jour le chemin
-                print(f"📦 Fichier déplacé vers processing après vectorisation")
+        if has_completed(job, 'vectorization'):
+            print(f"\n♻️ [ÉTAPE 1/3] VECTORISATION DÉJÀ FAITE")
         else:
-            error_msg = f"Erreur vectorisation: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"❌ {error_msg}")
-            # Déplacer vers failed
-            failed_path = os.path.join(FAILED_DIRECTORY, filename)
-            safe_file_move(file_path, failed_path)
-            return False
-        
-        # ÉTAPE 2: Génération des topics
-        processing_state[file_id]['current_step'] = 'topics'
-        print(f"\n🔄 [ÉTAPE 2/3] GÉNÉRATION DES TOPICS")
+            ledger.start_stage(job_id, 'vectorization')
+            print(f"\n🔄 [ÉTAPE 1/3] VECTORISATION")
+            
+            result = stage_workers.run_stage('vectorization', file_path,
+                                               timeout=stage_workers.stage_timeout('vectorization', file_path),
+                                               retries=TIMEOUT_RETRIES)
+            
+            if result.returncode == 0:
+                print(f"✅ Vectorisation réussie")
+                ledger.complete_stage(job_id, 'vectorization')
+            else:
+                error_msg = f"Erreur vectorisation: {result.stderr}"
+                ledger.add_error(job_id, error_msg, stage='vectorization')
+                print(f"❌ {error_msg}")
+                # Déplacer vers failed
+                return move_to_failed(job_id, file_path)
         
-        result = subprocess.run([sys.executable, TOPIC_SCRIPT, filename], 
-                              capture_output=True, text=True, timeout=300)
+        # Déplacer vers processing après vectorisation réussie
+        processing_path = os.path.join(PROCESSING_DIRECTORY, filename)
+        if os.path.abspath(file_path) != os.path.abspath(processing_path) and safe_file_move(file_path, processing_path):
+            file_path = processing_path  # Mettre à jour le chemin
+            ledger.update_path(job_id, file_path)
+            print(f"📦 Fichier déplacé vers processing après vectorisation")
         
-        if result.returncode == 0:
-            print(f"✅ Génération topics réussie")
-            processing_state[file_id]['steps_completed'].append('topics')
+        # ÉTAPE 2: Génération des topics
+        if has_completed(job, 'topics'):
+            print(f"\n♻️ [ÉTAPE 2/3] TOPICS DÉJÀ GÉNÉRÉS")
         else:
-            error_msg = f"Erreur génération topics: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"⚠️ {error_msg}")
-            # Continuer quand même car la vectorisation est réussie
+            ledger.start_stage(job_id, 'topics')
+            print(f"\n🔄 [ÉTAPE 2/3] GÉNÉRATION DES TOPICS")
+            
+            result = stage_workers.run_stage('topics', filename, timeout=stage_workers.stage_timeout('topics'))
+            
+            if result.returncode == 0:
+                print(f"✅ Génération topics réussie")
+                ledger.complete_stage(job_id, 'topics')
+            else:
+                error_msg = f"Erreur génération topics: {result.stderr}"
+                ledger.add_error(job_id, error_msg, stage='topics')
+                print(f"⚠️ {error_msg}")
+                # Continuer quand même car la vectorisation est réussie
         
         # ÉTAPE 3: Génération des articles
-        processing_state[file_id]['current_step'] = 'articles'
-        print(f"\n🔄 [ÉTAPE 3/3] GÉNÉRATION DES ARTICLES")
-        
-        result = subprocess.run([sys.executable, ARTICLE_SCRIPT, "100"], 
-                              capture_output=True, text=True, timeout=1800)
-        
-        if result.returncode == 0:
-            print(f"✅ Génération articles réussie")
-            processing_state[file_id]['steps_completed'].append('articles')
+        if has_completed(job, 'articles'):
+            print(f"\n♻️ [ÉTAPE 3/3] ARTICLES DÉJÀ GÉNÉRÉS")
         else:
-            error_msg = f"Erreur génération articles: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"⚠️ {error_msg}")
-            # Continuer car la vectorisation et les topics sont réussis
+            ledger.start_stage(job_id, 'articles')
+            print(f"\n🔄 [ÉTAPE 3/3] GÉNÉRATION DES ARTICLES")
+            
+            result = stage_workers.run_stage('articles', 100,
+                                               timeout=stage_workers.stage_timeout('articles', items=100),
+                                               retries=TIMEOUT_RETRIES)
+            
+            if result.returncode == 0:
+                print(f"✅ Génération articles réussie")
+                ledger.complete_stage(job_id, 'articles')
+            else:
+                error_msg = f"Erreur génération articles: {result.stderr}"
+                ledger.add_error(job_id, error_msg, stage='articles')
+                print(f"⚠️ {error_msg}")
+                # Continuer car la vectorisation et les topics sont réussis
         
         # FINALISATION: Déplacer vers done
-        processing_state[file_id]['current_step'] = 'finalization'
+        ledger.start_stage(job_id, 'completed')
         dest = os.path.join(DONE_DIRECTORY, filename)
         
         if safe_file_move(file_path, dest):
-            processing_state[file_id]['steps_completed'].append('completed')
-            processing_state[file_id]['end_time'] = datetime.now()
+            ledger.complete_stage(job_id, 'completed')
+            ledger.set_status(job_id, 'done', dest)
+            job = ledger.get_job(job_id)
             
             print(f"\n✅ SUCCÈS COMPLET pour {filename}")
-            print(f"📊 Étapes réussies: {', '.join(processing_state[file_id]['steps_completed'])}")
+            print(f"📊 Étapes réussies: {', '.join(ledger.completed_stages(job_id))}")
             print(f"📁 Fichier final: {dest}")
-            print(f"⏰ Durée totale: {processing_state[file_id]['end_time'] - processing_state[file_id]['start_time']}")
-            
-            # Sauvegarder l'état de traitement
-            save_processing_state(file_id)
+            print(f"⏰ Durée totale: {timedelta(seconds=round(job['finished_at'] - job['started_at']))}")
+            progress = get_counters().snapshot()
+            print(f"📊 Progression: {progress['counts']['done']}/{progress['total']} ({progress['progress']:.1f}%), "
+                  f"{progress['remaining']} restants, ETA {format_eta(progress)}")
             return True
         else:
             error_msg = "Échec du déplacement final"
-            processing_state[file_id]['errors'].append(error_msg)
+            ledger.add_error(job_id, error_msg, stage='completed')
             print(f"❌ {error_msg}")
             return False
             
     except subprocess.TimeoutExpired as e:
         error_msg = f"Timeout pour {filename}: {e}"
-        processing_state[file_id]['errors'].append(error_msg)
+        ledger.add_error(job_id, error_msg, stage=ledger.get_job(job_id)['current_step'])
         print(f"⏱️ {error_msg}")
         
         # Déplacer vers failed en cas de timeout
-        failed_path = os.path.join(FAILED_DIRECTORY, filename)
-        safe_file_move(file_path, failed_path)
-        return False
+        return move_to_failed(job_id, file_path)
         
     except Exception as e:
         error_msg = f"Erreur critique pour {filename}: {e}"
-        processing_state[file_id]['errors'].append(error_msg)
+        ledger.add_error(job_id, error_msg, stage=ledger.get_job(job_id)['current_step'])
         print(f"❌ {error_msg}")
         logging.error(error_msg)
         
         # Déplacer vers failed
-        failed_path = os.path.join(FAILED_DIRECTORY, filename)
-        safe_file_move(file_path, failed_path)
-        return False
+        return move_to_failed(job_id, file_path)
 
-def save_processing_state(file_id):
-    """Sauvegarder l'état de traitement dans un fichier JSON"""
-    try:
-        state_file = os.path.join(WATCH_DIRECTORY, f"processing_state_{file_id}.json")
-        with open(state_file, 'w') as f:
-            json.dump(processing_state[file_id], f, default=str, indent=2)
-        logging.info(f"État de traitement sauvegardé: {state_file}")
-    except Exception as e:
-        logging.error(f"Erreur sauvegarde état: {e}")
+def list_pending_files():
+    """Fichiers supportés déposés dans WATCH_DIRECTORY ou URGENT_DIRECTORY"""
+    pending = []
+    for directory in (URGENT_DIRECTORY, WATCH_DIRECTORY):
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if filename not in ['done', 'processing', 'failed', 'backup', URGENT_DIRNAME]:
+                full_path = os.path.join(directory, filename)
+                if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    pending.append(full_path)
+    return pending
+
+def list_interrupted_files():
+    """Fichiers de jobs restés 'processing' après un arrêt brutal (à reprendre)"""
+    interrupted = []
+    for job in get_ledger().jobs_with_status('processing'):
+        path = job['path']
+        inbox_dirs = (os.path.abspath(WATCH_DIRECTORY), os.path.abspath(URGENT_DIRECTORY))
+        if path and os.path.isfile(path) and os.path.dirname(os.path.abspath(path)) not in inbox_dirs:
+            interrupted.append(path)
+    return interrupted
 
 def count_files_by_status():
-    """Compter les fichiers par statut"""
-    counts = {
-        'pending': 0,
-        'processing': 0,
-        'done': 0,
-        'failed': 0
-    }
-    
-    # Fichiers en attente
-    for filename in os.listdir(WATCH_DIRECTORY):
-        if filename not in ['done', 'processing', 'failed', 'backup']:
-            full_path = os.path.join(WATCH_DIRECTORY, filename)
-            if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
-                counts['pending'] += 1
-    
-    # Fichiers en cours de traitement
-    if os.path.exists(PROCESSING_DIRECTORY):
-        counts['processing'] = len([f for f in os.listdir(PROCESSING_DIRECTORY) 
-                                   if os.path.isfile(os.path.join(PROCESSING_DIRECTORY, f))])
-    
-    # Fichiers terminés
-    if os.path.exists(DONE_DIRECTORY):
-        counts['done'] = len([f for f in os.listdir(DONE_DIRECTORY) 
-                             if os.path.isfile(os.path.join(DONE_DIRECTORY, f))])
-    
-    # Fichiers échoués
-    if os.path.exists(FAILED_DIRECTORY):
-        counts['failed'] = len([f for f in os.listdir(FAILED_DIRECTORY) 
-                               if os.path.isfile(os.path.join(FAILED_DIRECTORY, f))])
-    
+    """Compter les fichiers par statut (registre des jobs + fichiers déposés)"""
+    counts = get_ledger().count_by_status()
+    # Les fichiers déposés mais pas encore pris en charge ne sont pas dans le registre
+    counts['pending'] += get_counters().snapshot()['counts']['pending']
     return counts
 
 def process_existing_files(only_one=False):
@@ -291,22 +326,32 @@ def process_existing_files(only_one=False):
     print(f"  - Échoués: {counts['failed']}")
     
     processed = 0
+    deferred = 0
+    
+    # Reprendre d'abord les jobs interrompus, puis les nouveaux fichiers
+    interrupted = list_interrupted_files()
+    if interrupted:
+        print(f"♻️ {len(interrupted)} job(s) interrompu(s) à reprendre")
     
     # Traiter les fichiers en attente
-    for filename in os.listdir(WATCH_DIRECTORY):
-        if filename not in ['done', 'processing', 'failed', 'backup']:
-            full_path = os.path.join(WATCH_DIRECTORY, filename)
-            if os.path.isfile(full_path) and filename.lower().endswith(SUPPORTED_EXTENSIONS):
-                print(f"\n🎯 Traitement du fichier: {filename}")
-                if process_file_resilient(full_path):
-                    processed += 1
-                else:
-                    print(f"❌ Échec du traitement: {filename}")
-                
-                if only_one:
-                    break
+    # Les fichiers en attente passent dans l'ordre de l'ordonnanceur (urgents, puis selon SCHEDULING_POLICY)
+    for full_path in interrupted + order_files(list_pending_files(), SCHEDULING_POLICY):
+        filename = os.path.basename(full_path)
+        print(f"\n🎯 Traitement du fichier: {filename}")
+        outcome = process_file_resilient(full_path)
+        if outcome == DEFERRED:
+            deferred += 1
+        elif outcome:
+            processed += 1
+        else:
+            print(f"❌ Échec du traitement: {filename}")
+        
+        if only_one:
+            break
     
     print(f"\n📊 {processed} fichiers traités")
+    if deferred:
+        print(f"⏸️ {deferred} copie(s) reportée(s) : même contenu déjà en cours")
     return processed
 
 def main():
@@ -316,10 +361,13 @@ def main():
     
     # Configuration
     setup_directories()
+    stage_workers.warm_up()
     
     # Traitement des fichiers existants
     process_existing_files()
     
+    print(f"💾 Sauvegardes: {backup_store.format_stats(BACKUP_DIRECTORY)}")
+    logging.info(f"BACKUPS | {backup_store.format_stats()}")
     print("\n✅ Pipeline résilient terminé")
     print(f"📝 Logs détaillés: {LOG_FILE}")
 
@@ -327,8 +375,22 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--one', action='store_true', help='Traiter un seul fichier')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='Isoler chaque étape dans un sous-processus au lieu des workers chauds')
+    parser.add_argument('--backup-mode', choices=backup_store.BACKUP_MODES, default=None,
+                        help=f"Sauvegarde avant déplacement : lien/reflink, magasin dédupliqué ou copie (défaut: {backup_store.backup_mode})")
+    parser.add_argument('--backup-compress', action='store_true',
+                        help='Compresser en zstd les objets du magasin de sauvegarde')
+    parser.add_argument('--schedule', choices=POLICIES, default=SCHEDULING_POLICY,
+                        help="Ordre de traitement : plus court d'abord (sjf) ou ordre d'arrivée (fifo)")
     args = parser.parse_args()
     
+    SCHEDULING_POLICY = args.schedule
+    if args.subprocess:
+        stage_workers.set_execution_mode('subprocess')
+    if args.backup_mode or args.backup_compress:
+        backup_store.configure(args.backup_mode, True if args.backup_compress else None)
+    
     if args.one:
         process_existing_files(only_one=True)
     else:
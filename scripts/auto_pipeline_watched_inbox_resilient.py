@@ -9,12 +9,27 @@ import shutil
 import sys
 import subprocess
 import logging
-import json
 import mimetypes
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import signal
 import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import stage_workers
+import backup_store
+import transcription_engine
+import document_stream
+from stage_pipeline import PipelineStage, StagePipeline
+from job_ledger import JobLedger, compute_content_hash, has_completed
+from embedding_store import source_in_store
+from status_counters import StatusCounters, format_eta
+from file_scheduler import URGENT_DIRNAME, POLICIES, order_files
+from ocr_engine import extract_pdf_to_file, extract_images_to_file
+from scan_batches import find_scan_batches, pack_scan_batch, unsettled_scan_images
+from archive_stream import ARCHIVE_EXTENSIONS, spool_members
+from ebook_extractor import extract_ebook_to_file
+from document_extractor import extract_document_to_file
 
 # Configuration des logs
 LOG_FILE = os.path.join(os.path.dirname(__file__), '..', 'watched_inbox_resilient.log')
@@ -31,28 +46,67 @@ DONE_DIRECTORY = os.path.join(WATCH_DIRECTORY, "done")
 PROCESSING_DIRECTORY = os.path.join(WATCH_DIRECTORY, "processing")
 FAILED_DIRECTORY = os.path.join(WATCH_DIRECTORY, "failed")
 BACKUP_DIRECTORY = os.path.join(WATCH_DIRECTORY, "backup")
+# Fichiers urgents : voie interactive, traités avant le stock
+URGENT_DIRECTORY = os.path.join(WATCH_DIRECTORY, URGENT_DIRNAME)
 CONVERTED_DIRECTORY = os.path.join(WATCH_DIRECTORY, "converted")
-
-# Scripts du pipeline
-RAG_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
-VECTORIZE_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "vectorize_books.py")
-TOPIC_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "topic_generator.py")
-ARTICLE_SCRIPT = os.path.join(RAG_SCRIPTS_DIR, "generate_articles_from_supabase.py")
+# Copies de travail des membres d'archives, supprimées une fois traitées
+ARCHIVE_SPOOL_DIRECTORY = os.path.join(WATCH_DIRECTORY, "archives")
+# Sous-dossiers de travail (les autres sous-dossiers sont des lots de scans)
+INBOX_SUBDIRECTORIES = ('done', 'processing', 'failed', 'backup', 'converted', 'archives', URGENT_DIRNAME)
 
 # Types de fichiers supportés
 SUPPORTED_EXTENSIONS = {
     'text': (".pdf", ".txt", ".docx", ".rtf", ".odt", ".html", ".htm"),
     'ebook': (".epub", ".mobi", ".azw", ".azw3", ".fb2", ".lit", ".pdb"),
     'audio': (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".aac"),
-    'image': (".jpg", ".jpeg", ".png", ".tiff", ".bmp")
+    'image': (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".cbz"),
+    # Archives zip/tar : chaque membre supporté devient un job
+    'archive': ARCHIVE_EXTENSIONS
+}
+
+# Séparateur de pages dans les TXT convertis : vectorize_books s'en sert pour
+# ses points de reprise par plage de pages
+PAGE_BREAK = "\f"
+
+# Taille des pools par étape en mode concurrent :
+# conversion liée au CPU (OCR/pandoc), vectorisation liée au modèle d'embeddings,
+# topics/articles liés aux entrées/sorties vers le fournisseur LLM
+STAGE_POOL_SIZES = {
+    'conversion': max(1, (os.cpu_count() or 2) // 2),
+    'vectorization': 1,
+    'llm': 4,
 }
 
-# État de traitement par fichier
-processing_state = {}
+# Capacité de la file d'entrée de chaque étape (backpressure entre étapes)
+STAGE_QUEUE_SIZE = 8
+
+# Ordre de traitement des fichiers en attente : 'sjf' (plus court d'abord) ou 'fifo'
+SCHEDULING_POLICY = 'sjf'
+
+# Conversion en flux : le texte passe des convertisseurs au découpage en chunks
+# sans fichier intermédiaire ; l'extraction (OCR, transcription, calibre) reste dans
+# l'étape de conversion, qui remplit le cache de conversion relu par la vectorisation.
+# TEXT_CACHE garde en plus une copie .txt dans converted/
+STREAM_DOCUMENTS = os.environ.get("RAG_STREAM_DOCUMENTS", "1") == "1"
+TEXT_CACHE = os.environ.get("RAG_TEXT_CACHE", "0") == "1"
+
+# Relances après un timeout (l'étape reprend à son dernier point de reprise)
+TIMEOUT_RETRIES = 2
+
+# Registre SQLite des jobs (statut, étape, tentatives, durées)
+JOB_LEDGER_PATH = os.path.join(WATCH_DIRECTORY, "pipeline_jobs.db")
+_ledger = None
+
+# Issue d'une copie dont le contenu est déjà en cours sous un autre nom : ni succès ni échec
+DEFERRED = 'deferred'
+
+# Compteurs de fichiers par dossier, mis à jour à chaque safe_file_move
+_counters = None
 
 def setup_directories():
     """Créer tous les répertoires nécessaires"""
-    directories = [DONE_DIRECTORY, PROCESSING_DIRECTORY, FAILED_DIRECTORY, BACKUP_DIRECTORY, CONVERTED_DIRECTORY]
+    directories = [DONE_DIRECTORY, PROCESSING_DIRECTORY, FAILED_DIRECTORY, BACKUP_DIRECTORY, CONVERTED_DIRECTORY,
+                   URGENT_DIRECTORY, ARCHIVE_SPOOL_DIRECTORY]
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
         logging.info(f"Répertoire créé/vérifié: {directory}")
@@ -62,12 +116,12 @@ def safe_file_move(src, dst, max_retries=3):
     for attempt in range(max_retries):
         try:
             if os.path.exists(src):
-                # Créer un backup avant déplacement
-                backup_path = os.path.join(BACKUP_DIRECTORY, os.path.basename(src))
-                shutil.copy2(src, backup_path)
+                # Créer un backup avant déplacement (lien ou magasin dédupliqué selon le mode)
+                backup_store.backup_file(src, BACKUP_DIRECTORY)
                 
                 # Déplacer le fichier
                 shutil.move(src, dst)
+                get_counters().record_move(src, dst)
                 logging.info(f"Fichier déplacé avec succès: {src} → {dst}")
                 return True
             else:
@@ -84,118 +138,92 @@ def safe_file_move(src, dst, max_retries=3):
 
 def detect_file_type(filepath):
     """Détecter le type de fichier"""
-    ext = os.path.splitext(filepath)[1].lower()
+    # Extensions doubles comprises (.tar.gz)
+    name = os.path.basename(filepath).lower()
     
     for file_type, extensions in SUPPORTED_EXTENSIONS.items():
-        if ext in extensions:
+        if name.endswith(extensions):
             return file_type
     
     return 'unknown'
 
 def convert_audio_to_text(audio_path, output_path):
-    """Convertir un fichier audio en texte via Whisper"""
+    """Convertir un fichier audio en texte via Whisper (modèle résident, segments en parallèle)"""
     try:
-        import whisper
         print(f"🎵 Transcription audio: {os.path.basename(audio_path)}")
         
-        model = whisper.load_model("base")
-        result = model.transcribe(audio_path)
-        text = result["text"]
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+        chars = transcription_engine.transcribe_to_file(audio_path, output_path)
         
-        print(f"✅ Transcription réussie: {len(text)} caractères")
+        print(f"✅ Transcription réussie: {chars} caractères")
         return True
     except Exception as e:
         print(f"❌ Erreur transcription: {e}")
         return False
 
 def convert_ebook_to_text(ebook_path, output_path):
-    """Convertir un eBook en texte"""
+    """Convertir un eBook en texte (EPUB/FB2 lus directement, calibre vers EPUB sinon)"""
     try:
-        # Essayer d'abord avec Calibre
-        pdf_path = os.path.join(CONVERTED_DIRECTORY, os.path.splitext(os.path.basename(ebook_path))[0] + '.pdf')
-        
         print(f"📚 Conversion eBook: {os.path.basename(ebook_path)}")
         
-        # Conversion en PDF
-        result = subprocess.run(['ebook-convert', ebook_path, pdf_path], 
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0 and os.path.exists(pdf_path):
-            # Extraction texte du PDF
-            from langchain_community.document_loaders import PyPDFLoader
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            text = '\n'.join([doc.page_content for doc in docs])
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(text)
-            
-            print(f"✅ Conversion eBook réussie: {len(text)} caractères")
-            return True
-        else:
-            print(f"❌ Erreur conversion eBook: {result.stderr}")
+        # Un chapitre par page (séparés par PAGE_BREAK)
+        chars, chapters = extract_ebook_to_file(ebook_path, output_path, work_dir=CONVERTED_DIRECTORY)
+        if not chars:
+            print("❌ Erreur conversion eBook: aucun texte extrait")
             return False
+        
+        print(f"✅ Conversion eBook réussie: {chars} caractères, {chapters} chapitres")
+        return True
     except Exception as e:
         print(f"❌ Erreur conversion eBook: {e}")
         return False
 
 def convert_document_to_text(doc_path, output_path):
-    """Convertir un document en texte"""
+    """Convertir un document en texte (DOCX/ODT/RTF/HTML en processus, pandoc en repli)"""
     try:
         print(f"📄 Conversion document: {os.path.basename(doc_path)}")
         
-        # Utiliser pandoc pour la conversion
-        result = subprocess.run(['pandoc', doc_path, '-t', 'plain', '-o', output_path], 
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0:
-            # Vérifier que le fichier contient du texte
-            with open(output_path, 'r', encoding='utf-8') as f:
-                text = f.read().strip()
-                if text and len(text) > 100:
-                    print(f"✅ Conversion document réussie: {len(text)} caractères")
-                    return True
+        chars = extract_document_to_file(doc_path, output_path)
+        if chars > 100:
+            print(f"✅ Conversion document réussie: {chars} caractères")
+            return True
         
-        print(f"❌ Erreur conversion document: {result.stderr}")
+        print(f"❌ Erreur conversion document: seulement {chars} caractères extraits")
         return False
     except Exception as e:
         print(f"❌ Erreur conversion document: {e}")
         return False
 
 def convert_pdf_with_ocr(pdf_path, output_path):
-    """Convertir un PDF en texte avec OCR si nécessaire"""
+    """Convertir un PDF en texte, en ne passant à l'OCR que les pages sans couche texte"""
     try:
         print(f"📄 Traitement PDF: {os.path.basename(pdf_path)}")
         
-        # Essayer d'abord l'extraction normale
-        from langchain_community.document_loaders import PyPDFLoader
-        loader = PyPDFLoader(pdf_path)
-        docs = loader.load()
-        text = '\n'.join([doc.page_content for doc in docs])
+        # Classement page par page : texte extrait directement, pages scannées OCR en flux
+        chars, ocr_pages = extract_pdf_to_file(pdf_path, output_path)
+        if ocr_pages:
+            print(f"🔄 {ocr_pages} page(s) sans texte reconnue(s) par OCR")
         
-        # Si pas de texte, essayer l'OCR
-        if not text.strip():
-            print(f"🔄 PDF sans texte, lancement OCR...")
-            from pdf2image import convert_from_path
-            import pytesseract
-            
-            images = convert_from_path(pdf_path)
-            ocr_text = ""
-            for img in images:
-                ocr_text += pytesseract.image_to_string(img, lang="fra")
-            text = ocr_text
-            print(f"✅ OCR terminé: {len(text)} caractères")
+        print(f"✅ Traitement PDF réussi: {chars} caractères")
+        return True
+    except Exception as e:
+        print(f"❌ Erreur traitement PDF: {e}")
+        return False
+
+def convert_images_with_ocr(image_path, output_path):
+    """Convertir une image, un TIFF multipage ou un lot de scans (CBZ) en texte par OCR"""
+    try:
+        print(f"🖼️ OCR images: {os.path.basename(image_path)}")
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+        # Une page par image, reconnues en parallèle dans le pool OCR des PDF
+        chars, pages = extract_images_to_file(image_path, output_path)
+        if not chars:
+            print("❌ Erreur OCR images: aucun texte reconnu")
+            return False
         
-        print(f"✅ Traitement PDF réussi: {len(text)} caractères")
+        print(f"✅ OCR images réussi: {chars} caractères, {pages} page(s)")
         return True
     except Exception as e:
-        print(f"❌ Erreur traitement PDF: {e}")
+        print(f"❌ Erreur OCR images: {e}")
         return False
 
 def convert_file_to_text(file_path):
@@ -209,6 +237,13 @@ def convert_file_to_text(file_path):
     
     print(f"\n🔄 CONVERSION: {filename} (Type: {file_type})")
     
+    # Même contenu déjà converti (sous ce nom ou un autre) par la même version d'extracteur
+    pages = document_stream.write_cached_text(file_path, txt_path)
+    if pages:
+        print(f"♻️ Texte repris du cache de conversion: {pages} page(s)")
+        logging.info(f"CACHE | {filename} | conversion reprise du cache ({pages} pages)")
+        return txt_path
+    
     success = False
     
     if file_type == 'text':
@@ -227,244 +262,538 @@ def convert_file_to_text(file_path):
     elif file_type == 'audio':
         success = convert_audio_to_text(file_path, txt_path)
     
+    elif file_type == 'image':
+        success = convert_images_with_ocr(file_path, txt_path)
+    
     else:
         print(f"❌ Type de fichier non supporté: {file_type}")
         return None
     
     if success and os.path.exists(txt_path):
+        try:
+            document_stream.cache_text_file(file_path, txt_path)
+        except Exception as e:
+            logging.warning(f"CACHE | {filename} | mise en cache impossible: {e}")
         return txt_path
     else:
         return None
 
-def check_file_in_chroma(filename):
-    """Vérifier si un fichier est déjà vectorisé dans ChromaDB"""
+def is_archive_member(file_path):
+    """Vrai pour la copie de travail d'un membre d'archive"""
+    return os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(ARCHIVE_SPOOL_DIRECTORY)
+
+def remove_archive_member(file_path):
+    """Supprimer la copie de travail d'un membre (l'archive reste dans done)"""
     try:
-        from langchain_community.vectorstores import Chroma
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        
-        CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
-        embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
-        
-        # Récupérer tous les documents
-        docs = vectorstore.get()["metadatas"]
-        
-        # Vérifier si le fichier est présent
-        for meta in docs:
-            if meta.get("source") == filename:
-                return True
+        os.remove(file_path)
+        logging.info(f"ARCHIVE | copie de travail supprimée: {file_path}")
+        return True
+    except OSError as e:
+        logging.error(f"ARCHIVE | suppression impossible de {file_path}: {e}")
         return False
+
+def accept_archive_member(filename):
+    """Membres transmis au pipeline : formats supportés, sans archives imbriquées"""
+    return detect_file_type(filename) not in ('unknown', 'archive')
+
+def expand_archive(archive_path):
+    """Générer les membres d'une archive, copiés un à un à la demande ; l'archive part ensuite vers done (failed si illisible)"""
+    filename = os.path.basename(archive_path)
+    print(f"\n📦 ARCHIVE: {filename} (membres lus en flux)")
+    try:
+        yield from spool_members(archive_path, ARCHIVE_SPOOL_DIRECTORY, accept=accept_archive_member)
+    except Exception as e:
+        print(f"❌ Archive illisible {filename}: {e}")
+        logging.error(f"ARCHIVE | {filename} | lecture interrompue: {e}")
+        safe_file_move(archive_path, os.path.join(FAILED_DIRECTORY, filename))
+        return
+    if safe_file_move(archive_path, os.path.join(DONE_DIRECTORY, filename)):
+        print(f"📦 Archive lue en entier, déplacée vers done: {filename}")
+
+def expand_archives(file_paths):
+    """Remplacer les archives par leurs membres, au fil de la demande du pipeline"""
+    for file_path in file_paths:
+        if detect_file_type(file_path) == 'archive':
+            yield from expand_archive(file_path)
+        else:
+            yield file_path
+
+def clean_archive_spool():
+    """Supprimer les copies de membres sans job en cours (arrêt avant leur prise en charge)"""
+    if not os.path.isdir(ARCHIVE_SPOOL_DIRECTORY):
+        return
+    in_progress = {os.path.abspath(job['path']) for job in get_ledger().jobs_with_status('processing') if job['path']}
+    for filename in os.listdir(ARCHIVE_SPOOL_DIRECTORY):
+        path = os.path.join(ARCHIVE_SPOOL_DIRECTORY, filename)
+        if os.path.isfile(path) and os.path.abspath(path) not in in_progress:
+            remove_archive_member(path)
+
+def get_counters():
+    """Créer (une fois) les compteurs de fichiers par statut"""
+    global _counters
+    if _counters is None:
+        _counters = StatusCounters(
+            {'pending': (WATCH_DIRECTORY, URGENT_DIRECTORY), 'processing': PROCESSING_DIRECTORY,
+             'done': DONE_DIRECTORY, 'failed': FAILED_DIRECTORY},
+            accept=lambda filename: detect_file_type(filename) != 'unknown'
+        )
+    return _counters
+
+def get_ledger():
+    """Ouvrir (une fois) le registre SQLite des jobs"""
+    global _ledger
+    if _ledger is None:
+        os.makedirs(os.path.dirname(JOB_LEDGER_PATH), exist_ok=True)
+        _ledger = JobLedger(JOB_LEDGER_PATH)
+    return _ledger
+
+def find_previous_job(ledger, filename, file_path, content_hash):
+    """Job déjà connu pour ce contenu ; un fichier vectorisé avant le registre (source présente
+    dans Chroma, nom inconnu du registre) y est enregistré comme terminé"""
+    previous = ledger.find_by_hash(content_hash)
+    if previous or ledger.has_filename(filename):
+        return previous
+    try:
+        if not source_in_store(filename):
+            return None
     except Exception as e:
         logging.error(f"Erreur lors de la vérification ChromaDB: {e}")
-        return False
+        return None
+    logging.info(f"LEGACY | {filename} | déjà vectorisé avant le registre, enregistré comme terminé")
+    return ledger.record_done(filename, file_path, content_hash)
 
-def process_file_resilient(file_path):
-    """Traitement résilient d'un fichier avec conversion et déplacement automatique"""
+def start_file_processing(file_path):
+    """Créer ou reprendre le job d'un fichier ; retourne (job_id, issue) où issue vaut None si le traitement doit continuer"""
     filename = os.path.basename(file_path)
-    file_id = f"{filename}_{int(time.time())}"
-    
-    print(f"\n" + "="*80)
-    print(f"🚀 TRAITEMENT RÉSILIENT WATCHED_INBOX: {filename}")
-    print(f"🆔 ID: {file_id}")
-    print(f"⏰ DÉBUT: {datetime.now().strftime('%H:%M:%S')}")
-    print("="*80)
-    
-    # Initialiser l'état de traitement
-    processing_state[file_id] = {
-        'filename': filename,
-        'start_time': datetime.now(),
-        'steps_completed': [],
-        'current_step': 'init',
-        'errors': []
-    }
     
     # Vérifier que le fichier existe
     if not os.path.exists(file_path):
         error_msg = f"Fichier non trouvé: {file_path}"
-        processing_state[file_id]['errors'].append(error_msg)
         logging.error(error_msg)
         print(f"❌ {error_msg}")
-        return False
+        return None, False
     
-    # Vérifier si déjà vectorisé
-    if check_file_in_chroma(filename):
-        print(f"✅ Fichier déjà vectorisé: {filename}")
-        # Déplacer directement vers done
+    ledger = get_ledger()
+    content_hash = compute_content_hash(file_path)
+    previous = find_previous_job(ledger, filename, file_path, content_hash)
+    
+    # Registre d'ingestion : mêmes octets déjà traités jusqu'au bout (même renommés),
+    # toutes les étapes sont sautées avant la conversion
+    if previous and previous['status'] == 'done':
+        print(f"✅ Fichier déjà traité (job {previous['id']}): {filename}")
+        if previous['filename'] != filename:
+            print(f"📎 Contenu identique à '{previous['filename']}'")
+            logging.info(f"DUPLICATE | {filename} | même contenu que {previous['filename']} (job {previous['id']})")
+        if is_archive_member(file_path):
+            remove_archive_member(file_path)
+            return previous['id'], True
         dest = os.path.join(DONE_DIRECTORY, filename)
         if safe_file_move(file_path, dest):
-            processing_state[file_id]['steps_completed'].append('already_vectorized')
+            ledger.update_path(previous['id'], dest)
             print(f"📦 Fichier déplacé vers done: {dest}")
-            return True
+        return previous['id'], True
     
-    try:
-        # ÉTAPE 1: Conversion en texte
-        processing_state[file_id]['current_step'] = 'conversion'
-        print(f"\n🔄 [ÉTAPE 1/4] CONVERSION EN TEXTE")
-        
-        txt_path = convert_file_to_text(file_path)
-        
-        if txt_path and os.path.exists(txt_path):
-            print(f"✅ Conversion réussie")
-            processing_state[file_id]['steps_completed'].append('conversion')
-            
-            # Déplacer le fichier original vers processing
-            processing_path = os.path.join(PROCESSING_DIRECTORY, filename)
-            if safe_file_move(file_path, processing_path):
-                file_path = processing_path  # Mettre à jour le chemin
-                print(f"📦 Fichier original déplacé vers processing")
-        else:
-            error_msg = "Échec de la conversion en texte"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"❌ {error_msg}")
-            # Déplacer vers failed
-            failed_path = os.path.join(FAILED_DIRECTORY, filename)
-            safe_file_move(file_path, failed_path)
-            return False
-        
-        # ÉTAPE 2: Vectorisation
-        processing_state[file_id]['current_step'] = 'vectorization'
-        print(f"\n🔄 [ÉTAPE 2/4] VECTORISATION")
-        
-        result = subprocess.run([sys.executable, VECTORIZE_SCRIPT, txt_path], 
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0:
-            print(f"✅ Vectorisation réussie")
-            processing_state[file_id]['steps_completed'].append('vectorization')
-        else:
-            error_msg = f"Erreur vectorisation: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"❌ {error_msg}")
-            # Déplacer vers failed
-            failed_path = os.path.join(FAILED_DIRECTORY, filename)
-            safe_file_move(file_path, failed_path)
-            return False
-        
-        # ÉTAPE 3: Génération des topics
-        processing_state[file_id]['current_step'] = 'topics'
+    # Même contenu déjà en cours de traitement sous un autre nom : ne pas le traiter deux fois,
+    # la copie reste en attente (reportée, ni traitée ni en échec) et partira vers done au prochain passage
+    if (previous and previous['status'] == 'processing' and previous['path']
+            and os.path.abspath(previous['path']) != os.path.abspath(file_path)
+            and os.path.exists(previous['path'])):
+        print(f"⏭️ Contenu identique à '{previous['filename']}' déjà en cours (job {previous['id']}): {filename}")
+        if is_archive_member(file_path):
+            remove_archive_member(file_path)
+        return previous['id'], DEFERRED
+    
+    job = ledger.begin_attempt(filename, file_path, content_hash)
+    
+    print(f"\n" + "="*80)
+    print(f"🚀 TRAITEMENT RÉSILIENT WATCHED_INBOX: {filename}")
+    print(f"🆔 JOB: {job['id']} (tentative {job['attempts']})")
+    if job['stage']:
+        print(f"♻️ REPRISE après l'étape: {job['stage']}")
+    print(f"⏰ DÉBUT: {datetime.now().strftime('%H:%M:%S')}")
+    print("="*80)
+    
+    return job['id'], None
+
+def fail_file(job_id, file_path, error_msg, stage=None):
+    """Enregistrer l'erreur et déplacer le fichier vers failed"""
+    ledger = get_ledger()
+    ledger.add_error(job_id, error_msg, stage)
+    print(f"❌ {error_msg}")
+    failed_path = os.path.join(FAILED_DIRECTORY, os.path.basename(file_path))
+    moved = safe_file_move(file_path, failed_path)
+    ledger.set_status(job_id, 'failed', failed_path if moved else None)
+    return False
+
+def handle_step_exception(job_id, file_path, e):
+    """Traiter un timeout ou une erreur inattendue pendant une étape"""
+    ledger = get_ledger()
+    filename = os.path.basename(file_path)
+    stage = ledger.get_job(job_id)['current_step']
+    if isinstance(e, subprocess.TimeoutExpired):
+        error_msg = f"Timeout pour {filename}: {e}"
+        print(f"⏱️ {error_msg}")
+    else:
+        error_msg = f"Erreur critique pour {filename}: {e}"
+        print(f"❌ {error_msg}")
+        logging.error(error_msg)
+    ledger.add_error(job_id, error_msg, stage)
+    
+    # Déplacer vers failed
+    failed_path = os.path.join(FAILED_DIRECTORY, filename)
+    moved = safe_file_move(file_path, failed_path)
+    ledger.set_status(job_id, 'failed', failed_path if moved else None)
+    return False
+
+def move_to_processing(job_id, file_path):
+    """Déplacer le fichier original vers processing (s'il n'y est pas déjà)"""
+    if is_archive_member(file_path):
+        # Copie de travail d'un membre d'archive : traitée sur place
+        return file_path
+    processing_path = os.path.join(PROCESSING_DIRECTORY, os.path.basename(file_path))
+    if os.path.abspath(file_path) != os.path.abspath(processing_path) and safe_file_move(file_path, processing_path):
+        file_path = processing_path  # Mettre à jour le chemin
+        get_ledger().update_path(job_id, file_path)
+        print(f"📦 Fichier original déplacé vers processing")
+    return file_path
+
+def converted_text_path(job_id):
+    """Texte issu d'une conversion déjà terminée pour ce job, ou None"""
+    job = get_ledger().get_job(job_id)
+    if has_completed(job, 'conversion') and job['txt_path'] and os.path.exists(job['txt_path']):
+        return job['txt_path']
+    return None
+
+def streams_conversion(file_path):
+    """Vrai si le texte passe en flux des convertisseurs à la vectorisation, sans .txt"""
+    return STREAM_DOCUMENTS and document_stream.supports(file_path)
+
+def run_streamed_conversion(job_id, file_path):
+    """Conversion en flux : segments extraits dans le cache de conversion, relus par la vectorisation"""
+    print(f"\n🔄 [ÉTAPE 1/4] CONVERSION EN FLUX")
+    ledger = get_ledger()
+    ledger.start_stage(job_id, 'conversion')
+    if document_stream.convert_to_cache(file_path):
+        print(f"✅ Conversion réussie (cache de conversion)")
+    else:
+        # Texte brut ou cache désactivé : lu pendant la vectorisation
+        print(f"⏭️ Texte lu pendant la vectorisation")
+    ledger.complete_stage(job_id, 'conversion')
+    return move_to_processing(job_id, file_path), None
+
+def run_conversion_step(job_id, file_path):
+    """ÉTAPE 1 : conversion en texte ; retourne (chemin du fichier, chemin du texte ou None si en flux) ou None"""
+    txt_path = converted_text_path(job_id)
+    if txt_path:
+        print(f"\n♻️ [ÉTAPE 1/4] CONVERSION DÉJÀ FAITE: {os.path.basename(txt_path)}")
+        return move_to_processing(job_id, file_path), txt_path
+    
+    if streams_conversion(file_path):
+        return run_streamed_conversion(job_id, file_path)
+    
+    get_ledger().start_stage(job_id, 'conversion')
+    print(f"\n🔄 [ÉTAPE 1/4] CONVERSION EN TEXTE")
+    
+    txt_path = convert_file_to_text(file_path)
+    return complete_conversion_step(job_id, file_path, txt_path)
+
+def complete_conversion_step(job_id, file_path, txt_path):
+    """Valider la conversion et déplacer l'original vers processing"""
+    if txt_path and os.path.exists(txt_path):
+        print(f"✅ Conversion réussie")
+        get_ledger().complete_stage(job_id, 'conversion', txt_path=txt_path)
+        return move_to_processing(job_id, file_path), txt_path
+    
+    fail_file(job_id, file_path, "Échec de la conversion en texte", stage='conversion')
+    return None
+
+def run_vectorization_step(job_id, file_path, txt_path):
+    """ÉTAPE 2 : vectorisation du texte converti, ou du fichier lui-même en flux (txt_path None)"""
+    ledger = get_ledger()
+    if has_completed(ledger.get_job(job_id), 'vectorization'):
+        print(f"\n♻️ [ÉTAPE 2/4] VECTORISATION DÉJÀ FAITE")
+        return True
+    
+    ledger.start_stage(job_id, 'vectorization')
+    print(f"\n🔄 [ÉTAPE 2/4] VECTORISATION")
+    
+    source = txt_path or file_path
+    cache_args = (CONVERTED_DIRECTORY,) if TEXT_CACHE and not txt_path else ()
+    result = stage_workers.run_stage('vectorization', source, *cache_args,
+                                       timeout=stage_workers.stage_timeout('vectorization', source),
+                                       retries=TIMEOUT_RETRIES)
+    
+    if result.returncode == 0:
+        print(f"✅ Vectorisation réussie")
+        ledger.complete_stage(job_id, 'vectorization')
+        return True
+    
+    return fail_file(job_id, file_path, f"Erreur vectorisation: {result.stderr}", stage='vectorization')
+
+def run_llm_steps(job_id, filename, article_source=None):
+    """ÉTAPES 3 et 4 : topics puis articles (non bloquantes : la vectorisation est acquise)"""
+    ledger = get_ledger()
+    job = ledger.get_job(job_id)
+    
+    # ÉTAPE 3: Génération des topics
+    if has_completed(job, 'topics'):
+        print(f"\n♻️ [ÉTAPE 3/4] TOPICS DÉJÀ GÉNÉRÉS")
+    else:
+        ledger.start_stage(job_id, 'topics')
         print(f"\n🔄 [ÉTAPE 3/4] GÉNÉRATION DES TOPICS")
         
-        result = subprocess.run([sys.executable, TOPIC_SCRIPT, filename], 
-                              capture_output=True, text=True, timeout=300)
+        result = stage_workers.run_stage('topics', filename, timeout=stage_workers.stage_timeout('topics'))
         
         if result.returncode == 0:
             print(f"✅ Génération topics réussie")
-            processing_state[file_id]['steps_completed'].append('topics')
+            ledger.complete_stage(job_id, 'topics')
         else:
             error_msg = f"Erreur génération topics: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
+            ledger.add_error(job_id, error_msg, stage='topics')
             print(f"⚠️ {error_msg}")
             # Continuer quand même car la vectorisation est réussie
-        
-        # ÉTAPE 4: Génération des articles
-        processing_state[file_id]['current_step'] = 'articles'
-        print(f"\n🔄 [ÉTAPE 4/4] GÉNÉRATION DES ARTICLES")
-        
-        result = subprocess.run([sys.executable, ARTICLE_SCRIPT, "100"], 
-                              capture_output=True, text=True, timeout=1800)
-        
-        if result.returncode == 0:
-            print(f"✅ Génération articles réussie")
-            processing_state[file_id]['steps_completed'].append('articles')
-        else:
-            error_msg = f"Erreur génération articles: {result.stderr}"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"⚠️ {error_msg}")
-            # Continuer car la vectorisation et les topics sont réussis
-        
-        # FINALISATION: Déplacer vers done
-        processing_state[file_id]['current_step'] = 'finalization'
-        dest = os.path.join(DONE_DIRECTORY, filename)
-        
-        if safe_file_move(file_path, dest):
-            processing_state[file_id]['steps_completed'].append('completed')
-            processing_state[file_id]['end_time'] = datetime.now()
-            
-            print(f"\n✅ SUCCÈS COMPLET pour {filename}")
-            print(f"📊 Étapes réussies: {', '.join(processing_state[file_id]['steps_completed'])}")
+    
+    # ÉTAPE 4: Génération des articles
+    if has_completed(job, 'articles'):
+        print(f"\n♻️ [ÉTAPE 4/4] ARTICLES DÉJÀ GÉNÉRÉS")
+        return
+    
+    ledger.start_stage(job_id, 'articles')
+    print(f"\n🔄 [ÉTAPE 4/4] GÉNÉRATION DES ARTICLES")
+    
+    article_args = (100, article_source) if article_source else (100,)
+    result = stage_workers.run_stage('articles', *article_args,
+                                       timeout=stage_workers.stage_timeout('articles', items=100),
+                                       retries=TIMEOUT_RETRIES)
+    
+    if result.returncode == 0:
+        print(f"✅ Génération articles réussie")
+        ledger.complete_stage(job_id, 'articles')
+    else:
+        error_msg = f"Erreur génération articles: {result.stderr}"
+        ledger.add_error(job_id, error_msg, stage='articles')
+        print(f"⚠️ {error_msg}")
+        # Continuer car la vectorisation et les topics sont réussis
+
+def finalize_file(job_id, file_path):
+    """FINALISATION : déplacer vers done et clore le job"""
+    ledger = get_ledger()
+    filename = os.path.basename(file_path)
+    ledger.start_stage(job_id, 'completed')
+    
+    # Membre d'archive : l'archive d'origine est dans done, la copie de travail est supprimée
+    dest = None if is_archive_member(file_path) else os.path.join(DONE_DIRECTORY, filename)
+    
+    if remove_archive_member(file_path) if dest is None else safe_file_move(file_path, dest):
+        ledger.complete_stage(job_id, 'completed')
+        ledger.set_status(job_id, 'done', dest)
+        job = ledger.get_job(job_id)
+        
+        print(f"\n✅ SUCCÈS COMPLET pour {filename}")
+        print(f"📊 Étapes réussies: {', '.join(ledger.completed_stages(job_id))}")
+        if dest:
             print(f"📁 Fichier final: {dest}")
-            print(f"⏰ Durée totale: {processing_state[file_id]['end_time'] - processing_state[file_id]['start_time']}")
-            
-            # Sauvegarder l'état de traitement
-            save_processing_state(file_id)
-            return True
         else:
-            error_msg = "Échec du déplacement final"
-            processing_state[file_id]['errors'].append(error_msg)
-            print(f"❌ {error_msg}")
+            print("📦 Membre d'archive terminé, copie de travail supprimée")
+        print(f"⏰ Durée totale: {timedelta(seconds=round(job['finished_at'] - job['started_at']))}")
+        progress = get_counters().snapshot()
+        print(f"📊 Progression: {progress['counts']['done']}/{progress['total']} ({progress['progress']:.1f}%), "
+              f"{progress['remaining']} restants, ETA {format_eta(progress)}")
+        return True
+    else:
+        ledger.add_error(job_id, "Échec du déplacement final", stage='completed')
+        print(f"❌ Échec du déplacement final")
+        return False
+
+def process_file_resilient(file_path):
+    """Traitement résilient d'un fichier, repris à la dernière étape terminée s'il est connu du registre"""
+    job_id, outcome = start_file_processing(file_path)
+    if outcome is not None:
+        return outcome
+    
+    try:
+        converted = run_conversion_step(job_id, file_path)
+        if converted is None:
             return False
-            
-    except subprocess.TimeoutExpired as e:
-        error_msg = f"Timeout pour {filename}: {e}"
-        processing_state[file_id]['errors'].append(error_msg)
-        print(f"⏱️ {error_msg}")
+        file_path, txt_path = converted
         
-        # Déplacer vers failed en cas de timeout
-        failed_path = os.path.join(FAILED_DIRECTORY, filename)
-        safe_file_move(file_path, failed_path)
-        return False
+        if not run_vectorization_step(job_id, file_path, txt_path):
+            return False
+        
+        run_llm_steps(job_id, os.path.basename(file_path))
         
+        return finalize_file(job_id, file_path)
+            
     except Exception as e:
-        error_msg = f"Erreur critique pour {filename}: {e}"
-        processing_state[file_id]['errors'].append(error_msg)
-        print(f"❌ {error_msg}")
-        logging.error(error_msg)
+        return handle_step_exception(job_id, file_path, e)
+
+def process_files_concurrently(file_paths, pool_sizes=None, queue_size=STAGE_QUEUE_SIZE, monitor_interval=30):
+    """Traiter plusieurs fichiers en pipeline : conversion, vectorisation et LLM se recouvrent.
+
+    Les étapes sont reliées par des files bornées (backpressure) : le fichier
+    N+1 est converti pendant que le fichier N est vectorisé. Les formats lus en
+    flux sont extraits dans le cache de conversion par les threads de
+    conversion (OCR et transcription ont leurs propres pools de processus) ;
+    les autres conversions tournent dans un pool de processus, la vectorisation
+    et les étapes LLM dans leurs propres threads. Les articles sont générés
+    uniquement à partir des topics du fichier traité pour que deux workers LLM
+    ne traitent pas les mêmes topics.
+    """
+    sizes = dict(STAGE_POOL_SIZES)
+    sizes.update({k: v for k, v in (pool_sizes or {}).items() if v})
+    print(f"⚙️ Pools: conversion={sizes['conversion']}, "
+          f"vectorisation={sizes['vectorization']}, llm={sizes['llm']} | files: {queue_size}")
+    
+    results = {}
+    
+    with ProcessPoolExecutor(max_workers=sizes['conversion']) as conversion_pool:
+        
+        def conversion_handler(job):
+            txt_path = converted_text_path(job['job_id'])
+            if txt_path:
+                job['file_path'] = move_to_processing(job['job_id'], job['file_path'])
+                job['txt_path'] = txt_path
+                return job
+            if streams_conversion(job['file_path']):
+                # OCR et transcription ont leurs propres pools : l'extraction tourne dans ce thread
+                job['file_path'], job['txt_path'] = run_streamed_conversion(job['job_id'], job['file_path'])
+                return job
+            get_ledger().start_stage(job['job_id'], 'conversion')
+            txt_path = conversion_pool.submit(convert_file_to_text, job['file_path']).result()
+            converted = complete_conversion_step(job['job_id'], job['file_path'], txt_path)
+            if converted is None:
+                results[job['original_path']] = False
+                return None
+            job['file_path'], job['txt_path'] = converted
+            return job
+        
+        def vectorization_handler(job):
+            if not run_vectorization_step(job['job_id'], job['file_path'], job['txt_path']):
+                results[job['original_path']] = False
+                return None
+            return job
+        
+        def llm_handler(job):
+            filename = os.path.basename(job['file_path'])
+            run_llm_steps(job['job_id'], filename, article_source=filename)
+            results[job['original_path']] = finalize_file(job['job_id'], job['file_path'])
+        
+        def on_error(stage_name, job, e):
+            results[job['original_path']] = handle_step_exception(job['job_id'], job['file_path'], e)
+        
+        pipeline = StagePipeline([
+            PipelineStage('conversion', conversion_handler, sizes['conversion'], queue_size),
+            PipelineStage('vectorisation', vectorization_handler, sizes['vectorization'], queue_size),
+            PipelineStage('llm', llm_handler, sizes['llm'], queue_size),
+        ], on_error=on_error)
+        pipeline.start()
+        if monitor_interval:
+            pipeline.start_monitor(monitor_interval)
         
-        # Déplacer vers failed
-        failed_path = os.path.join(FAILED_DIRECTORY, filename)
-        safe_file_move(file_path, failed_path)
-        return False
+        try:
+            for file_path in file_paths:
+                job_id, outcome = start_file_processing(file_path)
+                if outcome is not None:
+                    results[file_path] = outcome
+                    continue
+                # Bloque tant que la file de conversion est pleine
+                pipeline.submit({
+                    'job_id': job_id,
+                    'original_path': file_path,
+                    'file_path': file_path,
+                    'txt_path': None,
+                })
+            pipeline.join()
+        finally:
+            print(f"📊 Files d'attente → {pipeline.format_snapshot()}")
+            pipeline.close()
+    
+    return results
+
+def list_pending_files():
+    """Fichiers supportés déposés dans WATCH_DIRECTORY ou URGENT_DIRECTORY"""
+    pending = []
+    for directory in (URGENT_DIRECTORY, WATCH_DIRECTORY):
+        if not os.path.isdir(directory):
+            continue
+        # Images d'une série encore en cours de dépôt : regroupées plus tard par bundle_scan_batches
+        unsettled = unsettled_scan_images(directory, skip=INBOX_SUBDIRECTORIES)
+        for filename in os.listdir(directory):
+            if filename not in INBOX_SUBDIRECTORIES:
+                full_path = os.path.join(directory, filename)
+                # Vérifier si c'est un type supporté
+                if full_path in unsettled:
+                    continue
+                if os.path.isfile(full_path) and detect_file_type(full_path) != 'unknown':
+                    pending.append(full_path)
+    return pending
 
-def save_processing_state(file_id):
-    """Sauvegarder l'état de traitement dans un fichier JSON"""
+def _undo_scan_batch(name, batch_path, removed):
+    """Annuler un regroupement interrompu : retirer le CBZ et restaurer les images déjà supprimées"""
     try:
-        state_file = os.path.join(WATCH_DIRECTORY, f"processing_state_{file_id}.json")
-        with open(state_file, 'w') as f:
-            json.dump(processing_state[file_id], f, default=str, indent=2)
-        logging.info(f"État de traitement sauvegardé: {state_file}")
+        if batch_path and os.path.exists(batch_path):
+            os.remove(batch_path)
+        for image in removed:
+            backup_store.restore_backup(BACKUP_DIRECTORY, os.path.basename(image), image)
     except Exception as e:
-        logging.error(f"Erreur sauvegarde état: {e}")
+        logging.error(f"SCANS | {name} | annulation incomplète: {e}")
+
+def bundle_scan_batches():
+    """Regrouper chaque lot d'images (sous-dossier ou série numérotée) en un document CBZ ; retourne le nombre de lots"""
+    bundled = 0
+    for directory in (URGENT_DIRECTORY, WATCH_DIRECTORY):
+        if not os.path.isdir(directory):
+            continue
+        for name, images in find_scan_batches(directory, skip=INBOX_SUBDIRECTORIES):
+            # Le lot est traité d'un bloc : toutes les images sauvegardées, puis
+            # l'archive écrite, puis seulement les images retirées de la boîte
+            batch_path = None
+            removed = []
+            try:
+                for image in images:
+                    backup_store.backup_file(image, BACKUP_DIRECTORY)
+                batch_path = pack_scan_batch(name, images, directory)
+                for image in images:
+                    os.remove(image)
+                    removed.append(image)
+            except Exception as e:
+                logging.error(f"SCANS | {name} | regroupement impossible: {e}")
+                print(f"❌ Erreur regroupement des scans {name}: {e}")
+                _undo_scan_batch(name, batch_path, removed)
+                continue
+            folder = os.path.dirname(images[0])
+            if os.path.abspath(folder) != os.path.abspath(directory) and not os.listdir(folder):
+                os.rmdir(folder)
+            print(f"🖼️ Lot de scans: {len(images)} images regroupées dans {os.path.basename(batch_path)}")
+            bundled += 1
+    if bundled and _counters is not None:
+        _counters.rescan()
+    return bundled
+
+def list_interrupted_files():
+    """Fichiers de jobs restés 'processing' après un arrêt brutal (à reprendre)"""
+    interrupted = []
+    for job in get_ledger().jobs_with_status('processing'):
+        path = job['path']
+        inbox_dirs = (os.path.abspath(WATCH_DIRECTORY), os.path.abspath(URGENT_DIRECTORY))
+        if path and os.path.isfile(path) and os.path.dirname(os.path.abspath(path)) not in inbox_dirs:
+            interrupted.append(path)
+    return interrupted
 
 def count_files_by_status():
-    """Compter les fichiers par statut"""
-    counts = {
-        'pending': 0,
-        'processing': 0,
-        'done': 0,
-        'failed': 0
-    }
-    
-    # Fichiers en attente
-    for filename in os.listdir(WATCH_DIRECTORY):
-        if filename not in ['done', 'processing', 'failed', 'backup', 'converted']:
-            full_path = os.path.join(WATCH_DIRECTORY, filename)
-            if os.path.isfile(full_path):
-                # Vérifier si c'est un type supporté
-                file_type = detect_file_type(full_path)
-                if file_type != 'unknown':
-                    counts['pending'] += 1
-    
-    # Fichiers en cours de traitement
-    if os.path.exists(PROCESSING_DIRECTORY):
-        counts['processing'] = len([f for f in os.listdir(PROCESSING_DIRECTORY) 
-                                   if os.path.isfile(os.path.join(PROCESSING_DIRECTORY, f))])
-    
-    # Fichiers terminés
-    if os.path.exists(DONE_DIRECTORY):
-        counts['done'] = len([f for f in os.listdir(DONE_DIRECTORY) 
-                             if os.path.isfile(os.path.join(DONE_DIRECTORY, f))])
-    
-    # Fichiers échoués
-    if os.path.exists(FAILED_DIRECTORY):
-        counts['failed'] = len([f for f in os.listdir(FAILED_DIRECTORY) 
-                               if os.path.isfile(os.path.join(FAILED_DIRECTORY, f))])
-    
+    """Compter les fichiers par statut (registre des jobs + fichiers déposés)"""
+    counts = get_ledger().count_by_status()
+    # Les fichiers déposés mais pas encore pris en charge ne sont pas dans le registre
+    counts['pending'] += get_counters().snapshot()['counts']['pending']
     return counts
 
-def process_existing_files(only_one=False):
-    """Traiter les fichiers existants"""
+def process_existing_files(only_one=False, concurrent=False, pool_sizes=None, queue_size=STAGE_QUEUE_SIZE):
+    """Traiter les fichiers existants (séquentiellement ou avec un pool par étape)"""
     print("🔁 Vérification des fichiers existants...")
     
+    # Un lot d'images déposé ensemble devient un seul document
+    bundle_scan_batches()
+    
     counts = count_files_by_status()
     print(f"📊 État actuel:")
     print(f"  - En attente: {counts['pending']}")
@@ -473,38 +802,67 @@ def process_existing_files(only_one=False):
     print(f"  - Échoués: {counts['failed']}")
     
     processed = 0
+    deferred = 0
     
-    # Traiter les fichiers en attente
-    for filename in os.listdir(WATCH_DIRECTORY):
-        if filename not in ['done', 'processing', 'failed', 'backup', 'converted']:
-            full_path = os.path.join(WATCH_DIRECTORY, filename)
-            if os.path.isfile(full_path):
-                # Vérifier si c'est un type supporté
-                file_type = detect_file_type(full_path)
-                if file_type != 'unknown':
-                    print(f"\n🎯 Traitement du fichier: {filename} (Type: {file_type})")
-                    if process_file_resilient(full_path):
-                        processed += 1
-                    else:
-                        print(f"❌ Échec du traitement: {filename}")
-                    
-                    if only_one:
-                        break
+    # Copies de membres d'archive abandonnées par un arrêt avant leur prise en charge
+    clean_archive_spool()
+    
+    # Reprendre d'abord les jobs interrompus, puis les nouveaux fichiers
+    interrupted = list_interrupted_files()
+    if interrupted:
+        print(f"♻️ {len(interrupted)} job(s) interrompu(s) à reprendre")
+    # Les fichiers en attente passent dans l'ordre de l'ordonnanceur (urgents, puis selon SCHEDULING_POLICY)
+    files = interrupted + order_files(list_pending_files(), SCHEDULING_POLICY)
+    
+    if concurrent and not only_one:
+        # Les membres des archives sont copiés au rythme où le pipeline les accepte
+        results = process_files_concurrently(expand_archives(files), pool_sizes, queue_size)
+        for path, success in results.items():
+            if success == DEFERRED:
+                deferred += 1
+            elif success:
+                processed += 1
+            else:
+                print(f"❌ Échec du traitement: {os.path.basename(path)}")
+        print(f"\n📊 {processed} fichiers traités")
+        if deferred:
+            print(f"⏸️ {deferred} copie(s) reportée(s) : même contenu déjà en cours")
+        return processed
+    
+    # Traiter les fichiers en attente (une archive : ses membres un par un)
+    for full_path in expand_archives(files):
+        filename = os.path.basename(full_path)
+        print(f"\n🎯 Traitement du fichier: {filename} (Type: {detect_file_type(full_path)})")
+        outcome = process_file_resilient(full_path)
+        if outcome == DEFERRED:
+            deferred += 1
+        elif outcome:
+            processed += 1
+        else:
+            print(f"❌ Échec du traitement: {filename}")
+        
+        if only_one:
+            break
     
     print(f"\n📊 {processed} fichiers traités")
+    if deferred:
+        print(f"⏸️ {deferred} copie(s) reportée(s) : même contenu déjà en cours")
     return processed
 
-def main():
+def main(concurrent=False, pool_sizes=None, queue_size=STAGE_QUEUE_SIZE):
     """Fonction principale"""
     print("🛡️ Pipeline RAG Résilient - Watched Inbox")
     print("=" * 50)
     
     # Configuration
     setup_directories()
+    stage_workers.warm_up()
     
     # Traitement des fichiers existants
-    process_existing_files()
+    process_existing_files(concurrent=concurrent, pool_sizes=pool_sizes, queue_size=queue_size)
     
+    print(f"💾 Sauvegardes: {backup_store.format_stats(BACKUP_DIRECTORY)}")
+    logging.info(f"BACKUPS | {backup_store.format_stats()}")
     print("\n✅ Pipeline résilient terminé")
     print(f"📝 Logs détaillés: {LOG_FILE}")
 
@@ -512,9 +870,46 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--one', action='store_true', help='Traiter un seul fichier')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='Isoler chaque étape dans un sous-processus au lieu des workers chauds')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Traiter plusieurs fichiers en pipeline avec un pool par étape')
+    parser.add_argument('--conversion-workers', type=int, default=None,
+                        help=f"Taille du pool de conversion (défaut: {STAGE_POOL_SIZES['conversion']})")
+    parser.add_argument('--vectorization-workers', type=int, default=None,
+                        help=f"Taille du pool de vectorisation (défaut: {STAGE_POOL_SIZES['vectorization']})")
+    parser.add_argument('--llm-workers', type=int, default=None,
+                        help=f"Taille du pool topics/articles (défaut: {STAGE_POOL_SIZES['llm']})")
+    parser.add_argument('--queue-size', type=int, default=STAGE_QUEUE_SIZE,
+                        help="Capacité de la file d'entrée de chaque étape en mode concurrent")
+    parser.add_argument('--backup-mode', choices=backup_store.BACKUP_MODES, default=None,
+                        help=f"Sauvegarde avant déplacement : lien/reflink, magasin dédupliqué ou copie (défaut: {backup_store.backup_mode})")
+    parser.add_argument('--backup-compress', action='store_true',
+                        help='Compresser en zstd les objets du magasin de sauvegarde')
+    parser.add_argument('--schedule', choices=POLICIES, default=SCHEDULING_POLICY,
+                        help="Ordre de traitement : plus court d'abord (sjf) ou ordre d'arrivée (fifo)")
+    parser.add_argument('--text-cache', action='store_true',
+                        help='Garder une copie .txt du texte converti en flux dans converted/')
+    parser.add_argument('--transcription-backend', choices=transcription_engine.TRANSCRIPTION_BACKENDS, default=None,
+                        help=f"Backend Whisper : float32, int8 quantifié ou faster-whisper (défaut: {transcription_engine.TRANSCRIPTION_BACKEND})")
     args = parser.parse_args()
     
+    SCHEDULING_POLICY = args.schedule
+    TEXT_CACHE = TEXT_CACHE or args.text_cache
+    if args.subprocess:
+        stage_workers.set_execution_mode('subprocess')
+    if args.backup_mode or args.backup_compress:
+        backup_store.configure(args.backup_mode, True if args.backup_compress else None)
+    if args.transcription_backend:
+        transcription_engine.configure(backend=args.transcription_backend)
+    
+    pool_sizes = {
+        'conversion': args.conversion_workers,
+        'vectorization': args.vectorization_workers,
+        'llm': args.llm_workers,
+    }
+    
     if args.one:
         process_existing_files(only_one=True)
     else:
-        main() 
\ No newline at end of file
+        main(concurrent=args.concurrent, pool_sizes=pool_sizes, queue_size=args.queue_size) 
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Sauvegardes peu coûteuses avant déplacement des fichiers.
+
+Modes :
+- 'link'  : reflink (copie CoW, btrfs/xfs) puis lien physique si le système de
+            fichiers le permet, sinon repli sur le magasin adressé par contenu ;
+- 'store' : magasin adressé par contenu (objects/<hash>), un seul exemplaire
+            par contenu, compressé en zstd si demandé et disponible ;
+- 'copy'  : ancienne copie complète (shutil.copy2).
+
+Un fichier déjà sauvegardé n'est pas recopié lors des déplacements suivants
+(processing, done, failed). Les octets réellement copiés sont comptabilisés.
+"""
+
+import os
+import json
+import errno
+import shutil
+import logging
+import threading
+
+from job_ledger import compute_content_hash
+
+BACKUP_MODES = ('link', 'store', 'copy')
+
+# Mode par défaut, surchargeable via RAG_BACKUP_MODE ou configure()
+backup_mode = os.environ.get("RAG_BACKUP_MODE", "link")
+compress = os.environ.get("RAG_BACKUP_COMPRESS", "0") == "1"
+
+ZSTD_LEVEL = 3
+FICLONE = 0x40049409  # ioctl Linux de reflink
+
+_stats_lock = threading.Lock()
+stats = {'files': 0, 'skipped': 0, 'reflinked': 0, 'hardlinked': 0, 'stored': 0,
+         'deduplicated': 0, 'copied': 0, 'bytes_copied': 0, 'bytes_saved': 0}
+
+def configure(mode=None, use_compression=None):
+    """Choisir le mode de sauvegarde et la compression du magasin"""
+    global backup_mode, compress
+    if mode is not None:
+        if mode not in BACKUP_MODES:
+            raise ValueError(f"Mode de sauvegarde inconnu : {mode}")
+        backup_mode = mode
+    if use_compression is not None:
+        compress = use_compression
+    logging.info(f"Sauvegardes: mode {backup_mode}, compression {'zstd' if compress else 'aucune'}")
+
+def _count(kind, size, copied):
+    with _stats_lock:
+        stats['files'] += 1
+        stats[kind] += 1
+        if copied:
+            stats['bytes_copied'] += size
+        else:
+            stats['bytes_saved'] += size
+
+def _already_backed_up(src, backup_path):
+    """Vrai si backup_path est déjà une sauvegarde de src (même inode ou même contenu)"""
+    if not os.path.exists(backup_path):
+        return False
+    if os.path.samefile(src, backup_path):
+        return True
+    # Un autre fichier du même nom peut avoir même taille et même date : on compare le contenu
+    if os.path.getsize(src) != os.path.getsize(backup_path):
+        return False
+    return compute_content_hash(src) == compute_content_hash(backup_path)
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+def _write_object(src, object_path):
+    """Écrire un objet du magasin (en .zst si la compression est active) ; retourne son chemin"""
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    if compress:
+        try:
+            import zstandard
+            tmp_path = f"{object_path}.zst.tmp"
+            with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(fsrc, fdst)
+            os.replace(tmp_path, object_path + ".zst")
+            return object_path + ".zst"
+        except ImportError:
+            logging.warning("zstandard non installé, objet stocké sans compression")
+    tmp_path = f"{object_path}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, object_path)
+    return object_path
+
+def _backup_to_store(src, backup_dir):
+    """Sauvegarder dans le magasin adressé par contenu (dédupliqué)"""
+    size = os.path.getsize(src)
+    content_hash = compute_content_hash(src)
+    digest = content_hash.split(':', 1)[-1]
+    object_path = os.path.join(backup_dir, "objects", digest[:2], digest)
+    existing = next((p for p in (object_path, object_path + ".zst") if os.path.exists(p)), None)
+
+    if existing:
+        object_path = existing
+        _count('deduplicated', size, copied=False)
+    else:
+        object_path = _write_object(src, object_path)
+        _count('stored', size, copied=True)
+
+    # Référence nom → contenu, pour retrouver la sauvegarde d'un fichier
+    ref_path = os.path.join(backup_dir, os.path.basename(src) + ".ref")
+    with open(ref_path, 'w', encoding='utf-8') as f:
+        json.dump({'content_hash': content_hash, 'size': size,
+                   'object': os.path.relpath(object_path, backup_dir)}, f)
+    return object_path
+
+def backup_file(src, backup_dir, mode=None):
+    """Sauvegarder src dans backup_dir selon le mode ; retourne le chemin de la sauvegarde"""
+    mode = mode or backup_mode
+    size = os.path.getsize(src)
+
+    if mode == 'store':
+        return _backup_to_store(src, backup_dir)
+
+    backup_path = os.path.join(backup_dir, os.path.basename(src))
+    if _already_backed_up(src, backup_path):
+        _count('skipped', size, copied=False)
+        return backup_path
+
+    if mode == 'copy':
+        shutil.copy2(src, backup_path)
+        _count('copied', size, copied=True)
+        return backup_path
+
+    # Mode 'link' : reflink, puis lien physique, puis magasin dédupliqué
+    if os.path.exists(backup_path):
+        os.remove(backup_path)
+    try:
+        _reflink(src, backup_path)
+        _count('reflinked', size, copied=False)
+        return backup_path
+    except (OSError, ImportError):
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+    try:
+        os.link(src, backup_path)
+        _count('hardlinked', size, copied=False)
+        return backup_path
+    except OSError as e:
+        # Quel que soit le refus (autre volume, droits, quota de liens...), on passe au magasin
+        logging.info(f"BACKUP | {os.path.basename(src)} | lien physique impossible "
+                     f"({errno.errorcode.get(e.errno, e.errno)}), repli sur le magasin")
+    return _backup_to_store(src, backup_dir)
+
+def restore_backup(backup_dir, filename, dest):
+    """Restaurer la sauvegarde d'un fichier (lien, copie ou objet du magasin)"""
+    backup_path = os.path.join(backup_dir, filename)
+    if os.path.exists(backup_path):
+        shutil.copy2(backup_path, dest)
+        return dest
+    with open(backup_path + ".ref", 'r', encoding='utf-8') as f:
+        ref = json.load(f)
+    object_path = os.path.join(backup_dir, ref['object'])
+    if object_path.endswith(".zst"):
+        import zstandard
+        with open(object_path, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            zstandard.ZstdDecompressor().copy_stream(fsrc, fdst)
+    else:
+        shutil.copyfile(object_path, dest)
+    return dest
+
+def disk_usage(backup_dir):
+    """Espace disque réellement occupé par les sauvegardes (liens comptés une fois)"""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(backup_dir):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            # Un lien physique vers un fichier encore présent ailleurs ne coûte rien
+            if st.st_nlink > 1:
+                continue
+            total += st.st_blocks * 512
+    return total
+
+def format_stats(backup_dir=None):
+    """Résumé d'une ligne des sauvegardes de la session"""
+    with _stats_lock:
+        s = dict(stats)
+    line = (f"{s['files']} sauvegardes ({s['reflinked']} reflinks, {s['hardlinked']} liens, "
+            f"{s['stored']} objets, {s['deduplicated']} dédupliqués, {s['skipped']} déjà faites, "
+            f"{s['copied']} copies) | copiés: {s['bytes_copied'] / 1024 / 1024:.1f} Mo, "
+            f"évités: {s['bytes_saved'] / 1024 / 1024:.1f} Mo")
+    if backup_dir and os.path.isdir(backup_dir):
+        line += f" | disque: {disk_usage(backup_dir) / 1024 / 1024:.1f} Mo"
+    return line
@@ -0,0 +1,108 @@
+"""
+Comparaison du débit des backends d'embeddings sur CPU.
+
+Encode les mêmes chunks avec chaque backend de embedding_store ('torch' :
+sentence-transformers ; 'onnx' : ONNX Runtime float32 ; 'onnx-int8' : ONNX
+Runtime quantifié) et affiche le débit de chacun. Le chargement du modèle
+(et l'export ONNX au premier lancement) n'est pas compté.
+
+    python benchmark_embeddings.py livre.pdf --chunks 5000 --workers 4 --threads 8
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from embedding_store import EMBEDDING_BACKENDS, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS, load_local_embeddings
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+CHUNK_CHARS = 1000
+# Textes de repli quand aucun fichier n'est donné : longueurs variées, français et anglais
+SAMPLE_TEXTS = [
+    "La gestion du temps commence par la clarification des priorités.",
+    "Time blocking assigns every hour of the day to a specific task or category of work.",
+    "La matrice d'Eisenhower classe les tâches selon leur urgence et leur importance ; "
+    "les tâches importantes mais non urgentes sont celles qui font progresser les projets de fond.",
+    "Deep work requires long, uninterrupted stretches of focus. Notifications, open-plan offices and "
+    "constant email checking fragment attention and make cognitively demanding work much slower.",
+    "Chapitre 3",
+    "Une revue hebdomadaire permet de vider les boîtes de réception, de mettre à jour la liste des "
+    "projets en cours, de choisir les prochaines actions et de vérifier que le calendrier reflète "
+    "réellement les priorités. Sans elle, les listes de tâches deviennent obsolètes en quelques jours "
+    "et perdent la confiance de celui qui les tient.",
+]
+
+def load_texts(paths, count, chunk_chars=CHUNK_CHARS):
+    """Jusqu'à `count` chunks d'environ chunk_chars caractères tirés des fichiers (textes d'exemple sinon)"""
+    texts = []
+    if paths:
+        from document_stream import iter_document
+        for path in paths:
+            for segment in iter_document(path):
+                text = " ".join(segment.text.split())
+                texts.extend(text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars))
+                if len(texts) >= count:
+                    return texts[:count]
+    if not texts:
+        texts = list(SAMPLE_TEXTS)
+    # Répéter les textes disponibles jusqu'au nombre demandé
+    return (texts * (count // len(texts) + 1))[:count]
+
+def create_backend(backend, workers, threads, batch_size):
+    """Modèle du backend, dans ce processus ou réparti sur un pool de workers"""
+    if workers > 1:
+        from embedding_workers import ParallelEmbeddings
+        return ParallelEmbeddings(workers, threads, batch_size, backend)
+    return load_local_embeddings(batch_size, threads, backend)
+
+def run_backend(texts, backend, workers, threads, batch_size):
+    """Encoder les textes avec un backend ; retourne les secondes d'encodage"""
+    model = create_backend(backend, workers, threads, batch_size)
+    # Chargement des modèles (et export ONNX) hors mesure
+    model.embed_documents(texts[:max(1, workers) * batch_size])
+    started = time.perf_counter()
+    model.embed_documents(texts)
+    elapsed = time.perf_counter() - started
+    if hasattr(model, 'close'):
+        model.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends d'embeddings")
+    parser.add_argument('files', nargs='*', help="Documents d'où tirer les chunks (défaut : textes d'exemple)")
+    parser.add_argument('--chunks', type=int, default=2000, help="Nombre de chunks encodés (défaut: 2000)")
+    parser.add_argument('--workers', type=int, default=1, help="Processus d'encodage (défaut: 1)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Threads par processus (défaut: RAG_EMBEDDING_THREADS ou cœurs / workers)")
+    parser.add_argument('--batch-size', type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument('--backends', nargs='+', choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    args = parser.parse_args()
+
+    threads = args.threads or (EMBEDDING_THREADS if args.workers == 1 else max(1, (os.cpu_count() or 1) // args.workers))
+    texts = load_texts(args.files, args.chunks)
+    print(f"📊 {len(texts)} chunks ({sum(map(len, texts)) // len(texts)} caractères en moyenne), "
+          f"{args.workers} worker(s) × {threads} threads, lots de {args.batch_size}")
+
+    backends = list(args.backends)
+    if any(backend != 'torch' for backend in backends):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            # Échouerait dans chaque worker du pool
+            print("❌ onnxruntime non installé (pip install onnxruntime), backends ONNX ignorés")
+            backends = [backend for backend in backends if backend == 'torch']
+
+    results = {}
+    for backend in backends:
+        seconds = run_backend(texts, backend, args.workers, threads, args.batch_size)
+        results[backend] = seconds
+        print(f"⏱️ {backend:10s} {seconds:8.1f}s  {len(texts) / seconds:8.1f} chunks/s")
+
+    for backend in ('onnx', 'onnx-int8'):
+        if backend in results and 'torch' in results:
+            print(f"✅ Accélération {backend} : x{results['torch'] / results[backend]:.2f}")
+
+if __name__ == "__main__":
+    main()
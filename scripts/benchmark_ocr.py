@@ -0,0 +1,67 @@
+"""
+Comparaison des backends OCR sur un PDF scanné.
+
+Reconnaît les mêmes pages avec chaque backend de ocr_engine ('pytesseract' :
+pdf2image + un processus tesseract par page ; 'tesserocr' : moteur résident
+par worker et rendu PyMuPDF en mémoire) et affiche le débit de chacun.
+
+    python benchmark_ocr.py scan.pdf --pages 300 --workers 4
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from ocr_engine import OCR_BACKENDS, OCR_DPI, OCR_LANG, count_pdf_pages, iter_ocr_pages, shutdown_pools
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+def run_backend(pdf_path, page_numbers, backend, workers, dpi, lang):
+    """OCR des pages avec un backend ; retourne (secondes, caractères reconnus)"""
+    started = time.perf_counter()
+    chars = 0
+    for _, text in iter_ocr_pages(pdf_path, page_numbers=page_numbers, lang=lang, dpi=dpi,
+                                  workers=workers, backend=backend):
+        chars += len(text)
+    elapsed = time.perf_counter() - started
+    # Pool gardé ouvert par ocr_engine : libérer les workers avant le backend suivant
+    shutdown_pools()
+    return elapsed, chars
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends OCR")
+    parser.add_argument('pdf', help="PDF scanné à reconnaître")
+    parser.add_argument('--pages', type=int, default=300,
+                        help="Nombre de pages reconnues (défaut: 300)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Workers du pool OCR (défaut: RAG_OCR_WORKERS ou nombre de cœurs)")
+    parser.add_argument('--dpi', type=int, default=OCR_DPI)
+    parser.add_argument('--lang', default=OCR_LANG)
+    parser.add_argument('--backends', nargs='+', choices=OCR_BACKENDS, default=list(OCR_BACKENDS))
+    args = parser.parse_args()
+
+    total_pages = count_pdf_pages(args.pdf)
+    page_numbers = list(range(1, min(args.pages, total_pages) + 1))
+    print(f"📊 {os.path.basename(args.pdf)} : {len(page_numbers)} pages, {args.dpi} dpi")
+
+    backends = list(args.backends)
+    if 'tesserocr' in backends:
+        try:
+            import tesserocr  # noqa: F401
+        except ImportError:
+            # Sinon le repli sur pytesseract fausserait la comparaison
+            print("❌ tesserocr non installé (pip install tesserocr), backend ignoré")
+            backends.remove('tesserocr')
+
+    results = {}
+    for backend in backends:
+        seconds, chars = run_backend(args.pdf, page_numbers, backend, args.workers, args.dpi, args.lang)
+        results[backend] = seconds
+        print(f"⏱️ {backend:12s} {seconds:8.1f}s  {len(page_numbers) / seconds:6.2f} pages/s  {chars} caractères")
+
+    if 'tesserocr' in results and 'pytesseract' in results:
+        print(f"✅ Accélération tesserocr : x{results['pytesseract'] / results['tesserocr']:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Contrôle de parité des backends ONNX avec le modèle PyTorch.
+
+Les vecteurs déjà dans Chroma ont été calculés avec sentence-transformers
+(torch) : un backend ONNX n'est utilisable que s'il donne les mêmes vecteurs à
+l'arrondi près. Le script encode les mêmes chunks avec torch et avec chaque
+backend ONNX, compare les vecteurs texte par texte (similarité cosinus) et
+vérifie que le plus proche voisin de chaque chunk reste le même. Il échoue
+(code 1) si un backend descend sous son seuil.
+
+    python check_embedding_parity.py livre.pdf --chunks 500
+"""
+
+import sys
+import logging
+import argparse
+
+import numpy as np
+
+from embedding_store import load_local_embeddings
+from benchmark_embeddings import load_texts
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+# Similarité cosinus minimale avec torch, par backend
+MIN_COSINE = {'onnx': 0.999, 'onnx-int8': 0.98}
+# Part minimale des chunks dont le plus proche voisin ne change pas
+MIN_NEIGHBOR_AGREEMENT = {'onnx': 0.99, 'onnx-int8': 0.95}
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def nearest_neighbors(vectors):
+    """Indice du plus proche voisin de chaque vecteur (lui-même exclu)"""
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    return similarity.argmax(axis=1)
+
+def compare(reference, candidate):
+    """(cosinus min, cosinus moyen, part des plus proches voisins identiques)"""
+    cosines = (reference * candidate).sum(axis=1)
+    agreement = float(np.mean(nearest_neighbors(reference) == nearest_neighbors(candidate))) if len(reference) > 1 else 1.0
+    return float(cosines.min()), float(cosines.mean()), agreement
+
+def main():
+    parser = argparse.ArgumentParser(description="Parité des embeddings ONNX avec torch")
+    parser.add_argument('files', nargs='*', help="Documents d'où tirer les chunks (défaut : textes d'exemple)")
+    parser.add_argument('--chunks', type=int, default=300, help="Nombre de chunks comparés (défaut: 300)")
+    parser.add_argument('--backends', nargs='+', choices=sorted(MIN_COSINE), default=sorted(MIN_COSINE))
+    args = parser.parse_args()
+
+    # Doublons retirés : le plus proche voisin d'un texte répété serait ambigu
+    texts = list(dict.fromkeys(load_texts(args.files, args.chunks)))
+    print(f"📊 {len(texts)} chunks distincts comparés à torch")
+    reference = normalized(load_local_embeddings(backend='torch').embed_documents(texts))
+
+    failed = False
+    for backend in args.backends:
+        candidate = normalized(load_local_embeddings(backend=backend).embed_documents(texts))
+        min_cosine, mean_cosine, agreement = compare(reference, candidate)
+        ok = min_cosine >= MIN_COSINE[backend] and agreement >= MIN_NEIGHBOR_AGREEMENT[backend]
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {backend:10s} cosinus min {min_cosine:.5f} (seuil {MIN_COSINE[backend]})  "
+              f"moyen {mean_cosine:.5f}  voisins identiques {agreement:.1%}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Points de reprise à l'intérieur d'une étape (pages déjà vectorisées, topics
+déjà transformés en articles). Un petit fichier JSON par (étape, source),
+écrit de façon atomique : un timeout ou un crash ne perd que le lot en cours.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+from job_ledger import compute_content_hash
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'checkpoints')
+
+def _checkpoint_path(kind, key):
+    safe = re.sub(r'[^A-Za-z0-9._-]+', '_', key)[:80]
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(CHECKPOINT_DIR, kind, f"{safe}-{digest}.json")
+
+def file_checkpoint_key(path):
+    """Clé d'un fichier source : nom + hash du contenu du registre des jobs (un fichier modifié repart de zéro)"""
+    # Le nom seul (ou nom + taille) mélangerait les reprises de deux livres homonymes
+    return f"{os.path.basename(path)}-{compute_content_hash(path)}"
+
+def load_checkpoint(kind, key):
+    """Lire le point de reprise, ou None s'il n'existe pas"""
+    path = _checkpoint_path(kind, key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(kind, key, data):
+    """Écrire le point de reprise (remplacement atomique)"""
+    path = _checkpoint_path(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def clear_checkpoint(kind, key):
+    """Supprimer le point de reprise une fois l'étape terminée"""
+    try:
+        os.remove(_checkpoint_path(kind, key))
+    except FileNotFoundError:
+        pass
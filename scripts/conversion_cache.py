@@ -0,0 +1,178 @@
+"""
+Cache des conversions, adressé par le contenu du fichier source.
+
+Le texte extrait (pages d'un PDF avec OCR, chapitres d'eBook, segments de
+transcription...) est conservé avec ses métadonnées sous une clé formée du hash
+du contenu et de la signature de l'extracteur (nom, version, paramètres qui
+changent le résultat). Un fichier relancé depuis failed/, renommé ou déposé à
+nouveau n'est donc pas reconverti ; changer de version d'extracteur ou de
+réglage OCR invalide naturellement les entrées.
+
+Une entrée = un fichier JSON lines compressé (zstd si installé, sinon gzip),
+publié de façon atomique une fois la conversion terminée. Les entrées les moins
+récemment utilisées sont supprimées au-delà de MAX_CACHE_MB ; la taille du
+cache est tenue à jour à chaque entrée publiée, le dossier n'est parcouru qu'au
+premier ajout, tous les RESCAN_COMMITS ajouts (entrées écrites par d'autres
+processus) ou quand la limite est dépassée, le cache étant alors ramené à
+PRUNE_TARGET de la limite.
+"""
+
+import io
+import os
+import json
+import gzip
+import hashlib
+import logging
+import threading
+
+CACHE_DIR = os.environ.get("RAG_CONVERSION_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'conversion_cache'))
+ENABLED = os.environ.get("RAG_CONVERSION_CACHE", "1") == "1"
+MAX_CACHE_MB = int(os.environ.get("RAG_CONVERSION_CACHE_MB", "4096"))
+ZSTD_LEVEL = 3
+RESCAN_COMMITS = 100
+# Au-delà de la limite, le cache est ramené à cette fraction de MAX_CACHE_MB (pas un parcours par commit)
+PRUNE_TARGET = 0.9
+
+_prune_lock = threading.Lock()
+# Taille du cache connue du processus (None avant le premier parcours) et ajouts depuis
+_cache_bytes = None
+_commits_since_scan = 0
+
+def cache_key(content_hash, signature):
+    """Clé d'une conversion : signature de l'extracteur + hash du contenu source"""
+    return f"{signature}|{content_hash}"
+
+def _entry_base(key):
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, digest[:2], digest)
+
+def _existing_entry(key):
+    base = _entry_base(key)
+    return next((path for path in (base + ".jsonl.zst", base + ".jsonl.gz") if os.path.exists(path)), None)
+
+def _open_entry(path):
+    """Lire une entrée compressée en texte"""
+    if path.endswith(".zst"):
+        import zstandard
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return gzip.open(path, 'rt', encoding='utf-8')
+
+def contains(key):
+    """Vrai si une conversion est en cache pour cette clé (sans la lire)"""
+    return ENABLED and _existing_entry(key) is not None
+
+def load(key):
+    """Segments [(texte, métadonnées)] d'une conversion en cache, ou None"""
+    if not ENABLED:
+        return None
+    path = _existing_entry(key)
+    if path is None:
+        return None
+    try:
+        with _open_entry(path) as f:
+            header = json.loads(f.readline())
+            if header.get('key') != key:
+                return None
+            segments = [(entry['text'], entry['metadata']) for entry in map(json.loads, f)]
+    except (OSError, ValueError, KeyError, ImportError) as e:
+        logging.warning(f"CACHE | entrée illisible {path}: {e}")
+        return None
+    # Date d'accès pour l'éviction des entrées les plus anciennes
+    os.utime(path)
+    return segments
+
+class CacheWriter:
+    """Écriture d'une entrée au fil de la conversion, publiée par commit()"""
+
+    def __init__(self, key):
+        self.key = key
+        try:
+            import zstandard  # noqa: F401
+            extension = ".jsonl.zst"
+        except ImportError:
+            extension = ".jsonl.gz"
+        self.path = _entry_base(key) + extension
+        self.tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = self._open()
+        self.file.write(json.dumps({'key': key}) + "\n")
+        self.segments = 0
+
+    def _open(self):
+        if self.path.endswith(".zst"):
+            import zstandard
+            raw = open(self.tmp_path, 'wb')
+            stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=True)
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        return gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+
+    def add(self, text, metadata):
+        self.file.write(json.dumps({'text': text, 'metadata': metadata}, ensure_ascii=False) + "\n")
+        self.segments += 1
+
+    def commit(self):
+        """Publier l'entrée (remplacement atomique) puis limiter la taille du cache"""
+        self.file.close()
+        replaced = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        os.replace(self.tmp_path, self.path)
+        size = os.path.getsize(self.path)
+        logging.info(f"CACHE | {self.segments} segments enregistrés ({size / 1024:.0f} Ko)")
+        prune(added_bytes=size - replaced)
+
+    def abort(self):
+        """Abandonner une conversion incomplète"""
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def writer(key):
+    """CacheWriter pour une clé, ou None si le cache est désactivé"""
+    return CacheWriter(key) if ENABLED else None
+
+def _scan():
+    """Entrées publiées [(date d'accès, taille, chemin)] et taille totale du cache"""
+    entries = []
+    total = 0
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # Supprimée entre-temps par un autre processus
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    return entries, total
+
+def prune(max_mb=None, added_bytes=None):
+    """Supprimer les entrées les moins récemment utilisées au-delà de max_mb (added_bytes : taille ajoutée par un commit)"""
+    global _cache_bytes, _commits_since_scan
+    max_bytes = (max_mb or MAX_CACHE_MB) * 1024 * 1024
+    with _prune_lock:
+        if added_bytes is not None and _cache_bytes is not None and _commits_since_scan < RESCAN_COMMITS:
+            _cache_bytes += added_bytes
+            _commits_since_scan += 1
+            if _cache_bytes <= max_bytes:
+                return 0
+        entries, total = _scan()
+        _cache_bytes, _commits_since_scan = total, 0
+        if total <= max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes * PRUNE_TARGET:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        _cache_bytes = total
+        logging.info(f"CACHE | {removed} entrées supprimées (taille max {max_bytes // (1024 * 1024)} Mo)")
+        return removed
@@ -10,13 +10,17 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_API_KEY") or os.environ.get("SUPABASE_KEY") or os.environ.get("SUPABASE_SERVICE_ROLE")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 HUGGINGFACE_API_KEY = os.environ.get("HUGGINGFACE_API_KEY")
+# Délai maximal d'une requête REST à Supabase (s)
+SUPABASE_TIMEOUT = float(os.environ.get("RAG_SUPABASE_TIMEOUT", "30"))
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def fetch_unprocessed_topics():
-    response = supabase.table("topics") \
+def fetch_unprocessed_topics(source=None):
+    query = supabase.table("topics") \
         .select("*") \
-        .eq("processed", False) \
-        .execute()
+        .eq("processed", False)
+    if source:
+        query = query.eq("source", source)
+    response = query.execute()
     return response.data
 
 def mark_topic_as_processed(topic_name):
@@ -49,7 +53,8 @@ def insert_article_to_supabase(article_markdown: str, topic: str):
     response = requests.post(
         f"{SUPABASE_URL}/rest/v1/blog_posts",
         json=data,
-        headers=headers
+        headers=headers,
+        timeout=SUPABASE_TIMEOUT
     )
 
     if response.status_code == 201:
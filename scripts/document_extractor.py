@@ -0,0 +1,209 @@
+"""
+Extraction en processus du texte des documents bureautiques.
+
+DOCX (word/document.xml) et ODT (content.xml) sont lus directement dans leur
+archive zip, en flux, paragraphe par paragraphe ; RTF est décodé par un petit
+analyseur de groupes et de mots de contrôle ; HTML réutilise la conversion des
+chapitres EPUB. Pas de processus pandoc ni de fichier relu : le texte est
+retourné à l'appelant. pandoc reste le repli pour les autres formats ou si
+l'extraction directe échoue ou ne donne rien.
+"""
+
+import os
+import re
+import zipfile
+import logging
+import subprocess
+from xml.etree import ElementTree
+
+from ebook_extractor import HTML_EXTENSIONS, html_to_text, xml_local_name
+
+DOCX_EXTENSIONS = (".docx", ".docm", ".dotx")
+ODT_EXTENSIONS = (".odt", ".ott")
+RTF_EXTENSIONS = (".rtf",)
+PANDOC_TIMEOUT = 300
+# Changer la version invalide les textes déjà en cache (conversion_cache)
+EXTRACTOR_VERSION = 2
+
+def _iter_xml_paragraphs(stream, paragraph_tags, handlers, parents=None):
+    """Texte des paragraphes d'un XML en flux ; handlers : {balise: texte ajouté},
+    parents : {balise: parent requis} pour les balises qui n'ont de sens que dans un parent donné"""
+    parents = parents or {}
+    parts = []
+    depth = 0
+    open_tags = []
+    for event, el in ElementTree.iterparse(stream, events=('start', 'end')):
+        name = xml_local_name(el.tag)
+        if event == 'start':
+            open_tags.append(name)
+            if name in paragraph_tags:
+                depth += 1
+            continue
+        open_tags.pop()
+        if name in handlers:
+            if name in parents and (not open_tags or open_tags[-1] != parents[name]):
+                continue
+            parts.append(handlers[name](el) if callable(handlers[name]) else handlers[name])
+        elif name in paragraph_tags:
+            depth -= 1
+            if depth == 0:
+                text = "".join(parts).strip()
+                parts = []
+                el.clear()
+                if text:
+                    yield text
+
+def iter_docx_paragraphs(docx_path):
+    """Paragraphes d'un DOCX (corps, tableaux compris) dans l'ordre du document"""
+    handlers = {
+        't': lambda el: el.text or "",
+        'tab': "\t",
+        'br': "\n",
+        'cr': "\n",
+        'noBreakHyphen': "-",
+    }
+    # w:tab est aussi la définition d'un taquet (w:pPr/w:tabs) : seul celui d'un run est un caractère
+    parents = {'tab': 'r'}
+    with zipfile.ZipFile(docx_path) as archive, archive.open("word/document.xml") as f:
+        yield from _iter_xml_paragraphs(f, {'p'}, handlers, parents)
+
+def iter_odt_paragraphs(odt_path):
+    """Paragraphes et titres d'un ODT dans l'ordre du document"""
+    with zipfile.ZipFile(odt_path) as archive, archive.open("content.xml") as f:
+        for _, el in ElementTree.iterparse(f, events=('end',)):
+            name = xml_local_name(el.tag)
+            if name not in ('p', 'h'):
+                continue
+            parts = []
+            for node in el.iter():
+                node_name = xml_local_name(node.tag)
+                if node is el:
+                    parts.append(node.text or "")
+                    continue
+                if node_name == 's':
+                    parts.append(" " * int(next((v for k, v in node.attrib.items() if k.endswith('}c')), 1)))
+                elif node_name == 'tab':
+                    parts.append("\t")
+                elif node_name == 'line-break':
+                    parts.append("\n")
+                else:
+                    parts.append(node.text or "")
+                parts.append(node.tail or "")
+            text = "".join(parts).strip()
+            el.clear()
+            if text:
+                yield text
+
+# Destinations RTF sans texte du document (tables, métadonnées, images...)
+RTF_SKIP_DESTINATIONS = {
+    'fonttbl', 'colortbl', 'stylesheet', 'info', 'pict', 'object', 'header', 'footer',
+    'headerl', 'headerr', 'headerf', 'footerl', 'footerr', 'footerf', 'listtable',
+    'listoverridetable', 'rsidtbl', 'generator', 'themedata', 'colorschememapping',
+    'latentstyles', 'datastore', 'xmlnstbl', 'fldinst', 'bkmkstart', 'bkmkend',
+}
+RTF_CHARACTERS = {'par': "\n", 'line': "\n", 'tab': "\t", 'emdash': "\u2014", 'endash': "\u2013",
+                  'lquote': "\u2018", 'rquote': "\u2019", 'ldblquote': "\u201c", 'rdblquote': "\u201d",
+                  'bullet': "\u2022", 'emspace': " ", 'enspace': " ", 'row': "\n", 'cell': "\t",
+                  'sect': "\n", 'page': "\n"}
+RTF_TOKEN = re.compile(r"\\([a-zA-Z]+)(-?\d+)? ?|\\'([0-9a-fA-F]{2})|\\(.)|([{}])|([^\\{}\r\n]+)|[\r\n]+", re.S)
+
+def rtf_to_text(rtf):
+    """Texte d'un document RTF (groupes ignorés pour les destinations sans contenu)"""
+    encoding = 'cp1252'
+    stack = []
+    skip = False
+    unicode_skip = 1
+    pending_skip = 0
+    out = []
+    for match in RTF_TOKEN.finditer(rtf):
+        word, arg, hex_char, symbol, brace, text = match.groups()
+        if brace == '{':
+            stack.append((skip, unicode_skip))
+            continue
+        if brace == '}':
+            skip, unicode_skip = stack.pop() if stack else (False, 1)
+            continue
+        if pending_skip and (hex_char or text):
+            # Caractères de repli qui suivent un \uN
+            if text:
+                consumed = min(pending_skip, len(text))
+                pending_skip -= consumed
+                text = text[consumed:]
+                if not text:
+                    continue
+            else:
+                pending_skip -= 1
+                continue
+        if symbol is not None:
+            if symbol == '*':
+                skip = True
+            elif symbol in '\\{}' and not skip:
+                out.append(symbol)
+            elif symbol == '~' and not skip:
+                out.append("\u00a0")
+            elif symbol in '\n\r' and not skip:
+                out.append("\n")
+            continue
+        if word is not None:
+            if word in RTF_SKIP_DESTINATIONS:
+                skip = True
+            elif word == 'ansicpg' and arg:
+                encoding = f"cp{arg}"
+            elif word == 'uc' and arg:
+                unicode_skip = int(arg)
+            elif word == 'u' and arg:
+                if not skip:
+                    out.append(chr(int(arg) % 65536))
+                pending_skip = unicode_skip
+            elif word in RTF_CHARACTERS and not skip:
+                out.append(RTF_CHARACTERS[word])
+            continue
+        if skip:
+            continue
+        if hex_char:
+            try:
+                out.append(bytes([int(hex_char, 16)]).decode(encoding))
+            except (LookupError, UnicodeDecodeError):
+                out.append(bytes([int(hex_char, 16)]).decode('cp1252', errors='replace'))
+        elif text:
+            out.append(text)
+    lines = [" ".join(line.split()) for line in "".join(out).split("\n")]
+    return "\n\n".join(line for line in lines if line)
+
+def _pandoc_to_text(doc_path):
+    """Repli : conversion pandoc, texte lu sur la sortie standard"""
+    result = subprocess.run(['pandoc', doc_path, '-t', 'plain'],
+                            capture_output=True, text=True, timeout=PANDOC_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"pandoc: {result.stderr.strip()[-500:]}")
+    return result.stdout
+
+def extract_document_text(doc_path):
+    """Texte d'un document : extraction directe selon le format, pandoc en repli"""
+    name = doc_path.lower()
+    try:
+        if name.endswith(DOCX_EXTENSIONS):
+            text = "\n\n".join(iter_docx_paragraphs(doc_path))
+        elif name.endswith(ODT_EXTENSIONS):
+            text = "\n\n".join(iter_odt_paragraphs(doc_path))
+        elif name.endswith(RTF_EXTENSIONS):
+            with open(doc_path, 'r', encoding='latin-1') as f:
+                text = rtf_to_text(f.read())
+        elif name.endswith(HTML_EXTENSIONS):
+            with open(doc_path, 'rb') as f:
+                _, text = html_to_text(f.read())
+        else:
+            text = None
+        if text:
+            return text
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, ValueError) as e:
+        logging.warning(f"DOCUMENT | {os.path.basename(doc_path)} | extraction directe impossible ({e}), repli pandoc")
+    logging.info(f"DOCUMENT | {os.path.basename(doc_path)} | conversion pandoc")
+    return _pandoc_to_text(doc_path)
+
+def extract_document_to_file(doc_path, output_path):
+    """Écrire le texte d'un document dans output_path ; retourne le nombre de caractères"""
+    text = extract_document_text(doc_path)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return len(text)
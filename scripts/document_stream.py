@@ -0,0 +1,239 @@
+"""
+Flux de documents en mémoire, des convertisseurs jusqu'au découpage en chunks.
+
+Chaque fichier source (PDF, images, eBook, document bureautique, audio, texte)
+est lu comme une suite de segments (texte, métadonnées) : pages d'un PDF ou
+d'un lot de scans, chapitres d'un eBook, segments d'une transcription, pages
+d'environ CHARS_PER_PAGE caractères d'un document. La vectorisation consomme ce flux directement, sans
+écrire de .txt ni le relire dans un autre processus.
+
+L'écriture du texte sur disque n'est plus qu'un cache optionnel (cache_dir) :
+le .txt (pages séparées par PAGE_BREAK) n'est publié qu'une fois le flux lu en
+entier, et relu à la place de la conversion tant qu'il est plus récent que la
+source.
+
+Les segments convertis sont aussi gardés dans le cache de conversion
+(conversion_cache), adressé par le hash du contenu et la signature de
+l'extracteur : un même contenu, sous n'importe quel nom, n'est converti qu'une
+fois par version d'extracteur.
+"""
+
+import os
+import logging
+import itertools
+from collections import namedtuple
+
+import conversion_cache
+import ebook_extractor
+import document_extractor
+from job_ledger import compute_content_hash
+from ocr_engine import IMAGE_EXTENSIONS, SCAN_BATCH_EXTENSIONS
+from ebook_extractor import EPUB_EXTENSIONS, FB2_EXTENSIONS, CALIBRE_EXTENSIONS, iter_ebook_chapters
+from document_extractor import DOCX_EXTENSIONS, ODT_EXTENSIONS, RTF_EXTENSIONS, HTML_EXTENSIONS, extract_document_text
+
+PAGE_BREAK = "\f"
+CHARS_PER_PAGE = 3000
+
+Segment = namedtuple('Segment', ['text', 'metadata'])
+
+SOURCE_EXTENSIONS = {
+    'pdf': (".pdf",),
+    'image': IMAGE_EXTENSIONS + SCAN_BATCH_EXTENSIONS,
+    'text': (".txt", ".md"),
+    'ebook': EPUB_EXTENSIONS + FB2_EXTENSIONS + CALIBRE_EXTENSIONS,
+    'document': DOCX_EXTENSIONS + ODT_EXTENSIONS + RTF_EXTENSIONS + HTML_EXTENSIONS,
+    'audio': (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".aac"),
+}
+
+def source_kind(path):
+    """Type de source lisible en flux ('pdf', 'image', 'text', 'ebook', 'document', 'audio'), ou None"""
+    name = path.lower()
+    for kind, extensions in SOURCE_EXTENSIONS.items():
+        if name.endswith(extensions):
+            return kind
+    return None
+
+def supports(path):
+    """Vrai si le fichier peut être lu en flux"""
+    return source_kind(path) is not None
+
+def paginate(text, chars_per_page=CHARS_PER_PAGE):
+    """Découper un texte en pages : sur les sauts de page s'il y en a, sinon par paragraphes"""
+    if PAGE_BREAK in text:
+        return text.split(PAGE_BREAK)
+    pages = []
+    current = []
+    size = 0
+    for paragraph in text.split("\n\n"):
+        if current and size + len(paragraph) > chars_per_page:
+            pages.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        pages.append("\n\n".join(current))
+    return pages
+
+def _iter_source(path, start, stop=None):
+    """Segments bruts (texte, métadonnées) d'une source, du segment `start` au segment `stop` exclu"""
+    kind = source_kind(path)
+    if kind == 'pdf':
+        from ocr_engine import iter_pdf_pages
+        # Seules les pages de la plage sont classées et reconnues
+        for number, text, extraction in iter_pdf_pages(path, start=start, stop=stop):
+            yield text, {'page': number, 'extraction': extraction}
+    elif kind == 'image':
+        from ocr_engine import iter_image_pages
+        for number, text in iter_image_pages(path, start=start):
+            yield text, {'page': number, 'extraction': 'ocr'}
+    elif kind == 'ebook':
+        chapters = itertools.islice(iter_ebook_chapters(path), start, None)
+        for number, (title, text) in enumerate(chapters, start=start + 1):
+            metadata = {'page': number}
+            if title:
+                metadata['chapter'] = title
+            yield text, metadata
+    elif kind == 'audio':
+        from transcription_engine import get_service
+        for number, (seconds, text) in enumerate(get_service().iter_transcribe(path, start=start), start=start + 1):
+            yield text, {'page': number, 'start_seconds': round(seconds, 1)}
+    elif kind in ('document', 'text'):
+        if kind == 'document':
+            text = extract_document_text(path)
+        else:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        for number, page in enumerate(paginate(text)[start:], start=start + 1):
+            yield page, {'page': number}
+    else:
+        raise ValueError(f"Format non supporté en flux : {os.path.basename(path)}")
+
+def extractor_signature(path):
+    """Extracteur, version et réglages qui déterminent le texte d'une source, ou None si non mise en cache"""
+    kind = source_kind(path)
+    if kind in ('pdf', 'image'):
+        import ocr_engine
+        return (f"{kind}-v{ocr_engine.EXTRACTOR_VERSION}:{ocr_engine.OCR_BACKEND}:{ocr_engine.OCR_LANG}:"
+                f"{ocr_engine.OCR_DPI}-{ocr_engine.OCR_HIGH_DPI}:{ocr_engine.OCR_MIN_CONFIDENCE}")
+    if kind == 'ebook':
+        return f"ebook-v{ebook_extractor.EXTRACTOR_VERSION}"
+    if kind == 'document':
+        # HTML passe par la conversion des chapitres EPUB
+        return f"document-v{document_extractor.EXTRACTOR_VERSION}-html-v{ebook_extractor.EXTRACTOR_VERSION}"
+    if kind == 'audio':
+        import transcription_engine
+        service = transcription_engine.get_service()
+        return f"audio-v{transcription_engine.EXTRACTOR_VERSION}:{service.backend}:{service.model_name}"
+    # Texte brut : relu plus vite qu'une entrée ne serait décompressée
+    return None
+
+def conversion_key(path):
+    """Clé de la source dans le cache de conversion, ou None si elle n'y va pas"""
+    if not conversion_cache.ENABLED:
+        return None
+    signature = extractor_signature(path)
+    return conversion_cache.cache_key(compute_content_hash(path), signature) if signature else None
+
+def write_cached_text(path, output_path):
+    """Écrire le texte en cache d'une source (pages séparées par PAGE_BREAK) ; retourne le nombre de pages, 0 si absent"""
+    key = conversion_key(path)
+    segments = conversion_cache.load(key) if key else None
+    if not segments:
+        return 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(PAGE_BREAK.join(text for text, _ in segments))
+    return len(segments)
+
+def cache_text_file(path, txt_path):
+    """Mettre en cache de conversion le .txt produit pour une source (une entrée par page)"""
+    key = conversion_key(path)
+    cache = conversion_cache.writer(key) if key else None
+    if cache is None:
+        return
+    try:
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            for number, text in enumerate(paginate(f.read()), start=1):
+                cache.add(text, {'page': number})
+    except BaseException:
+        cache.abort()
+        raise
+    cache.commit()
+
+def convert_to_cache(path):
+    """Extraire une source dans le cache de conversion sans la vectoriser ; faux si elle n'y va pas.
+
+    L'extraction coûteuse (OCR, transcription, calibre) se fait ainsi dans
+    l'étape de conversion, la vectorisation relit ensuite les segments en cache.
+    """
+    key = conversion_key(path)
+    if key is None:
+        return False
+    if not conversion_cache.contains(key):
+        for _ in iter_document(path):
+            pass
+    return True
+
+def cache_path_for(path, cache_dir):
+    """Chemin du .txt mis en cache pour une source (extension gardée : livre.pdf → livre.pdf.txt)"""
+    return os.path.join(cache_dir, os.path.basename(path) + ".txt")
+
+def _fresh_cache(path, cache_path):
+    return (os.path.exists(cache_path) and os.path.abspath(cache_path) != os.path.abspath(path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(path))
+
+def iter_document(path, start=0, cache_dir=None, stop=None):
+    """Générer les segments d'un fichier dans l'ordre, du segment `start` au segment `stop` exclu.
+
+    Avec cache_dir, le texte est relu depuis le cache s'il est à jour, sinon
+    écrit dans le cache au fil du flux (publié seulement à la fin du fichier).
+    Une conversion complète est aussi enregistrée dans le cache de conversion,
+    relu ensuite à la place de l'extracteur.
+    """
+    source = os.path.basename(path)
+    cache_path = cache_path_for(path, cache_dir) if cache_dir and source_kind(path) != 'text' else None
+
+    if cache_path and _fresh_cache(path, cache_path):
+        logging.info(f"STREAM | {source} | texte relu depuis le cache {cache_path}")
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            pages = f.read().split(PAGE_BREAK)
+        for number, text in enumerate(pages[start:stop], start=start + 1):
+            yield Segment(text, {'source': source, 'page': number})
+        return
+
+    key = conversion_key(path)
+    cached = conversion_cache.load(key) if key else None
+    if cached is not None:
+        logging.info(f"STREAM | {source} | {len(cached)} segments repris du cache de conversion")
+        segments = iter(cached[start:stop])
+    else:
+        segments = itertools.islice(_iter_source(path, start, stop), None if stop is None else max(0, stop - start))
+
+    # Un flux repris en cours de route ou limité à une plage ne donne pas le texte complet : pas de cache
+    complete = start == 0 and stop is None
+    tmp_path = f"{cache_path}.tmp" if cache_path and complete else None
+    cache = open(tmp_path, 'w', encoding='utf-8') if tmp_path else None
+    entry = conversion_cache.writer(key) if key and cached is None and complete else None
+    try:
+        for index, (text, metadata) in enumerate(segments):
+            # Le saut de page est réservé à la séparation des pages du cache
+            text = text.replace(PAGE_BREAK, "\n")
+            if cache:
+                if index:
+                    cache.write(PAGE_BREAK)
+                cache.write(text)
+            if entry:
+                entry.add(text, metadata)
+            metadata['source'] = source
+            yield Segment(text, metadata)
+    except BaseException:
+        if cache:
+            cache.close()
+            os.remove(tmp_path)
+        if entry:
+            entry.abort()
+        raise
+    if cache:
+        cache.close()
+        os.replace(tmp_path, cache_path)
+    if entry:
+        entry.commit()
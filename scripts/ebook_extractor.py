@@ -0,0 +1,251 @@
+"""
+Extraction directe du texte des eBooks, chapitre par chapitre.
+
+EPUB : lecture du conteneur zip (META-INF/container.xml → OPF → spine) et
+conversion en texte de chaque document XHTML dans l'ordre de lecture. FB2 (et
+.fb2.zip) : lecture en flux du XML, section par section, sans charger les
+images binaires. HTML/XHTML : même conversion que les chapitres EPUB.
+
+Les autres formats (MOBI, AZW3, LIT, PDB...) passent par calibre, uniquement
+pour obtenir un EPUB lu ensuite directement, ou en dernier recours un TXT.
+Les chapitres sont écrits séparés par PAGE_BREAK : la vectorisation et ses
+points de reprise les traitent comme des pages.
+"""
+
+import os
+import re
+import zipfile
+import logging
+import tempfile
+import posixpath
+import subprocess
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+PAGE_BREAK = "\f"
+# Fait partie de la clé du cache de conversion (conversion_cache)
+EXTRACTOR_VERSION = 1
+
+EPUB_EXTENSIONS = (".epub",)
+FB2_EXTENSIONS = (".fb2", ".fb2.zip")
+HTML_EXTENSIONS = (".html", ".htm", ".xhtml")
+# Formats lus via calibre (conversion en EPUB, sinon en TXT)
+CALIBRE_EXTENSIONS = (".mobi", ".azw", ".azw3", ".kf8", ".prc", ".lit", ".pdb")
+CALIBRE_TIMEOUT = 300
+
+CONTAINER_PATH = "META-INF/container.xml"
+XHTML_MEDIA_TYPES = ("application/xhtml+xml", "text/html")
+
+BLOCK_TAGS = {'p', 'div', 'section', 'article', 'blockquote', 'pre', 'li', 'dd', 'dt',
+              'tr', 'table', 'ul', 'ol', 'hr', 'figure', 'figcaption',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+HEADING_TAGS = {'h1', 'h2', 'h3'}
+SKIP_TAGS = {'head', 'script', 'style', 'svg', 'math'}
+
+def xml_local_name(tag):
+    """Nom d'une balise XML sans son espace de noms"""
+    return tag.rsplit('}', 1)[-1]
+
+def _decode(data):
+    """Décoder un document (X)HTML selon sa déclaration d'encodage, UTF-8 par défaut"""
+    match = re.search(rb'encoding=["\']([\w.-]+)["\']|charset=["\']?([\w.-]+)', data[:1024])
+    encoding = (match.group(1) or match.group(2)).decode('ascii') if match else 'utf-8'
+    try:
+        return data.decode(encoding, errors='replace')
+    except LookupError:
+        return data.decode('utf-8', errors='replace')
+
+class _TextExtractor(HTMLParser):
+    """Texte d'un document HTML : un paragraphe par bloc, premier titre retenu"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs = []
+        self.current = []
+        self.skip_depth = 0
+        self.heading = None
+        self.in_heading = False
+
+    def _flush(self):
+        text = " ".join("".join(self.current).split())
+        if text:
+            self.paragraphs.append(text)
+            if self.in_heading and self.heading is None:
+                self.heading = text
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == 'br':
+            self.current.append(" ")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            self.in_heading = tag in HEADING_TAGS
+            if tag == 'li':
+                self.current.append("- ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            self.in_heading = False
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.current.append(data)
+
+def html_to_text(data):
+    """Convertir un document (X)HTML (octets ou texte) en (titre, texte)"""
+    parser = _TextExtractor()
+    parser.feed(_decode(data) if isinstance(data, bytes) else data)
+    parser.close()
+    parser._flush()
+    return parser.heading, "\n\n".join(parser.paragraphs)
+
+def _epub_spine(archive):
+    """Chemins des documents XHTML de l'EPUB dans l'ordre de lecture (spine)"""
+    container = ElementTree.fromstring(archive.read(CONTAINER_PATH))
+    rootfile = next((el for el in container.iter() if xml_local_name(el.tag) == 'rootfile'), None)
+    if rootfile is None:
+        raise ValueError("container.xml sans rootfile")
+    opf_path = rootfile.get('full-path')
+    opf = ElementTree.fromstring(archive.read(opf_path))
+    opf_dir = posixpath.dirname(opf_path)
+
+    manifest = {}
+    for item in opf.iter():
+        if xml_local_name(item.tag) == 'item':
+            manifest[item.get('id')] = (item.get('href'), item.get('media-type'))
+    paths = []
+    for itemref in opf.iter():
+        if xml_local_name(itemref.tag) != 'itemref' or itemref.get('linear') == 'no':
+            continue
+        href, media_type = manifest.get(itemref.get('idref'), (None, None))
+        if href and media_type in XHTML_MEDIA_TYPES:
+            paths.append(posixpath.normpath(posixpath.join(opf_dir, unquote(href.split('#', 1)[0]))))
+    return paths
+
+def iter_epub_chapters(epub_path):
+    """Générer (titre, texte) pour chaque document de la spine d'un EPUB"""
+    with zipfile.ZipFile(epub_path) as archive:
+        if "META-INF/encryption.xml" in archive.namelist():
+            logging.warning(f"EBOOK | {os.path.basename(epub_path)} | EPUB avec encryption.xml (DRM ou polices chiffrées)")
+        for path in _epub_spine(archive):
+            try:
+                data = archive.read(path)
+            except KeyError:
+                logging.warning(f"EBOOK | {os.path.basename(epub_path)} | document absent de l'archive: {path}")
+                continue
+            title, text = html_to_text(data)
+            if text:
+                yield title, text
+
+def _fb2_section_text(section):
+    """Titre et paragraphes d'une section FB2 (sous-sections comprises)"""
+    title = None
+    paragraphs = []
+    for el in section.iter():
+        name = xml_local_name(el.tag)
+        if name == 'title' and title is None:
+            title = " ".join(" ".join(el.itertext()).split()) or None
+        elif name in ('p', 'v', 'subtitle', 'text-author'):
+            text = " ".join("".join(el.itertext()).split())
+            if text:
+                paragraphs.append(text)
+    return title, "\n\n".join(paragraphs)
+
+def _open_fb2(fb2_path):
+    if fb2_path.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(fb2_path)
+        member = next((name for name in archive.namelist() if name.lower().endswith(".fb2")), None)
+        if member is None:
+            raise ValueError("archive sans fichier .fb2")
+        return archive.open(member)
+    return open(fb2_path, 'rb')
+
+def iter_fb2_chapters(fb2_path):
+    """Générer (titre, texte) pour chaque section de premier niveau d'un FB2, en flux"""
+    depth = 0
+    body_depth = None
+    with _open_fb2(fb2_path) as f:
+        for event, el in ElementTree.iterparse(f, events=('start', 'end')):
+            name = xml_local_name(el.tag)
+            if event == 'start':
+                depth += 1
+                if name == 'body' and body_depth is None:
+                    body_depth = depth
+                continue
+            depth -= 1
+            if name == 'binary':
+                # Images en base64 : ignorées et libérées aussitôt
+                el.clear()
+            elif name == 'section' and body_depth is not None and depth == body_depth:
+                title, text = _fb2_section_text(el)
+                el.clear()
+                if text:
+                    yield title, text
+            elif name == 'body':
+                body_depth = None
+
+def _calibre_convert(ebook_path, work_dir, ext):
+    """Convertir avec calibre (ebook-convert) vers `ext` ; retourne le chemin produit"""
+    output_path = os.path.join(work_dir, os.path.splitext(os.path.basename(ebook_path))[0] + ext)
+    result = subprocess.run(['ebook-convert', ebook_path, output_path],
+                            capture_output=True, text=True, timeout=CALIBRE_TIMEOUT)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        raise RuntimeError(f"ebook-convert {ext}: {result.stderr.strip()[-500:]}")
+    return output_path
+
+def _iter_text_file(txt_path):
+    with open(txt_path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read().strip()
+    if text:
+        yield None, text
+
+def iter_ebook_chapters(ebook_path, work_dir=None):
+    """Générer (titre, texte) par chapitre : lecture directe, sinon calibre vers EPUB puis TXT"""
+    name = ebook_path.lower()
+    if name.endswith(EPUB_EXTENSIONS):
+        yield from iter_epub_chapters(ebook_path)
+        return
+    if name.endswith(FB2_EXTENSIONS):
+        yield from iter_fb2_chapters(ebook_path)
+        return
+    if name.endswith(HTML_EXTENSIONS):
+        with open(ebook_path, 'rb') as f:
+            title, text = html_to_text(f.read())
+        if text:
+            yield title, text
+        return
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        yielded = False
+        try:
+            epub_path = _calibre_convert(ebook_path, tmp_dir, ".epub")
+            logging.info(f"EBOOK | {os.path.basename(ebook_path)} | converti en EPUB par calibre")
+            for chapter in iter_epub_chapters(epub_path):
+                yielded = True
+                yield chapter
+        except (RuntimeError, ValueError, zipfile.BadZipFile, ElementTree.ParseError, KeyError) as e:
+            if yielded:
+                raise
+            logging.warning(f"EBOOK | {os.path.basename(ebook_path)} | EPUB impossible ({e}), conversion TXT")
+            yield from _iter_text_file(_calibre_convert(ebook_path, tmp_dir, ".txt"))
+
+def extract_ebook_to_file(ebook_path, output_path, work_dir=None):
+    """Écrire le texte d'un eBook chapitre par chapitre (séparés par PAGE_BREAK) ; retourne (caractères, chapitres)"""
+    chars = 0
+    chapters = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for _, text in iter_ebook_chapters(ebook_path, work_dir):
+            text = text.replace(PAGE_BREAK, "\n")
+            if chapters:
+                f.write(PAGE_BREAK)
+            f.write(text)
+            chars += len(text)
+            chapters += 1
+    logging.info(f"EBOOK | {os.path.basename(ebook_path)} | {chapters} chapitres | {chars} caractères")
+    return chars, chapters
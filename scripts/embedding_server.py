@@ -0,0 +1,313 @@
+"""
+Serveur d'embeddings local, partagé par tous les processus du pipeline.
+
+Le modèle all-MiniLM-L6-v2 est chargé une seule fois dans le serveur au lieu
+d'un HuggingFaceEmbeddings par processus (workers de shards, étapes en
+sous-processus, scripts d'articles...). Les requêtes arrivent sur un socket
+unix ; un thread unique les regroupe dynamiquement : il prend la première
+requête en attente puis ajoute les suivantes jusqu'à MAX_BATCH_TEXTS textes ou
+MAX_WAIT_MS millisecondes. Les requêtes en cours sont servies à tour de rôle :
+chaque lot prend la part suivante de chacune, et une grosse requête
+(vectorisation d'un shard) repasse en fin de file après chaque part, pour
+qu'une petite requête (recherche d'un topic) n'attende jamais plus d'un lot.
+
+Protocole : message = longueur sur 4 octets (big-endian) + JSON. La réponse à
+{"texts": [...]} est un en-tête JSON {"count", "dim"} suivi des vecteurs en
+float32 little-endian ; {"op": "ping"} retourne le modèle et la dimension.
+
+RemoteEmbeddings est le client : il s'utilise comme HuggingFaceEmbeddings
+(embed_documents, embed_query) et c'est lui que retourne
+embedding_store.get_embeddings() quand le serveur tourne.
+
+Lancement : python embedding_server.py [--socket CHEMIN]
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+import socketserver
+from collections import deque
+
+import numpy as np
+
+from embedding_store import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_SOCKET, local_embeddings
+
+# Textes encodés ensemble au plus, et attente maximale pour compléter un lot
+MAX_BATCH_TEXTS = int(os.environ.get("RAG_EMBEDDING_MAX_BATCH", "256"))
+MAX_WAIT_MS = float(os.environ.get("RAG_EMBEDDING_MAX_WAIT_MS", "10"))
+CONNECT_TIMEOUT = 2.0
+HEADER = struct.Struct(">I")
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(min(size - len(data), 1024 * 1024))
+        if not part:
+            raise ConnectionError("connexion fermée par le serveur d'embeddings")
+        data.extend(part)
+    return bytes(data)
+
+def send_message(sock, payload, body=b""):
+    """Envoyer un en-tête JSON (préfixé par sa longueur) suivi d'un corps binaire optionnel"""
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data + body)
+
+def recv_message(sock):
+    """Lire un en-tête JSON préfixé par sa longueur"""
+    size, = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+class _Request:
+    """Requête d'un client : ses textes, découpés en parts encodées au fil des lots"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.vectors = [None] * len(texts)
+        # Premier texte pas encore placé dans un lot
+        self.next = 0
+        self.remaining = len(texts)
+        self.error = None
+        self.done = threading.Event()
+
+    def fail(self, error):
+        self.error = error
+        self.done.set()
+
+class EmbeddingBatcher:
+    """Regroupe les textes de toutes les requêtes en lots encodés par un seul thread"""
+
+    def __init__(self, embeddings, max_batch=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        # Requêtes dont il reste des textes à placer, servies à tour de rôle
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, texts):
+        """Encoder des textes (bloque jusqu'au dernier lot qui les contient)"""
+        if not texts:
+            return []
+        request = _Request(texts)
+        with self._condition:
+            self._pending.append(request)
+            self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def _waiting_texts(self):
+        return sum(len(request.texts) - request.next for request in self._pending)
+
+    def _collect(self):
+        """Parts (requête, début, fin) du prochain lot : une par requête en attente, à tour de rôle,
+        après au plus max_wait pour compléter le lot"""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = time.monotonic() + self.max_wait
+            while self._waiting_texts() < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            batch = []
+            size = 0
+            for _ in range(len(self._pending)):
+                if size >= self.max_batch:
+                    break
+                request = self._pending.popleft()
+                start = request.next
+                request.next = min(start + self.max_batch - size, len(request.texts))
+                batch.append((request, start, request.next))
+                size += request.next - start
+                # Textes restants : la requête repasse derrière les autres
+                if request.next < len(request.texts):
+                    self._pending.append(request)
+            return batch
+
+    def _encode(self, batch):
+        texts = [text for request, start, stop in batch for text in request.texts[start:stop]]
+        vectors = self.embeddings.embed_documents(texts)
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"{len(vectors)} vecteurs pour {len(texts)} textes")
+        self.batches += 1
+        self.texts += len(texts)
+        offset = 0
+        for request, start, stop in batch:
+            request.vectors[start:stop] = vectors[offset:offset + stop - start]
+            offset += stop - start
+            request.remaining -= stop - start
+            if request.remaining == 0:
+                request.done.set()
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._collect()
+            except Exception as e:
+                logging.error(f"EMBED | constitution d'un lot impossible: {e}")
+                continue
+            try:
+                self._encode(batch)
+            except Exception as e:
+                # Le thread doit survivre : les clients du lot reçoivent l'erreur au lieu d'attendre indéfiniment
+                logging.error(f"EMBED | lot de {sum(stop - start for _, start, stop in batch)} textes en échec: {e}")
+                failed = {id(request): request for request, _, _ in batch}
+                with self._condition:
+                    # Parts restantes des requêtes en échec : inutile de les encoder
+                    self._pending = deque(request for request in self._pending if id(request) not in failed)
+                for request in failed.values():
+                    request.fail(e)
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            if message.get('op') == 'ping':
+                send_message(self.request, {'model': EMBEDDING_MODEL_NAME, 'backend': EMBEDDING_BACKEND,
+                                            'dim': self.server.dim, 'batches': batcher.batches, 'texts': batcher.texts})
+                continue
+            try:
+                vectors = np.asarray(batcher.embed(message['texts']), dtype='<f4').reshape(len(message['texts']), -1)
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+                continue
+            send_message(self.request, {'count': vectors.shape[0], 'dim': vectors.shape[1]}, vectors.tobytes())
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serveur unix : un thread par connexion, un seul modèle et un seul batcher"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, embeddings, max_batch=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS):
+        # Socket laissé par un serveur arrêté brutalement
+        if os.path.exists(socket_path) and not server_available(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.batcher = EmbeddingBatcher(embeddings, max_batch, max_wait_ms)
+        self.dim = len(embeddings.embed_query("warm-up"))
+
+def server_available(socket_path=EMBEDDING_SOCKET):
+    """Vrai si un serveur d'embeddings répond sur le socket"""
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(socket_path)
+            send_message(sock, {'op': 'ping'})
+            return 'dim' in recv_message(sock)
+    except (OSError, ValueError):
+        return False
+
+class RemoteEmbeddings:
+    """Client du serveur d'embeddings, utilisable à la place de HuggingFaceEmbeddings.
+
+    Une connexion par thread, gardée ouverte. Si le serveur ne répond plus et
+    qu'un repli est fourni (fonction qui charge un modèle local), le client
+    bascule sur ce modèle pour la suite du processus.
+    """
+
+    def __init__(self, socket_path=EMBEDDING_SOCKET, fallback=None):
+        self.socket_path = socket_path
+        self.fallback = fallback
+        self.local = None
+        self._connections = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        sock = getattr(self._connections, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            self._connections.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._connections, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._connections.sock = None
+
+    def _request(self, texts):
+        sock = self._connection()
+        send_message(sock, {'texts': texts})
+        header = recv_message(sock)
+        if 'error' in header:
+            raise RuntimeError(f"serveur d'embeddings: {header['error']}")
+        body = _recv_exact(sock, header['count'] * header['dim'] * 4)
+        return np.frombuffer(body, dtype='<f4').reshape(header['count'], header['dim']).tolist()
+
+    def _local_model(self):
+        with self._lock:
+            if self.local is None:
+                logging.warning(f"EMBED | serveur {self.socket_path} injoignable, modèle chargé localement")
+                self.local = self.fallback()
+            return self.local
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.local is not None:
+            return self.local.embed_documents(texts)
+        # Une reconnexion (serveur redémarré), puis le repli local
+        for attempt in range(2):
+            try:
+                return self._request(texts)
+            except (OSError, ValueError, struct.error) as e:
+                self._close()
+                if attempt == 0:
+                    continue
+                if self.fallback is None:
+                    raise ConnectionError(f"serveur d'embeddings injoignable ({self.socket_path}): {e}") from e
+        return self._local_model().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def serve(socket_path=EMBEDDING_SOCKET, max_batch=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS):
+    """Charger le modèle et servir jusqu'à l'interruption"""
+    if server_available(socket_path):
+        raise RuntimeError(f"Un serveur d'embeddings tourne déjà sur {socket_path}")
+    embeddings = local_embeddings()
+    server = EmbeddingServer(socket_path, embeddings, max_batch, max_wait_ms)
+    print(f"🧠 Serveur d'embeddings {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND}, dim {server.dim}) sur {socket_path}")
+    print(f"📦 Lots de {max_batch} textes au plus, attente max {max_wait_ms:g} ms")
+    logging.info(f"EMBED | serveur démarré sur {socket_path} | lots {max_batch} | attente {max_wait_ms} ms")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print(f"📊 {server.batcher.texts} textes encodés en {server.batcher.batches} lots")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serveur d'embeddings partagé par les processus du pipeline")
+    parser.add_argument('--socket', default=EMBEDDING_SOCKET, help=f"Socket unix (défaut: {EMBEDDING_SOCKET})")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH_TEXTS, help="Textes encodés ensemble au plus")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help="Attente maximale pour compléter un lot (ms)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    serve(args.socket, args.max_batch, args.max_wait_ms)
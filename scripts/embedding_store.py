@@ -0,0 +1,103 @@
+"""
+Modèle d'embeddings et handles ChromaDB partagés, chargés une seule fois par processus
+
+Quand le serveur d'embeddings (embedding_server.py) tourne, get_embeddings()
+retourne son client au lieu de charger le modèle dans le processus
+(RAG_EMBEDDING_SERVICE : 'auto' par défaut, 'local' ou 'server'). Sinon, avec
+RAG_EMBEDDING_WORKERS > 1, les embeddings sont calculés par un pool de
+processus (embedding_workers). Le modèle local tourne avec PyTorch ou ONNX
+Runtime, en float32 ou int8 (RAG_EMBEDDING_BACKEND, voir onnx_embeddings).
+"""
+
+import os
+import logging
+import threading
+
+CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_SERVICE_MODES = ('auto', 'local', 'server')
+EMBEDDING_SERVICE = os.environ.get("RAG_EMBEDDING_SERVICE", "auto")
+EMBEDDING_SOCKET = os.environ.get("RAG_EMBEDDING_SOCKET", "/tmp/rag_embeddings.sock")
+# Calcul local : nombre de processus, threads torch par processus et taille des lots encodés
+EMBEDDING_WORKERS = int(os.environ.get("RAG_EMBEDDING_WORKERS", "1"))
+EMBEDDING_THREADS = int(os.environ.get("RAG_EMBEDDING_THREADS", max(1, (os.cpu_count() or 1) // EMBEDDING_WORKERS)))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_BATCH_SIZE", "32"))
+# Exécution du modèle : PyTorch (sentence-transformers) ou ONNX Runtime, float32 ou int8
+EMBEDDING_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+EMBEDDING_BACKEND = os.environ.get("RAG_EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.environ.get("RAG_EMBEDDING_ONNX_DIR",
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models',
+                                                 f"{EMBEDDING_MODEL_NAME}-onnx"))
+
+_lock = threading.RLock()
+_embeddings = None
+_vectorstores = {}
+
+def load_local_embeddings(batch_size=None, threads=None, backend=None):
+    """Charger le modèle d'embeddings dans le processus courant, avec le backend demandé"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend d'embeddings inconnu : {backend}")
+    if backend != 'torch':
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(quantize=(backend == 'onnx-int8'), threads=threads, batch_size=batch_size)
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME,
+                                 encode_kwargs={'batch_size': batch_size or EMBEDDING_BATCH_SIZE})
+
+def local_embeddings():
+    """Embeddings calculés sur cette machine : pool de processus si EMBEDDING_WORKERS > 1, sinon modèle du processus"""
+    if EMBEDDING_WORKERS > 1:
+        from embedding_workers import ParallelEmbeddings
+        return ParallelEmbeddings()
+    return load_local_embeddings()
+
+def _create_embeddings():
+    if EMBEDDING_SERVICE not in EMBEDDING_SERVICE_MODES:
+        raise ValueError(f"Mode du service d'embeddings inconnu : {EMBEDDING_SERVICE}")
+    if EMBEDDING_SERVICE != 'local':
+        from embedding_server import RemoteEmbeddings, server_available
+        if server_available(EMBEDDING_SOCKET):
+            logging.info(f"EMBED | client du serveur {EMBEDDING_SOCKET}")
+            return RemoteEmbeddings(EMBEDDING_SOCKET,
+                                    fallback=None if EMBEDDING_SERVICE == 'server' else local_embeddings)
+        if EMBEDDING_SERVICE == 'server':
+            raise ConnectionError(f"Serveur d'embeddings injoignable : {EMBEDDING_SOCKET}")
+    return local_embeddings()
+
+def get_embeddings():
+    """Retourner le modèle d'embeddings du processus (client du serveur s'il tourne, sinon chargé au premier appel)"""
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            _embeddings = _create_embeddings()
+        return _embeddings
+
+def get_vectorstore(persist_directory=CHROMA_DIR):
+    """Retourner le handle Chroma du répertoire donné (ouvert au premier appel)"""
+    with _lock:
+        if persist_directory not in _vectorstores:
+            from langchain_community.vectorstores import Chroma
+            _vectorstores[persist_directory] = Chroma(
+                persist_directory=persist_directory,
+                embedding_function=get_embeddings()
+            )
+        return _vectorstores[persist_directory]
+
+def source_in_store(source, persist_directory=CHROMA_DIR):
+    """Vrai si des chunks de cette source sont déjà dans Chroma (filtre sur les métadonnées, sans tout relire)"""
+    result = get_vectorstore(persist_directory)._collection.get(where={"source": source}, limit=1, include=[])
+    return bool(result['ids'])
+
+def add_embedded_chunks(vectorstore, ids, texts, metadatas, embeddings):
+    """Insérer des chunks dont les embeddings sont déjà calculés (upsert : un id déjà présent est remplacé)"""
+    vectorstore._collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+
+def delete_page_chunks(vectorstore, content_hash, pages):
+    """Supprimer les chunks déjà insérés pour ces pages d'un contenu (une page vectorisée à nouveau peut en donner moins)"""
+    if pages:
+        vectorstore._collection.delete(where={"$and": [{"content_hash": content_hash}, {"page": {"$in": list(pages)}}]})
+
+def warm_up():
+    """Précharger le modèle et la base Chroma avant le premier fichier"""
+    get_vectorstore()
@@ -0,0 +1,138 @@
+"""
+Calcul des embeddings sur plusieurs processus CPU.
+
+Un seul modèle PyTorch n'occupe pas bien 32 cœurs : au-delà de quelques
+threads, les petites matrices de all-MiniLM-L6-v2 passent leur temps en
+synchronisation. Les embeddings sont donc calculés par EMBEDDING_WORKERS
+processus (spawn) de EMBEDDING_THREADS threads chacun, chaque worker épinglé
+sur son propre groupe de cœurs (sched_setaffinity) pour que les pools torch ne
+se disputent pas les mêmes cœurs.
+
+Les textes sont triés par longueur avant d'être découpés en lots de
+EMBEDDING_BATCH_SIZE : un lot contient des chunks de taille voisine, donc peu
+de padding, et les lots les plus longs partent en premier pour équilibrer les
+workers. Les vecteurs sont rendus dans l'ordre d'origine.
+
+ParallelEmbeddings s'utilise comme HuggingFaceEmbeddings ; c'est lui que
+retourne embedding_store.get_embeddings() quand RAG_EMBEDDING_WORKERS > 1.
+"""
+
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from embedding_store import (EMBEDDING_WORKERS, EMBEDDING_THREADS, EMBEDDING_BATCH_SIZE, EMBEDDING_BACKEND,
+                             load_local_embeddings)
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+def pin_threads(threads, index=None):
+    """Limiter torch/BLAS à `threads` threads ; avec index, épingler le processus sur le groupe de cœurs `index`.
+
+    À appeler avant l'import de torch (initializer d'un worker spawn).
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    cores = None
+    if index is not None and hasattr(os, 'sched_setaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+        if len(available) >= 2 * threads:
+            start = (index * threads) % len(available)
+            cores = available[start:start + threads] or available[:threads]
+            os.sched_setaffinity(0, cores)
+    try:
+        import torch
+    except ImportError:
+        # Backend ONNX sans torch : onnxruntime reçoit son nombre de threads à la création de la session
+        return cores
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Déjà fixé : du parallélisme a déjà été lancé dans ce processus
+        pass
+    return cores
+
+# Modèle du processus worker, chargé une fois par l'initializer du pool
+_model = None
+
+def _init_worker(counter, threads, batch_size, backend):
+    global _model
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    cores = pin_threads(threads, index)
+    _model = load_local_embeddings(batch_size, threads, backend)
+    logging.info(f"EMBED | worker {index} | {backend} | {threads} threads | cœurs {cores if cores else 'non épinglés'}")
+
+def _encode(texts):
+    # float32 : deux fois moins de données à renvoyer au processus parent
+    return np.asarray(_model.embed_documents(texts), dtype=np.float32)
+
+def length_sorted_batches(texts, batch_size):
+    """Lots d'indices de textes de longueur voisine, les plus longs d'abord"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+class ParallelEmbeddings:
+    """Embeddings calculés par un pool de processus gardé ouvert, utilisable à la place de HuggingFaceEmbeddings"""
+
+    def __init__(self, workers=None, threads=None, batch_size=None, backend=None):
+        self.workers = workers or EMBEDDING_WORKERS
+        self.threads = threads or EMBEDDING_THREADS
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        self.backend = backend or EMBEDDING_BACKEND
+        self.pool = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawn : le processus parent peut déjà avoir initialisé torch
+                context = multiprocessing.get_context("spawn")
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                    initargs=(context.Value('i', 0), self.threads, self.batch_size, self.backend)
+                )
+                logging.info(f"EMBED | pool de {self.workers} workers {self.backend} × {self.threads} threads "
+                             f"| lots de {self.batch_size}")
+            return self.pool
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        pool = self._get_pool()
+        batches = length_sorted_batches(texts, self.batch_size)
+        futures = [pool.submit(_encode, [texts[i] for i in batch]) for batch in batches]
+        vectors = [None] * len(texts)
+        try:
+            for batch, future in zip(batches, futures):
+                for index, vector in zip(batch, future.result()):
+                    vectors[index] = vector.tolist()
+        except BrokenProcessPool:
+            # Worker tué (mémoire...) : nouveau pool au prochain appel
+            with self.lock:
+                self.pool = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        """Arrêter les workers (les modèles sont libérés)"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+                self.pool = None
@@ -0,0 +1,172 @@
+"""
+Ordonnancement des fichiers en attente selon leur coût estimé.
+
+Le coût (en secondes, ordre de grandeur) dépend du type : pages d'un PDF texte,
+pages d'un PDF scanné (OCR bien plus cher), durée d'un fichier audio, taille
+d'un eBook ou d'un document. La politique 'sjf' (plus court d'abord) réduit le
+délai médian avant article ; 'fifo' garde l'ordre d'arrivée. Deux voies : les
+fichiers déposés dans le sous-dossier urgent/ passent par la voie 'interactive',
+toujours servie avant la voie 'bulk' du stock. Un fichier qui attend depuis plus
+de STARVATION_SECONDS passe devant les plus petits de sa voie ; l'attente est
+comptée depuis son dépôt (date de modification ou d'arrivée dans le dossier,
+la plus récente des deux), pas depuis la création de l'ordonnanceur.
+"""
+
+import os
+import time
+import heapq
+import logging
+import subprocess
+
+LANES = ('interactive', 'bulk')
+POLICIES = ('sjf', 'fifo')
+URGENT_DIRNAME = "urgent"
+
+# Modèle de coût (secondes)
+TEXT_PAGE_COST = 0.5        # extraction + embeddings d'une page texte
+OCR_PAGE_COST = 6.0         # rendu + tesseract d'une page scannée
+AUDIO_SECOND_COST = 0.5     # transcription Whisper (CPU) par seconde d'audio
+IMAGE_COST = OCR_PAGE_COST
+LLM_FIXED_COST = 60.0       # topics + articles, indépendant de la taille
+CHARS_PER_PAGE = 3000
+EBOOK_BYTES_PER_PAGE = 2000  # eBooks/documents compressés
+AUDIO_BYTES_PER_SECOND = 16000  # ~128 kbit/s si la durée est inconnue
+SCAN_SAMPLE_PAGES = 3
+MIN_CHARS_PER_TEXT_PAGE = 50
+
+STARVATION_SECONDS = 6 * 3600
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".aac")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".cbz")
+TEXT_EXTENSIONS = (".txt", ".md")
+
+def _pdf_profile(path):
+    """(nombre de pages, scanné ?) d'après un échantillon des premières pages"""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    pages = len(reader.pages)
+    sample = reader.pages[:SCAN_SAMPLE_PAGES]
+    chars = sum(len((page.extract_text() or "").strip()) for page in sample)
+    scanned = bool(sample) and chars < MIN_CHARS_PER_TEXT_PAGE * len(sample)
+    return pages, scanned
+
+def _audio_duration(path):
+    """Durée en secondes via ffprobe (installé avec ffmpeg pour Whisper), sinon d'après la taille"""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', path],
+            capture_output=True, text=True, timeout=10
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return os.path.getsize(path) / AUDIO_BYTES_PER_SECOND
+
+def estimate_cost(path):
+    """Coût estimé du traitement d'un fichier, en secondes"""
+    ext = os.path.splitext(path)[1].lower()
+    size = os.path.getsize(path)
+    try:
+        if ext == ".pdf":
+            pages, scanned = _pdf_profile(path)
+            return LLM_FIXED_COST + pages * (OCR_PAGE_COST if scanned else TEXT_PAGE_COST)
+        if ext in AUDIO_EXTENSIONS:
+            return LLM_FIXED_COST + _audio_duration(path) * AUDIO_SECOND_COST
+        if ext in IMAGE_EXTENSIONS:
+            # Une page par image (TIFF multipage, lot de scans)
+            from ocr_engine import list_image_pages
+            return LLM_FIXED_COST + IMAGE_COST * len(list_image_pages(path))
+        if ext in TEXT_EXTENSIONS:
+            return LLM_FIXED_COST + size / CHARS_PER_PAGE * TEXT_PAGE_COST
+    except Exception as e:
+        logging.warning(f"Estimation du coût impossible pour {path}: {e}")
+    return LLM_FIXED_COST + size / EBOOK_BYTES_PER_PAGE * TEXT_PAGE_COST
+
+def arrival_time(path):
+    """Date de dépôt d'un fichier : la plus récente entre modification et arrivée (ctime)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return time.time()
+    return max(stat.st_mtime, stat.st_ctime)
+
+def lane_for_path(path):
+    """Voie d'un fichier : 'interactive' s'il a été déposé dans urgent/"""
+    parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return 'interactive' if parent == URGENT_DIRNAME else 'bulk'
+
+class FileScheduler:
+    """File de priorité par voie ; plus court d'abord ('sjf') ou ordre d'arrivée ('fifo')"""
+
+    def __init__(self, policy='sjf', starvation_seconds=STARVATION_SECONDS):
+        if policy not in POLICIES:
+            raise ValueError(f"Politique d'ordonnancement inconnue : {policy}")
+        self.policy = policy
+        self.starvation_seconds = starvation_seconds
+        self.heaps = {lane: [] for lane in LANES}
+        self.arrivals = {lane: [] for lane in LANES}
+        self.taken = set()
+        self.costs = {}
+        self.seq = 0
+
+    def __len__(self):
+        return self.seq - len(self.taken)
+
+    def add(self, path, lane=None, cost=None, arrived_at=None):
+        """Ajouter un fichier (coût et date de dépôt lus sur le disque si non fournis)"""
+        lane = lane or lane_for_path(path)
+        if cost is None:
+            cost = estimate_cost(path) if self.policy == 'sjf' else 0.0
+        self.seq += 1
+        self.costs[path] = cost
+        key = cost if self.policy == 'sjf' else self.seq
+        heapq.heappush(self.heaps[lane], (key, self.seq, path))
+        if arrived_at is None:
+            arrived_at = arrival_time(path)
+        heapq.heappush(self.arrivals[lane], (arrived_at, self.seq, path))
+
+    def _oldest_starving(self, lane):
+        arrivals = self.arrivals[lane]
+        while arrivals and arrivals[0][1] in self.taken:
+            heapq.heappop(arrivals)
+        if arrivals and time.time() - arrivals[0][0] >= self.starvation_seconds:
+            _, seq, path = heapq.heappop(arrivals)
+            return seq, path
+        return None
+
+    def pop(self):
+        """Prochain fichier à traiter, ou None si vide"""
+        for lane in LANES:
+            starving = self._oldest_starving(lane)
+            if starving:
+                self.taken.add(starving[0])
+                return starving[1]
+            heap = self.heaps[lane]
+            while heap:
+                _, seq, path = heapq.heappop(heap)
+                if seq not in self.taken:
+                    self.taken.add(seq)
+                    return path
+        return None
+
+    def drain(self):
+        """Vider la file dans l'ordre de traitement"""
+        while True:
+            path = self.pop()
+            if path is None:
+                return
+            yield path
+
+def order_files(paths, policy='sjf'):
+    """Ordonner une liste de fichiers (voie interactive d'abord, puis selon la politique)"""
+    scheduler = FileScheduler(policy)
+    for path in paths:
+        scheduler.add(path)
+    ordered = list(scheduler.drain())
+    if ordered:
+        urgent = sum(1 for path in ordered if lane_for_path(path) == 'interactive')
+        total_cost = sum(scheduler.costs.values())
+        print(f"🗓️ Ordonnancement {policy}: {len(ordered)} fichier(s), dont {urgent} urgent(s), "
+              f"coût estimé {total_cost / 60:.0f} min")
+        logging.info(f"SCHEDULE | {policy} | {len(ordered)} fichiers | {urgent} urgents | coût estimé {total_cost:.0f}s")
+    return ordered
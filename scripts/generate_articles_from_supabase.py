@@ -14,6 +14,8 @@ from rag_scripts.database import (
     mark_topic_as_processed
 )
 from local_llm import generate_article
+from checkpoints import load_checkpoint, save_checkpoint
+from stage_workers import check_cancelled
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -26,9 +28,14 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-if __name__ == "__main__":
-    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+def generate_articles(limit=5, source=None):
+    """Générer jusqu'à `limit` articles à partir des topics non traités de Supabase
 
+    Si `source` est fourni, seuls les topics issus de ce document sont traités.
+    Chaque article généré est gardé dans un point de reprise jusqu'à ce que son
+    topic soit marqué comme traité : après un timeout, la tentative suivante
+    réutilise les articles déjà écrits au lieu de rappeler le LLM.
+    """
     print("\n" + "="*80)
     print("🚀 GÉNÉRATION D'ARTICLES DEPUIS SUPABASE")
     print("="*80)
@@ -38,7 +45,7 @@ if __name__ == "__main__":
     print("="*80)
 
     print("\n🔍 RÉCUPÉRATION DES TOPICS DEPUIS SUPABASE...")
-    topics = fetch_unprocessed_topics()
+    topics = fetch_unprocessed_topics(source)
     total_topics = len(topics)
     
     print(f"📚 TOTAL TOPICS RÉCUPÉRÉS: {total_topics}")
@@ -46,7 +53,7 @@ if __name__ == "__main__":
     if total_topics == 0:
         print("⚠️ AUCUN TOPIC NON TRAITÉ DISPONIBLE")
         print("🛑 ARRÊT DU SCRIPT")
-        sys.exit(0)
+        return 0
 
     print(f"🔀 MÉLANGE ALÉATOIRE DES TOPICS")
     random.shuffle(topics)
@@ -57,10 +64,18 @@ if __name__ == "__main__":
     if len(topics) > 5:
         print(f"  ... et {len(topics) - 5} autres topics")
 
+    # Articles générés dont le topic n'a pas encore été marqué comme traité
+    checkpoint_key = source or "all"
+    pending_articles = load_checkpoint('articles', checkpoint_key) or {}
+    if pending_articles:
+        print(f"♻️ {len(pending_articles)} article(s) repris du point de reprise")
+
     generated_count = 0
     start_time = datetime.now()
 
     for idx, topic in enumerate(topics, start=1):
+        # Timeout de l'étape (exécution en processus) : hors du try, qui poursuit au topic suivant
+        check_cancelled()
         topic_name = topic['name']
         topic_id = topic.get('id', 'N/A')
         user_id = topic.get('user_id', 'N/A')
@@ -74,10 +89,18 @@ if __name__ == "__main__":
         print("-"*80)
 
         try:
-            print(f"⚙️ [GÉNÉRATION] Création de l'article pour le topic: '{topic_name}'")
             article_start_time = datetime.now()
+            checkpoint_entry = pending_articles.get(topic_name)
             
-            markdown = generate_article(topic_name)
+            if checkpoint_entry:
+                print(f"♻️ [GÉNÉRATION] Article déjà généré pour le topic: '{topic_name}'")
+                markdown = checkpoint_entry['markdown']
+            else:
+                print(f"⚙️ [GÉNÉRATION] Création de l'article pour le topic: '{topic_name}'")
+                markdown = generate_article(topic_name)
+                checkpoint_entry = {'markdown': markdown, 'inserted': False}
+                pending_articles[topic_name] = checkpoint_entry
+                save_checkpoint('articles', checkpoint_key, pending_articles)
             article_duration = (datetime.now() - article_start_time).total_seconds()
             
             article_length = len(markdown) if markdown else 0
@@ -90,20 +113,25 @@ if __name__ == "__main__":
             print(f"   - Temps de génération: {article_duration:.2f} secondes")
             print(f"   - Aperçu: {markdown[:100]}..." if markdown else "   - Contenu vide")
 
-            print(f"\n📝 [SAUVEGARDE] Insertion dans Supabase...")
-            insert_start_time = datetime.now()
-            
-            insert_article_to_supabase(
-                article_markdown=markdown,
-                topic=topic_name
-            )
-            
-            insert_duration = (datetime.now() - insert_start_time).total_seconds()
-            print(f"📥 [SAUVEGARDE] Article sauvegardé avec succès!")
-            print(f"⏱️ Temps de sauvegarde: {insert_duration:.2f} secondes")
+            if not checkpoint_entry['inserted']:
+                print(f"\n📝 [SAUVEGARDE] Insertion dans Supabase...")
+                insert_start_time = datetime.now()
+                
+                insert_article_to_supabase(
+                    article_markdown=markdown,
+                    topic=topic_name
+                )
+                checkpoint_entry['inserted'] = True
+                save_checkpoint('articles', checkpoint_key, pending_articles)
+                
+                insert_duration = (datetime.now() - insert_start_time).total_seconds()
+                print(f"📥 [SAUVEGARDE] Article sauvegardé avec succès!")
+                print(f"⏱️ Temps de sauvegarde: {insert_duration:.2f} secondes")
 
             print(f"\n🔖 [MARQUAGE] Marquage du topic comme traité...")
             mark_topic_as_processed(topic_name)
+            pending_articles.pop(topic_name, None)
+            save_checkpoint('articles', checkpoint_key, pending_articles)
             print(f"✅ [MARQUAGE] Topic marqué comme traité")
             
             # Statistiques de progression
@@ -147,3 +175,9 @@ if __name__ == "__main__":
     print(f"   - Moyenne par article: {total_duration/generated_count:.1f}s")
     print(f"⏰ Fin du traitement: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*80)
+    return generated_count
+
+if __name__ == "__main__":
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    source = sys.argv[2] if len(sys.argv) > 2 else None
+    generate_articles(limit, source)
@@ -3,8 +3,8 @@ import sys
 import requests
 import psycopg2
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from rag_scripts.llm_utils import generate_text
+from embedding_store import get_embeddings
 from dotenv import load_dotenv
 import re
 
@@ -51,8 +51,8 @@ if __name__ == "__main__":
     print(f"[INFO] {len(topics)} topics fetched from Supabase for {source_pdf}")
 
     # 🧠 Embeddings & Chroma
-    embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    db = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_function)
+    # Serveur d'embeddings partagé s'il tourne, sinon modèle chargé localement
+    db = Chroma(persist_directory=CHROMA_DIR, embedding_function=get_embeddings())
 
     import supabase
     from supabase import create_client
@@ -1,10 +1,9 @@
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 import os
+from embedding_store import get_embeddings
 
 CHROMA_DIR = "/mnt/c/Users/koffi/Documents/RAG/books/time_management"
-embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-db = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_function)
+db = Chroma(persist_directory=CHROMA_DIR, embedding_function=get_embeddings())
 
 print(f"Nombre de documents dans la base : {db._collection.count()}")
 query = "Liste toutes les techniques, modèles, conseils et principes liés à la gestion du temps."
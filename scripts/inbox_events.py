@@ -0,0 +1,164 @@
+"""
+Regroupement des événements watchdog d'un dossier surveillé.
+
+Le thread de l'observer ne fait qu'enregistrer le chemin signalé (création,
+modification, déplacement vers le dossier, fermeture après écriture). Un thread
+de regroupement vérifie ensuite que chaque fichier est stable (taille et date
+inchangées pendant SETTLE_SECONDS, ou fermé après écriture) et passe au callback
+un lot des fichiers prêts dont le dernier événement date d'au moins
+QUIET_SECONDS : un gros fichier encore en cours de copie ne retient pas les
+autres. Déposer
+500 fichiers donne donc quelques lots traités par un seul consommateur, jamais
+500 appels bloquants sur le thread de l'observer ni de lecture de fichier à
+moitié copié.
+"""
+
+import os
+import time
+import logging
+import threading
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+# Délai sans changement de taille/date avant de considérer un fichier comme complet
+SETTLE_SECONDS = 2.0
+# Silence (sans nouvel événement sur le fichier) avant de livrer un fichier prêt
+QUIET_SECONDS = 1.0
+# Taille maximale d'un lot (livré sans attendre la fin de la rafale)
+MAX_BATCH_SIZE = 100
+POLL_INTERVAL = 0.5
+
+class StableFileBatcher:
+    """Suit les fichiers signalés et livre par lots ceux dont l'écriture est terminée"""
+
+    def __init__(self, on_batch, directory=None, accept=None, settle_seconds=SETTLE_SECONDS,
+                 quiet_seconds=QUIET_SECONDS, max_batch=MAX_BATCH_SIZE, poll_interval=POLL_INTERVAL):
+        self.on_batch = on_batch
+        self.directory = os.path.abspath(directory) if directory else None
+        self.accept = accept or (lambda path: True)
+        self.settle_seconds = settle_seconds
+        self.quiet_seconds = quiet_seconds
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        # chemin → {'size', 'mtime', 'changed_at', 'event_at', 'closed'}
+        self.pending = {}
+        # chemin prêt → date de son dernier événement
+        self.ready = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def notify(self, path, closed=False):
+        """Signaler un fichier (appelé depuis le thread de l'observer, non bloquant)"""
+        path = os.path.abspath(path)
+        if self.directory and os.path.dirname(path) != self.directory:
+            return
+        if not self.accept(path):
+            return
+        with self.lock:
+            now = time.monotonic()
+            # Fichier prêt réécrit : sa stabilité est à revérifier
+            self.ready.pop(path, None)
+            state = self.pending.setdefault(path, {'size': None, 'mtime': None,
+                                                   'changed_at': now, 'closed': False})
+            state['event_at'] = now
+            # Un nouvel événement d'écriture après la fermeture annule celle-ci
+            state['closed'] = closed
+
+    def _check_stability(self, now):
+        """Déplacer vers `ready` les fichiers dont l'écriture est terminée"""
+        with self.lock:
+            items = list(self.pending.items())
+        for path, state in items:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # Supprimé ou déplacé entre-temps
+                with self.lock:
+                    self.pending.pop(path, None)
+                continue
+            with self.lock:
+                if (st.st_size, st.st_mtime_ns) != (state['size'], state['mtime']):
+                    state['size'], state['mtime'] = st.st_size, st.st_mtime_ns
+                    state['changed_at'] = now
+                    continue
+                settled = now - state['changed_at'] >= self.settle_seconds
+                if state['closed'] or settled:
+                    self.pending.pop(path, None)
+                    self.ready[path] = state['event_at']
+
+    def _take_batch(self, now):
+        """Fichiers prêts et silencieux depuis quiet_seconds (ou lot plein), sans attendre les fichiers encore en écriture"""
+        with self.lock:
+            if len(self.ready) >= self.max_batch:
+                batch = list(self.ready)[:self.max_batch]
+            else:
+                batch = [path for path, event_at in self.ready.items() if now - event_at >= self.quiet_seconds]
+            for path in batch:
+                del self.ready[path]
+        return sorted(batch)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            now = time.monotonic()
+            self._check_stability(now)
+            batch = self._take_batch(now)
+            if not batch:
+                continue
+            logging.info(f"BATCH | {len(batch)} fichier(s) stable(s) à traiter")
+            try:
+                self.on_batch(batch)
+            except Exception as e:
+                logging.error(f"Erreur lors du traitement d'un lot: {e}")
+
+    def start(self):
+        """Démarrer le thread de regroupement (seul consommateur des lots)"""
+        self._thread = threading.Thread(target=self._run, name="inbox-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrêter le thread de regroupement (le lot en cours se termine)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+class BatchingEventHandler(FileSystemEventHandler):
+    """Handler watchdog qui se contente de signaler les chemins au StableFileBatcher"""
+
+    def __init__(self, batcher):
+        super().__init__()
+        self.batcher = batcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.batcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.batcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        # Fichier renommé dans le dossier (ex. copie .part terminée)
+        if not event.is_directory:
+            self.batcher.notify(event.dest_path)
+
+    def on_closed(self, event):
+        # Fermeture après écriture (inotify IN_CLOSE_WRITE)
+        if not event.is_directory:
+            self.batcher.notify(event.src_path, closed=True)
+
+def start_watching(directory, on_batch, accept=None, **batch_options):
+    """Surveiller un dossier et livrer les nouveaux fichiers stables par lots ; retourne (observer, batcher)"""
+    batcher = StableFileBatcher(on_batch, directory=directory, accept=accept, **batch_options)
+    batcher.start()
+    observer = Observer()
+    observer.schedule(BatchingEventHandler(batcher), directory, recursive=False)
+    observer.start()
+    return observer, batcher
+
+def stop_watching(observer, batcher):
+    """Arrêter l'observer puis le thread de regroupement"""
+    observer.stop()
+    observer.join()
+    batcher.stop()
@@ -1,16 +1,15 @@
 from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
 from collections import Counter
 import os
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from embedding_store import get_embeddings
 
 # 🔁 Mets ici ton chemin vers la base vectorielle
 CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
 
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
+vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=get_embeddings())
 
 # Récupère tous les documents
 docs = vectorstore.get()
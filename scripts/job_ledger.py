@@ -0,0 +1,266 @@
+"""
+Registre SQLite des jobs du pipeline.
+
+Un job par contenu de fichier (hash) : nom, chemin courant, statut, dernière
+étape terminée, nombre de tentatives, erreurs et durée de chaque étape. Le hash
+sert aussi de registre d'ingestion : un fichier aux octets identiques (copie
+renommée) est reconnu par une recherche indexée, avant toute conversion. Les
+écritures sont transactionnelles, l'état survit donc à un crash et le pipeline
+reprend à la dernière étape terminée au lieu de tout refaire. Remplace les
+fichiers processing_state_*.json et l'état gardé en mémoire.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Étapes dans l'ordre d'exécution ; 'stage' d'un job = dernière étape terminée
+STAGES = ('conversion', 'vectorization', 'topics', 'articles', 'completed')
+STATUSES = ('pending', 'processing', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    path TEXT,
+    content_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    stage TEXT,
+    current_step TEXT,
+    txt_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    errors TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_content_hash ON jobs(content_hash);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_filename ON jobs(filename);
+
+CREATE TABLE IF NOT EXISTS stage_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    attempt INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration REAL,
+    success INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_stage_runs_job ON stage_runs(job_id);
+"""
+
+# xxh3-128 (bien plus rapide que SHA-256 sur les gros livres) si xxhash est installé
+HASH_ALGORITHM = 'xxh3_128' if xxhash else 'sha256'
+
+# Hash déjà calculés, par inode/taille/date : un déplacement (rename) ne change
+# pas ces valeurs, le fichier n'est donc pas relu à chaque étape
+_hash_cache = {}
+_hash_cache_lock = threading.Lock()
+
+def compute_content_hash(path, chunk_size=1024 * 1024):
+    """Hash du contenu d'un fichier, lu par blocs, préfixé par l'algorithme ('xxh3_128:...')"""
+    st = os.stat(path)
+    cache_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _hash_cache_lock:
+        if cache_key in _hash_cache:
+            return _hash_cache[cache_key]
+
+    digest = xxhash.xxh3_128() if xxhash else hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    content_hash = f"{HASH_ALGORITHM}:{digest.hexdigest()}"
+
+    with _hash_cache_lock:
+        _hash_cache[cache_key] = content_hash
+    return content_hash
+
+class JobLedger:
+    """Accès thread-safe au registre SQLite (une connexion partagée, WAL)"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def _fetch_job(self, where, params):
+        row = self.conn.execute(f"SELECT * FROM jobs WHERE {where}", params).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['errors'] = json.loads(job['errors'])
+        return job
+
+    def get_job(self, job_id):
+        """Retourner un job par identifiant"""
+        with self.lock:
+            return self._fetch_job("id = ?", (job_id,))
+
+    def find_by_hash(self, content_hash):
+        """Retourner le job correspondant à un contenu (recherche indexée)"""
+        with self.lock:
+            return self._fetch_job("content_hash = ?", (content_hash,))
+
+    def has_filename(self, filename):
+        """Vrai si un job porte déjà ce nom de fichier (recherche indexée)"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM jobs WHERE filename = ? LIMIT 1", (filename,)).fetchone() is not None
+
+    def record_done(self, filename, path, content_hash):
+        """Enregistrer comme terminé un contenu traité avant l'existence du registre ; retourne le job"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO jobs (filename, path, content_hash, status, stage, created_at, updated_at, finished_at)
+                   VALUES (?, ?, ?, 'done', 'completed', ?, ?, ?)
+                   ON CONFLICT(content_hash) DO NOTHING""",
+                (filename, path, content_hash, now, now, now)
+            )
+            return self._fetch_job("content_hash = ?", (content_hash,))
+
+    def begin_attempt(self, filename, path, content_hash):
+        """Créer le job ou démarrer une nouvelle tentative ; retourne le job"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO jobs (filename, path, content_hash, status, created_at, updated_at)
+                   VALUES (?, ?, ?, 'pending', ?, ?)
+                   ON CONFLICT(content_hash) DO NOTHING""",
+                (filename, path, content_hash, now, now)
+            )
+            self.conn.execute(
+                """UPDATE jobs SET filename = ?, path = ?, status = 'processing',
+                          attempts = attempts + 1, started_at = ?, finished_at = NULL,
+                          current_step = 'init', updated_at = ?
+                   WHERE content_hash = ?""",
+                (filename, path, now, now, content_hash)
+            )
+            return self._fetch_job("content_hash = ?", (content_hash,))
+
+    def start_stage(self, job_id, stage):
+        """Marquer le début d'une étape"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET current_step = ?, updated_at = ? WHERE id = ?",
+                (stage, now, job_id)
+            )
+            self.conn.execute(
+                """INSERT INTO stage_runs (job_id, attempt, stage, started_at)
+                   SELECT id, attempts, ?, ? FROM jobs WHERE id = ?""",
+                (stage, now, job_id)
+            )
+
+    def _finish_stage_run(self, job_id, stage, success, now):
+        self.conn.execute(
+            """UPDATE stage_runs SET finished_at = ?, duration = ? - started_at, success = ?
+               WHERE id = (SELECT MAX(id) FROM stage_runs
+                           WHERE job_id = ? AND stage = ? AND finished_at IS NULL)""",
+            (now, now, int(success), job_id, stage)
+        )
+
+    def complete_stage(self, job_id, stage, txt_path=None):
+        """Enregistrer une étape terminée (devient le point de reprise)"""
+        now = time.time()
+        with self.lock, self.conn:
+            self._finish_stage_run(job_id, stage, True, now)
+            if txt_path is not None:
+                self.conn.execute("UPDATE jobs SET txt_path = ? WHERE id = ?", (txt_path, job_id))
+            self.conn.execute(
+                "UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ?",
+                (stage, now, job_id)
+            )
+
+    def add_error(self, job_id, error_msg, stage=None):
+        """Ajouter une erreur au job (et clore l'étape en échec si précisée)"""
+        now = time.time()
+        with self.lock, self.conn:
+            if stage:
+                self._finish_stage_run(job_id, stage, False, now)
+            row = self.conn.execute("SELECT errors FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            errors = json.loads(row['errors']) if row else []
+            errors.append(error_msg)
+            self.conn.execute(
+                "UPDATE jobs SET errors = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(errors, ensure_ascii=False), now, job_id)
+            )
+
+    def set_status(self, job_id, status, path=None):
+        """Changer le statut (et le chemin courant) d'un job"""
+        if status not in STATUSES:
+            raise ValueError(f"Statut inconnu : {status}")
+        now = time.time()
+        finished_at = now if status in ('done', 'failed') else None
+        with self.lock, self.conn:
+            self.conn.execute(
+                """UPDATE jobs SET status = ?, path = COALESCE(?, path), finished_at = ?,
+                          updated_at = ? WHERE id = ?""",
+                (status, path, finished_at, now, job_id)
+            )
+
+    def update_path(self, job_id, path):
+        """Suivre le déplacement du fichier d'un job"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET path = ?, updated_at = ? WHERE id = ?",
+                (path, time.time(), job_id)
+            )
+
+    def count_by_status(self):
+        """Nombre de jobs par statut (agrégat sur index)"""
+        counts = {status: 0 for status in STATUSES}
+        with self.lock:
+            for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+                counts[row['status']] = row['n']
+        return counts
+
+    def jobs_with_status(self, status):
+        """Lister les jobs d'un statut donné"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY updated_at", (status,)
+            ).fetchall()
+            return [self._fetch_job("id = ?", (row['id'],)) for row in rows]
+
+    def completed_stages(self, job_id):
+        """Étapes réussies lors de la tentative courante, dans l'ordre"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT r.stage FROM stage_runs r JOIN jobs j ON j.id = r.job_id
+                   WHERE r.job_id = ? AND r.attempt = j.attempts AND r.success = 1
+                   ORDER BY r.id""",
+                (job_id,)
+            ).fetchall()
+        return [row['stage'] for row in rows]
+
+    def stage_timings(self, job_id):
+        """Durée (s) de chaque étape terminée, toutes tentatives confondues"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT attempt, stage, duration, success FROM stage_runs
+                   WHERE job_id = ? AND finished_at IS NOT NULL ORDER BY id""",
+                (job_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+def has_completed(job, stage):
+    """Vrai si la dernière étape terminée du job est `stage` ou une étape ultérieure"""
+    if not job or not job.get('stage'):
+        return False
+    return STAGES.index(job['stage']) >= STAGES.index(stage)
@@ -10,6 +10,8 @@ load_dotenv()
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+# Délai maximal d'une requête aux API LLM (s) : une étape en processus n'attend jamais indéfiniment
+LLM_REQUEST_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "30"))
 
 def test_api_connectivity():
     """Test la connectivité des différentes API"""
@@ -71,7 +73,7 @@ def generate_text_deepseek(prompt, temperature=0.7, max_tokens=500):
         "https://api.deepseek.com/v1/chat/completions",
         headers=headers,
         json=data,
-        timeout=30
+        timeout=LLM_REQUEST_TIMEOUT
     )
     
     if response.status_code == 200:
@@ -97,7 +99,7 @@ def generate_text_openai(prompt, temperature=0.7, max_tokens=500):
         "https://api.openai.com/v1/chat/completions",
         headers=headers,
         json=data,
-        timeout=30
+        timeout=LLM_REQUEST_TIMEOUT
     )
     
     if response.status_code == 200:
@@ -0,0 +1,497 @@
+"""
+OCR des PDF scannés, page par page, en parallèle et en flux.
+
+Chaque page est d'abord classée avec PyMuPDF (texte extractible ou image
+scannée) : seules les pages sans couche texte exploitable partent à l'OCR, ce
+qui couvre aussi les livres texte avec des encarts scannés. Les pages à
+reconnaître sont rendues à la demande (une image en niveaux de gris à la fois
+par worker, à basse résolution puis à haute résolution seulement si la confiance
+tesseract est trop faible) au lieu de convert_from_path sur tout le document,
+puis passées à tesseract dans un pool de processus. Le nombre de tâches en vol
+est borné par un budget mémoire ; les textes sont rendus dans l'ordre des pages
+au fur et à mesure, sans attendre la fin du document.
+
+Backend 'tesserocr' (par défaut s'il est installé) : chaque worker garde un
+moteur tesseract chargé (PyTessBaseAPI) et le document ouvert avec PyMuPDF ;
+les pages passent en mémoire, sans processus tesseract ni fichier temporaire
+par page. Backend 'pytesseract' : rendu pdf2image et binaire tesseract par page.
+
+Les images (scans isolés, TIFF multipages, lots de scans regroupés dans une
+archive CBZ) passent par le même pool : une page par image (ou par image d'un
+TIFF), lue à sa résolution d'origine et agrandie seulement si la confiance est
+trop faible. Le pool est gardé ouvert d'un document à l'autre ; la langue
+voyage avec chaque tâche (le worker ne recharge son moteur que si elle change),
+si bien qu'un seul pool vit à la fois et que le budget mémoire couvre tous les
+workers du processus.
+"""
+
+import io
+import os
+import re
+import atexit
+import logging
+import zipfile
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Version de l'extraction : à incrémenter quand le texte produit change (invalide le cache)
+EXTRACTOR_VERSION = 1
+OCR_LANG = "fra"
+# Rendu initial en niveaux de gris à basse résolution ; seules les pages dont la
+# confiance tesseract moyenne est sous OCR_MIN_CONFIDENCE sont rendues à nouveau
+# à OCR_HIGH_DPI (la meilleure des deux lectures est gardée)
+OCR_DPI = 150
+OCR_HIGH_DPI = 300
+OCR_MIN_CONFIDENCE = 70
+PAGE_BREAK = "\f"
+
+OCR_BACKENDS = ('tesserocr', 'pytesseract')
+OCR_BACKEND = os.environ.get("RAG_OCR_BACKEND", "tesserocr")
+
+# Pages rendues et reconnues par tâche envoyée au pool
+PAGES_PER_TASK = 4
+OCR_WORKERS = int(os.environ.get("RAG_OCR_WORKERS", os.cpu_count() or 1))
+# Mémoire maximale occupée par les images rendues en même temps (Mo)
+MEMORY_BUDGET_MB = int(os.environ.get("RAG_OCR_MEMORY_MB", "2048"))
+# Mémoire résidente d'un worker hors image : interpréteur, moteur tesseract et
+# données de langue chargés, document ouvert (Mo) ; comptée dans le budget
+ENGINE_MEMORY_MB = int(os.environ.get("RAG_OCR_ENGINE_MB", "200"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+MULTIPAGE_IMAGE_EXTENSIONS = (".tif", ".tiff")
+# Résolution déclarée en dessous de laquelle elle est ignorée (valeur par défaut des logiciels, 1 dpi...)
+MIN_IMAGE_DPI = 72
+# Lot de scans : archive zip des images d'un document, pages dans l'ordre des noms
+SCAN_BATCH_EXTENSIONS = (".cbz",)
+
+# Classement des pages : sous MIN_TEXT_CHARS caractères une page est vide ou
+# scannée ; une page couverte d'images à plus de IMAGE_COVERAGE_MIN avec moins de
+# MIN_CHARS_WITH_IMAGE caractères (numéro de page, légende) est une page scannée
+MIN_TEXT_CHARS = 20
+IMAGE_COVERAGE_MIN = 0.3
+MIN_CHARS_WITH_IMAGE = 100
+
+def count_pdf_pages(pdf_path):
+    """Nombre de pages d'un PDF (pdfinfo)"""
+    from pdf2image import pdfinfo_from_path
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+def page_image_bytes(dpi=OCR_HIGH_DPI, channels=1):
+    """Taille mémoire d'une page A4 rendue à `dpi` (niveaux de gris par défaut)"""
+    return int(8.27 * dpi) * int(11.69 * dpi) * channels
+
+def _recognize_words(image, lang):
+    """pytesseract : texte (lignes et paragraphes reconstitués) et confiance moyenne des mots"""
+    import pytesseract
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        confidence = float(data['conf'][i])
+        if confidence < 0 or not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+
+    text_lines = []
+    previous_paragraph = None
+    for (block, paragraph, _), words in lines.items():
+        if previous_paragraph is not None and (block, paragraph) != previous_paragraph:
+            text_lines.append("")
+        text_lines.append(" ".join(words))
+        previous_paragraph = (block, paragraph)
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return "\n".join(text_lines), confidence
+
+class PytesseractEngine:
+    """Rendu pdf2image et un processus tesseract par page (comportement historique)"""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang):
+        self.lang = lang
+
+    def render(self, pdf_path, page_number, dpi):
+        from pdf2image import convert_from_path
+        images = convert_from_path(pdf_path, dpi=dpi, grayscale=True,
+                                   first_page=page_number, last_page=page_number)
+        return images[0] if images else None
+
+    def recognize(self, image):
+        return _recognize_words(image, self.lang)
+
+    def close(self):
+        pass
+
+class TesserocrEngine:
+    """Moteur tesseract résident (API C via tesserocr) et document PyMuPDF gardé ouvert"""
+
+    name = 'tesserocr'
+
+    def __init__(self, lang):
+        from tesserocr import PyTessBaseAPI
+        self.api = PyTessBaseAPI(lang=lang)
+        self.document_path = None
+        self.document = None
+
+    def render(self, pdf_path, page_number, dpi):
+        import fitz  # PyMuPDF
+        from PIL import Image
+        if self.document_path != pdf_path:
+            if self.document is not None:
+                self.document.close()
+            self.document = fitz.open(pdf_path)
+            self.document_path = pdf_path
+        pixmap = self.document.load_page(page_number - 1).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+
+    def recognize(self, image):
+        self.api.SetImage(image)
+        text = self.api.GetUTF8Text()
+        return text, (float(self.api.MeanTextConf()) if text.strip() else None)
+
+    def close(self):
+        if self.document is not None:
+            self.document.close()
+        self.api.End()
+
+def create_engine(backend=None, lang=OCR_LANG):
+    """Créer le moteur OCR demandé (repli sur pytesseract si tesserocr n'est pas installé)"""
+    backend = backend or OCR_BACKEND
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Backend OCR inconnu : {backend}")
+    if backend == 'tesserocr':
+        try:
+            return TesserocrEngine(lang)
+        except ImportError:
+            logging.warning("tesserocr non installé, repli sur pytesseract")
+    return PytesseractEngine(lang)
+
+# Moteur du processus worker, créé par l'initializer du pool ; un seul à la fois
+_engine = None
+_engine_backend = None
+_engine_lang = None
+
+def _init_worker(backend, lang):
+    global _engine, _engine_backend, _engine_lang
+    _engine = create_engine(backend, lang)
+    _engine_backend, _engine_lang = backend, lang
+
+def _get_engine(lang):
+    """Moteur du worker pour cette langue (l'ancien est libéré si elle change)"""
+    global _engine, _engine_lang
+    if _engine is None or _engine_lang != lang:
+        if _engine is not None:
+            _engine.close()
+        _engine = create_engine(_engine_backend, lang)
+        _engine_lang = lang
+    return _engine
+
+# Pools du processus par réglages (workers, backend) : {clé: {'pool', 'size', 'memory', 'users'}}.
+# Seul le pool des derniers réglages demandés reste ouvert ; les autres sont
+# arrêtés dès que leurs documents en cours sont terminés, et la mémoire qu'ils
+# occupent encore est retirée du budget d'un nouveau pool.
+_pools = {}
+_pools_lock = threading.Lock()
+_current_key = None
+
+def _shutdown_pool(key):
+    _pools.pop(key)['pool'].shutdown(wait=False, cancel_futures=True)
+
+def _acquire_pool(workers, backend, lang, worker_bytes, memory_budget_mb=None):
+    """Pool de workers OCR gardé ouvert entre les documents (moteurs déjà chargés) ; retourne (clé, pool, taille)"""
+    global _current_key
+    key = (workers, backend)
+    with _pools_lock:
+        if key != _current_key:
+            for other in [k for k, entry in _pools.items() if k != key and not entry['users']]:
+                _shutdown_pool(other)
+            _current_key = key
+        if key not in _pools:
+            budget = (memory_budget_mb or MEMORY_BUDGET_MB) * 1024 * 1024
+            budget -= sum(entry['memory'] for entry in _pools.values())
+            size = max(1, min(workers, budget // worker_bytes))
+            # spawn : pas de copie des threads, verrous et modèles du processus parent
+            pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(backend, lang))
+            _pools[key] = {'pool': pool, 'size': size, 'memory': size * worker_bytes, 'users': 0}
+        entry = _pools[key]
+        entry['users'] += 1
+        return key, entry['pool'], entry['size']
+
+def _release_pool(key, pool, broken=False):
+    """Fin d'un document : arrêter le pool s'il est cassé ou remplacé et qu'il n'a plus de document en cours"""
+    with _pools_lock:
+        entry = _pools.get(key)
+        if entry is None or entry['pool'] is not pool:
+            return
+        entry['users'] -= 1
+        if broken or (key != _current_key and not entry['users']):
+            # Worker tué (mémoire...) : un nouveau pool sera créé pour le document suivant
+            _shutdown_pool(key)
+
+def shutdown_pools():
+    """Arrêter les workers OCR (moteurs libérés)"""
+    global _current_key
+    with _pools_lock:
+        for entry in _pools.values():
+            entry['pool'].shutdown()
+        _pools.clear()
+        _current_key = None
+
+atexit.register(shutdown_pools)
+
+def _ocr_pages(pdf_path, page_numbers, lang, dpi, high_dpi, min_confidence):
+    """Worker : rendre et reconnaître une suite de pages, une image à la fois ; retourne [(page, texte, dpi utilisé)]"""
+    engine = _get_engine(lang)
+    results = []
+    for page_number in page_numbers:
+        image = engine.render(pdf_path, page_number, dpi)
+        text, confidence = engine.recognize(image) if image is not None else ("", None)
+        used_dpi = dpi
+        del image
+        # Page sans mot reconnu : vide, inutile de la rendre à nouveau
+        if confidence is not None and confidence < min_confidence and high_dpi > dpi:
+            image = engine.render(pdf_path, page_number, high_dpi)
+            high_text, high_confidence = engine.recognize(image) if image is not None else ("", None)
+            del image
+            if high_confidence is not None and high_confidence >= confidence:
+                text, used_dpi = high_text, high_dpi
+        results.append((page_number, text, used_dpi))
+    return results
+
+def _batches(page_numbers, size):
+    for start in range(0, len(page_numbers), size):
+        yield page_numbers[start:start + size]
+
+def _worker_bytes(high_dpi):
+    """Mémoire d'un worker : moteur chargé et, au pire, une image couleur à high_dpi (pages de PDF ou images)"""
+    return ENGINE_MEMORY_MB * 1024 * 1024 + page_image_bytes(high_dpi, channels=3)
+
+def _pool_size(workers, memory_budget_mb, worker_bytes):
+    """Workers dans le budget mémoire : chaque worker garde son moteur chargé et une image à la fois"""
+    budget = (memory_budget_mb or MEMORY_BUDGET_MB) * 1024 * 1024
+    return max(1, min(workers or OCR_WORKERS, budget // worker_bytes))
+
+def _iter_in_order(tasks, workers, backend, lang, worker_bytes, memory_budget_mb=None):
+    """Soumettre les tâches (fonction, arguments...) au pool OCR et générer leurs résultats dans l'ordre"""
+    key, pool, size = _acquire_pool(workers, backend, lang, worker_bytes, memory_budget_mb)
+    # Tâches en avance sur la prochaine page à rendre (borne aussi les textes en attente de réordonnancement)
+    window = size * 2
+    in_flight = deque()
+    broken = False
+    try:
+        for task in tasks:
+            in_flight.append(pool.submit(*task))
+            if len(in_flight) >= window:
+                break
+        while in_flight:
+            # Les tâches sont consommées dans l'ordre de soumission : les pages sortent dans l'ordre
+            yield from in_flight.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                in_flight.append(pool.submit(*task))
+    except BrokenProcessPool:
+        broken = True
+        raise
+    finally:
+        # Document abandonné en cours de route : ne pas laisser ses tâches occuper le pool partagé
+        for future in in_flight:
+            future.cancel()
+        _release_pool(key, pool, broken)
+
+def iter_ocr_pages(pdf_path, page_numbers=None, lang=OCR_LANG, dpi=OCR_DPI, high_dpi=OCR_HIGH_DPI,
+                   min_confidence=OCR_MIN_CONFIDENCE, workers=None, memory_budget_mb=None,
+                   pages_per_task=PAGES_PER_TASK, backend=None):
+    """Générer (numéro de page, texte) dans l'ordre, l'OCR tournant en parallèle"""
+    if page_numbers is None:
+        page_numbers = list(range(1, count_pdf_pages(pdf_path) + 1))
+    if not page_numbers:
+        return
+
+    # Même taille de worker que pour les images : PDF et images partagent le pool
+    worker_bytes = _worker_bytes(max(dpi, high_dpi))
+    workers = _pool_size(workers, memory_budget_mb, worker_bytes)
+    backend = backend or OCR_BACKEND
+    logging.info(f"OCR | {os.path.basename(pdf_path)} | {len(page_numbers)} pages | {workers} workers | {dpi} dpi | {backend}")
+
+    tasks = ((_ocr_pages, pdf_path, batch, lang, dpi, high_dpi, min_confidence)
+             for batch in _batches(page_numbers, pages_per_task))
+    rerendered = 0
+    for page_number, text, used_dpi in _iter_in_order(tasks, workers, backend, lang, worker_bytes, memory_budget_mb):
+        if used_dpi != dpi:
+            rerendered += 1
+        yield page_number, text
+    logging.info(f"OCR | {os.path.basename(pdf_path)} | {rerendered}/{len(page_numbers)} pages relues à {high_dpi} dpi")
+
+def natural_sort_key(name):
+    """Clé de tri « naturelle » : scan_2 avant scan_10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+def _open_image(image_path, member=None):
+    """Ouvrir une image, ou un membre d'un lot de scans (lu en mémoire, sans extraction)"""
+    from PIL import Image
+    if member is None:
+        return Image.open(image_path)
+    with zipfile.ZipFile(image_path) as archive:
+        return Image.open(io.BytesIO(archive.read(member)))
+
+def list_image_pages(image_path):
+    """Pages d'une image, d'un TIFF multipage ou d'un lot de scans : [(membre ou None, image dans le fichier)]"""
+    if image_path.lower().endswith(SCAN_BATCH_EXTENSIONS):
+        with zipfile.ZipFile(image_path) as archive:
+            members = sorted((info.filename for info in archive.infolist()
+                              if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)),
+                             key=natural_sort_key)
+    else:
+        members = [None]
+    pages = []
+    for member in members:
+        frames = 1
+        if (member or image_path).lower().endswith(MULTIPAGE_IMAGE_EXTENSIONS):
+            with _open_image(image_path, member) as image:
+                frames = getattr(image, 'n_frames', 1)
+        pages.extend((member, frame) for frame in range(frames))
+    return pages
+
+def _ocr_images(image_path, pages, lang, high_dpi, min_confidence):
+    """Worker : lire et reconnaître une suite de pages d'images ; retourne [(page, texte, agrandie)]"""
+    from PIL import Image
+    engine = _get_engine(lang)
+    results = []
+    for page_number, member, frame in pages:
+        with _open_image(image_path, member) as source:
+            source.seek(frame)
+            dpi = source.info.get('dpi', (0,))[0]
+            image = source.convert("L")
+        text, confidence = engine.recognize(image)
+        upscaled = False
+        # Scan basse résolution mal lu : agrandi vers high_dpi (sans dépasser une page A4 à high_dpi),
+        # la meilleure lecture est gardée
+        if confidence is not None and confidence < min_confidence and MIN_IMAGE_DPI <= dpi < high_dpi:
+            factor = min(high_dpi / dpi, (page_image_bytes(high_dpi) / (image.width * image.height)) ** 0.5)
+            if factor > 1:
+                image = image.resize((round(image.width * factor), round(image.height * factor)), Image.LANCZOS)
+                high_text, high_confidence = engine.recognize(image)
+                if high_confidence is not None and high_confidence >= confidence:
+                    text, upscaled = high_text, True
+        del image
+        results.append((page_number, text, upscaled))
+    return results
+
+def iter_image_pages(image_path, start=0, lang=OCR_LANG, high_dpi=OCR_HIGH_DPI, min_confidence=OCR_MIN_CONFIDENCE,
+                     workers=None, memory_budget_mb=None, pages_per_task=PAGES_PER_TASK, backend=None):
+    """Générer (numéro de page, texte) dans l'ordre pour une image, un TIFF multipage ou un lot de scans.
+
+    Les `start` premières pages sont sautées sans être reconnues (reprise).
+    """
+    pages = [(number, member, frame)
+             for number, (member, frame) in enumerate(list_image_pages(image_path), start=1) if number > start]
+    if not pages:
+        return
+
+    # Image d'origine décodée en couleur, puis éventuellement agrandie
+    worker_bytes = _worker_bytes(high_dpi)
+    workers = _pool_size(workers, memory_budget_mb, worker_bytes)
+    backend = backend or OCR_BACKEND
+    logging.info(f"OCR | {os.path.basename(image_path)} | {len(pages)} images | {workers} workers | {backend}")
+
+    tasks = ((_ocr_images, image_path, batch, lang, high_dpi, min_confidence)
+             for batch in _batches(pages, pages_per_task))
+    upscaled = 0
+    for page_number, text, was_upscaled in _iter_in_order(tasks, workers, backend, lang, worker_bytes, memory_budget_mb):
+        upscaled += was_upscaled
+        # Le saut de page est réservé à la séparation des pages
+        yield page_number, text.replace(PAGE_BREAK, "\n")
+    logging.info(f"OCR | {os.path.basename(image_path)} | {upscaled}/{len(pages)} images agrandies à {high_dpi} dpi")
+
+def extract_images_to_file(image_path, output_path, **ocr_options):
+    """OCR d'une image ou d'un lot de scans écrit page par page (séparées par PAGE_BREAK) ; retourne (caractères, pages)"""
+    chars = 0
+    pages = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for _, text in iter_image_pages(image_path, **ocr_options):
+            if pages:
+                f.write(PAGE_BREAK)
+            f.write(text)
+            chars += len(text)
+            pages += 1
+    return chars, pages
+
+def _image_coverage(page):
+    """Part de la surface de la page couverte par des images"""
+    page_area = abs(page.rect) or 1
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = page.rect & info["bbox"]
+        covered += abs(bbox)
+    return min(1.0, covered / page_area)
+
+def classify_page(page):
+    """('text', texte) si la couche texte suffit, ('ocr', None) si la page doit être reconnue, ('blank', '') sinon"""
+    text = page.get_text("text")
+    chars = len(text.strip())
+    coverage = _image_coverage(page)
+    if coverage >= IMAGE_COVERAGE_MIN and chars < MIN_CHARS_WITH_IMAGE:
+        return 'ocr', None
+    if chars < MIN_TEXT_CHARS:
+        return ('ocr', None) if coverage > 0 else ('blank', '')
+    return 'text', text
+
+def classify_pdf_pages(pdf_path, start=0, stop=None):
+    """Classer les pages d'un PDF (toutes, ou les pages d'indice start à stop exclu) ; retourne [(type, texte)] dans l'ordre"""
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [classify_page(doc.load_page(index)) for index in range(start, stop)]
+
+def iter_pdf_pages(pdf_path, start=0, stop=None, **ocr_options):
+    """Générer (numéro de page, texte, type) dans l'ordre : couche texte quand elle existe, OCR sinon.
+
+    Seules les pages d'indice start à stop exclu sont lues et reconnues
+    (reprise, plage de pages d'un shard).
+    """
+    pages = classify_pdf_pages(pdf_path, start, stop)
+    ocr_pages = [number for number, (kind, _) in enumerate(pages, start=start + 1) if kind == 'ocr']
+    logging.info(f"PAGES | {os.path.basename(pdf_path)} | {len(pages)} pages à partir de la page {start + 1} | "
+                 f"{len(ocr_pages)} à reconnaître")
+
+    ocr_results = iter_ocr_pages(pdf_path, page_numbers=ocr_pages, **ocr_options)
+    for number, (kind, text) in enumerate(pages, start=start + 1):
+        if kind == 'ocr':
+            # Les pages OCR sortent dans l'ordre : la suivante est forcément celle-ci
+            _, text = next(ocr_results)
+        # Le saut de page est réservé à la séparation des pages
+        yield number, text.replace(PAGE_BREAK, "\n"), kind
+
+def extract_pdf_to_file(pdf_path, output_path, **ocr_options):
+    """Extraire un PDF page par page : couche texte quand elle existe, OCR sinon.
+
+    Écrit les pages dans l'ordre, séparées par PAGE_BREAK ; retourne
+    (nombre de caractères, nombre de pages OCR).
+    """
+    chars = 0
+    ocr_pages = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for number, text, kind in iter_pdf_pages(pdf_path, **ocr_options):
+            if number > 1:
+                f.write(PAGE_BREAK)
+            f.write(text)
+            chars += len(text)
+            ocr_pages += kind == 'ocr'
+    return chars, ocr_pages
+
+def ocr_pdf_to_file(pdf_path, output_path, **ocr_options):
+    """OCR d'un PDF écrit page par page dans output_path (pages séparées par PAGE_BREAK) ; retourne le nombre de caractères"""
+    chars = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for index, (_, text) in enumerate(iter_ocr_pages(pdf_path, **ocr_options)):
+            if index:
+                f.write(PAGE_BREAK)
+            f.write(text)
+            chars += len(text)
+    return chars
@@ -0,0 +1,110 @@
+"""
+Backend ONNX Runtime pour all-MiniLM-L6-v2, en float32 ou quantifié en int8.
+
+Le modèle est exporté une fois en ONNX (optimum) dans EMBEDDING_ONNX_DIR, puis
+quantifié dynamiquement en int8 (poids des couches linéaires) si demandé ; les
+exports suivants sont relus depuis ce dossier. L'inférence passe directement
+par onnxruntime, sans torch : tokenisation (tokenizer rapide du modèle,
+troncature à MAX_SEQ_LENGTH tokens comme sentence-transformers), moyenne des
+états cachés sur le masque d'attention puis normalisation L2 — mêmes étapes
+que le pipeline sentence-transformers du modèle, donc des vecteurs comparables
+à ceux déjà dans Chroma (voir check_embedding_parity.py).
+
+Les lots sont triés par longueur et complétés seulement jusqu'au texte le plus
+long du lot.
+"""
+
+import os
+import shutil
+import logging
+import threading
+
+import numpy as np
+
+from embedding_store import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS
+
+ONNX_MODEL_ID = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+# Longueur maximale du modèle sentence-transformers (sentence_bert_config.json)
+MAX_SEQ_LENGTH = 256
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+_export_lock = threading.Lock()
+
+def _publish_directory(tmp_dir, model_dir):
+    """Publier un export terminé ; un autre processus a pu publier le sien entre-temps"""
+    try:
+        os.rename(tmp_dir, model_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(model_dir, ONNX_FILE)):
+            raise
+
+def export_model(model_dir=EMBEDDING_ONNX_DIR, model_id=ONNX_MODEL_ID):
+    """Exporter le modèle en ONNX (une fois) avec son tokenizer ; retourne le dossier"""
+    with _export_lock:
+        if os.path.exists(os.path.join(model_dir, ONNX_FILE)):
+            return model_dir
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        logging.info(f"EMBED | export ONNX de {model_id} vers {model_dir}")
+        tmp_dir = f"{model_dir}.{os.getpid()}.tmp"
+        ORTModelForFeatureExtraction.from_pretrained(model_id, export=True).save_pretrained(tmp_dir)
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(tmp_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(model_dir)), exist_ok=True)
+        _publish_directory(tmp_dir, model_dir)
+        return model_dir
+
+def quantize_model(model_dir=EMBEDDING_ONNX_DIR):
+    """Quantifier dynamiquement en int8 les poids du modèle exporté (une fois) ; retourne le chemin"""
+    path = os.path.join(model_dir, ONNX_INT8_FILE)
+    with _export_lock:
+        if os.path.exists(path):
+            return path
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logging.info(f"EMBED | quantification int8 de {os.path.join(model_dir, ONNX_FILE)}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        quantize_dynamic(os.path.join(model_dir, ONNX_FILE), tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+        return path
+
+class OnnxEmbeddings:
+    """Modèle ONNX Runtime résident, utilisable à la place de HuggingFaceEmbeddings"""
+
+    def __init__(self, quantize=False, threads=None, batch_size=None, model_dir=EMBEDDING_ONNX_DIR):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        export_model(model_dir)
+        path = quantize_model(model_dir) if quantize else os.path.join(model_dir, ONNX_FILE)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or EMBEDDING_THREADS
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        logging.info(f"EMBED | ONNX {'int8' if quantize else 'float32'} | {options.intra_op_num_threads} threads")
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+        if 'token_type_ids' in self.input_names and 'token_type_ids' not in inputs:
+            inputs['token_type_ids'] = np.zeros_like(inputs['input_ids'])
+        hidden = self.session.run(None, inputs)[0]
+        # Moyenne sur les tokens réels puis normalisation L2 (Pooling + Normalize de sentence-transformers)
+        mask = tokens['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        from embedding_workers import length_sorted_batches
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = [None] * len(texts)
+        for batch in length_sorted_batches(texts, self.batch_size):
+            for index, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -8,20 +8,24 @@ from watchdog.events import FileSystemEventHandler
 WATCHED_DIR = "/home/koffi/watched_sources"
 OUTPUT_DIR = "/home/koffi/watched_inbox"
 
-# 📚 Extensions eBook convertibles automatiquement avec Calibre
-CONVERTIBLE_EXTENSIONS = [
-    ".azw", ".azw3", ".mobi", ".kf8", ".prc",
-    ".epub", ".fb2", ".lit", ".pdb",
-    ".rtf", ".doc", ".docx", ".html", ".htm", ".odt"
-]
-
-def convert_to_pdf(file_path):
+# 📚 eBooks lus directement par le pipeline (ebook_extractor) : déposés tels quels
+NATIVE_EBOOK_EXTENSIONS = [".epub", ".fb2"]
+
+# 📚 eBooks convertis en EPUB avec Calibre (plus de passage par le PDF)
+EBOOK_TO_EPUB_EXTENSIONS = [".azw", ".azw3", ".mobi", ".kf8", ".prc", ".lit", ".pdb"]
+
+# 📄 Textes et documents lus directement par le pipeline (document_stream) : déposés tels quels
+NATIVE_DOCUMENT_EXTENSIONS = [".txt", ".md", ".rtf", ".docx", ".html", ".htm", ".odt"]
+
+# 📄 Documents convertis en TXT avec Calibre
+CONVERTIBLE_EXTENSIONS = [".doc"]
+
+def convert_for_inbox(file_path):
+    """Déposer un fichier dans la watched_inbox sous une forme lisible directement par le pipeline"""
     filename = os.path.basename(file_path)
     name, ext = os.path.splitext(filename)
     ext = ext.lower()
 
-    pdf_output_path = os.path.join(OUTPUT_DIR, f"OCR_{name}.pdf")
-
     try:
         if ext == ".pdf":
             print(f"📄 PDF direct : {filename}")
@@ -29,26 +33,32 @@ def convert_to_pdf(file_path):
             os.remove(file_path)
             print(f"🧹 Fichier source supprimé : {file_path}")
 
-        elif ext == ".txt":
-            print(f"📝 Conversion TXT → PDF : {filename}")
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            from fpdf import FPDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.set_font("Arial", size=12)
-            for line in content.splitlines():
-                pdf.cell(200, 10, txt=line[:90], ln=1)
-            pdf.output(pdf_output_path)
-            print(f"✅ Fichier TXT converti : {pdf_output_path}")
+        elif ext in NATIVE_DOCUMENT_EXTENSIONS:
+            # Plus de rendu TXT → PDF : le texte est lu tel quel puis découpé en chunks
+            print(f"📝 Document direct : {filename}")
+            shutil.copy(file_path, os.path.join(OUTPUT_DIR, filename))
+            os.remove(file_path)
+            print(f"🧹 Fichier source supprimé : {file_path}")
+
+        elif ext in NATIVE_EBOOK_EXTENSIONS:
+            print(f"📚 eBook direct : {filename}")
+            shutil.copy(file_path, os.path.join(OUTPUT_DIR, filename))
+            os.remove(file_path)
+            print(f"🧹 Fichier source supprimé : {file_path}")
+
+        elif ext in EBOOK_TO_EPUB_EXTENSIONS:
+            epub_output_path = os.path.join(OUTPUT_DIR, f"{name}.epub")
+            print(f"🔁 Conversion Calibre → EPUB : {filename}")
+            subprocess.run(["ebook-convert", file_path, epub_output_path], check=True)
+            print(f"✅ Fichier converti avec Calibre : {epub_output_path}")
             os.remove(file_path)
             print(f"🧹 Fichier source supprimé : {file_path}")
 
         elif ext in CONVERTIBLE_EXTENSIONS:
-            print(f"🔁 Conversion Calibre : {filename}")
-            subprocess.run(["ebook-convert", file_path, pdf_output_path], check=True)
-            print(f"✅ Fichier converti avec Calibre : {pdf_output_path}")
+            txt_output_path = os.path.join(OUTPUT_DIR, f"{name}.txt")
+            print(f"🔁 Conversion Calibre → TXT : {filename}")
+            subprocess.run(["ebook-convert", file_path, txt_output_path], check=True)
+            print(f"✅ Fichier converti avec Calibre : {txt_output_path}")
             os.remove(file_path)
             print(f"🧹 Fichier source supprimé : {file_path}")
 
@@ -63,13 +73,13 @@ def process_existing_files():
     for filename in os.listdir(WATCHED_DIR):
         full_path = os.path.join(WATCHED_DIR, filename)
         if os.path.isfile(full_path):
-            convert_to_pdf(full_path)
+            convert_for_inbox(full_path)
 
 class SourceHandler(FileSystemEventHandler):
     def on_created(self, event):
         if not event.is_directory:
             time.sleep(1)
-            convert_to_pdf(event.src_path)
+            convert_for_inbox(event.src_path)
 
 if __name__ == "__main__":
     print(f"👀 Surveillance de : {WATCHED_DIR}")
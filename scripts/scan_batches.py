@@ -0,0 +1,114 @@
+"""
+Regroupement des images d'un même lot de scans en un seul document.
+
+Un sous-dossier d'images déposé dans la boîte surveillée, ou une série d'images
+numérotées consécutivement avec le même préfixe (scan_001.jpg, scan_002.jpg...)
+déposées ensemble, forment un document : les images sont rangées telles
+quelles, sans recompression, dans une archive CBZ traitée ensuite comme un seul
+fichier (un job, un OCR page par page dans le pool de ocr_engine, des topics
+communs). Un lot n'est regroupé qu'une fois stable, pour ne pas couper une
+numérisation en cours ; d'ici là ses images ne doivent pas être traitées une à
+une (unsettled_scan_images).
+"""
+
+import os
+import re
+import time
+import zipfile
+import logging
+
+from ocr_engine import IMAGE_EXTENSIONS, SCAN_BATCH_EXTENSIONS, natural_sort_key
+
+# Secondes sans modification avant de regrouper un lot
+SETTLE_SECONDS = 60
+# Écart maximal entre deux images consécutives d'une même série
+MAX_GAP_SECONDS = 15 * 60
+
+SERIES_PATTERN = re.compile(r'^(.*?)[\s_.-]*\(?(\d+)\)?$')
+
+def series_position(filename):
+    """Préfixe et numéro d'une image numérotée (« Scan_012.jpg » → (« scan », 12)), ou None si elle n'est pas numérotée"""
+    match = SERIES_PATTERN.match(os.path.splitext(filename)[0])
+    return (match.group(1).lower(), int(match.group(2))) if match else None
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def _settled(paths, now):
+    return all(now - os.path.getmtime(path) >= SETTLE_SECONDS for path in paths)
+
+def _split_series(numbered):
+    """Couper une série [(numéro, image)] triée là où la numérotation saute ou les images sont éloignées dans le temps"""
+    groups = [[numbered[0][1]]]
+    for (previous_number, previous), (number, path) in zip(numbered, numbered[1:]):
+        if (number != previous_number + 1
+                or abs(os.path.getmtime(path) - os.path.getmtime(previous)) > MAX_GAP_SECONDS):
+            groups.append([])
+        groups[-1].append(path)
+    return groups
+
+def _scan_groups(directory, skip):
+    """Lots candidats de directory, stables ou non : [(nom du document, [images dans l'ordre], sous-dossier ?)]"""
+    groups = []
+    series = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name not in skip:
+                # Sous-dossier : toutes ses images forment un document
+                with os.scandir(entry.path) as files:
+                    images = sorted((f.path for f in files if f.is_file() and _is_image(f.name)),
+                                    key=lambda path: natural_sort_key(os.path.basename(path)))
+                if images:
+                    groups.append((entry.name, images, True))
+            elif entry.is_file() and _is_image(entry.name):
+                position = series_position(entry.name)
+                if position is not None:
+                    prefix, number = position
+                    series.setdefault(prefix, []).append((number, entry.path))
+
+    for numbered in series.values():
+        numbered.sort(key=lambda item: (item[0], natural_sort_key(os.path.basename(item[1]))))
+        for group in _split_series(numbered):
+            first, last = (os.path.splitext(os.path.basename(path))[0] for path in (group[0], group[-1]))
+            groups.append((f"{first}--{last}", group, False))
+    return groups
+
+def find_scan_batches(directory, skip=(), now=None):
+    """Lots d'images stables à regrouper dans directory : [(nom du document, [images dans l'ordre])]"""
+    now = now or time.time()
+    # Une image numérotée seule reste un document à part entière
+    return [(name, images) for name, images, folder in _scan_groups(directory, skip)
+            if (folder or len(images) > 1) and _settled(images, now)]
+
+def unsettled_scan_images(directory, skip=(), now=None):
+    """Images de directory qui appartiennent à un lot pas encore stable (à ne pas traiter seules).
+
+    Une image numérotée seule et récente est comptée : la suite de sa série peut
+    encore être en cours de copie.
+    """
+    now = now or time.time()
+    return {image for _, images, _ in _scan_groups(directory, skip) if not _settled(images, now) for image in images}
+
+def pack_scan_batch(name, images, directory):
+    """Ranger les images (sans recompression) dans directory/<name>.cbz ; retourne le chemin de l'archive"""
+    extension = SCAN_BATCH_EXTENSIONS[0]
+    batch_path = os.path.join(directory, name + extension)
+    suffix = 1
+    while os.path.exists(batch_path):
+        suffix += 1
+        batch_path = os.path.join(directory, f"{name}_{suffix}{extension}")
+
+    # Écrit sous un nom ignoré par la surveillance, publié d'un coup
+    tmp_path = os.path.join(directory, f".{os.path.basename(batch_path)}.tmp")
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for index, image in enumerate(images, start=1):
+                # Numéro en préfixe : l'ordre des pages survit au tri des noms
+                archive.write(image, f"{index:04d}_{os.path.basename(image)}")
+        os.replace(tmp_path, batch_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logging.info(f"SCANS | {os.path.basename(batch_path)} | {len(images)} images regroupées")
+    return batch_path
@@ -0,0 +1,132 @@
+"""
+Pipeline d'étapes reliées par des files bornées.
+
+Chaque étape possède sa propre file (queue.Queue bornée) et ses propres threads
+workers. Un worker prend un élément, appelle le handler de l'étape et pousse le
+résultat dans la file de l'étape suivante ; si celle-ci est pleine, le worker
+attend (backpressure) au lieu d'accumuler du travail en mémoire. Les étapes
+travaillent ainsi en parallèle sur des fichiers différents.
+"""
+
+import queue
+import threading
+import logging
+
+_STOP = object()
+
+class PipelineStage:
+    """Une étape : handler, nombre de workers et file d'entrée bornée"""
+
+    def __init__(self, name, handler, workers=1, maxsize=8):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+class StagePipeline:
+    """Enchaîne des PipelineStage ; le handler retourne l'élément pour l'étape suivante ou None pour l'arrêter là"""
+
+    def __init__(self, stages, on_error=None):
+        self.stages = stages
+        self.on_error = on_error
+        self.threads = []
+        self._monitor_stop = threading.Event()
+
+    def start(self):
+        """Démarrer les workers de toutes les étapes"""
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(stage, next_stage),
+                    name=f"{stage.name}-{n + 1}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def _worker(self, stage, next_stage):
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                stage.queue.task_done()
+                return
+            with stage.lock:
+                stage.active += 1
+            try:
+                result = stage.handler(item)
+                if result is not None and next_stage is not None:
+                    # Bloque si l'étape suivante est saturée
+                    next_stage.queue.put(result)
+                with stage.lock:
+                    stage.processed += 1
+            except Exception as e:
+                with stage.lock:
+                    stage.failed += 1
+                logging.error(f"Étape {stage.name} échouée: {e}")
+                if self.on_error:
+                    # Une erreur du callback ne doit pas tuer le worker (join() attendrait indéfiniment)
+                    try:
+                        self.on_error(stage.name, item, e)
+                    except Exception as callback_error:
+                        logging.error(f"Étape {stage.name}: traitement de l'échec impossible: {callback_error}")
+            finally:
+                with stage.lock:
+                    stage.active -= 1
+                stage.queue.task_done()
+
+    def submit(self, item):
+        """Ajouter un élément en entrée (bloque si la première file est pleine)"""
+        self.stages[0].queue.put(item)
+
+    def join(self):
+        """Attendre que tous les éléments soumis aient traversé le pipeline"""
+        # Les éléments n'avancent que vers l'aval : vider les files dans l'ordre suffit
+        for stage in self.stages:
+            stage.queue.join()
+
+    def close(self):
+        """Arrêter les workers et le monitoring"""
+        self._monitor_stop.set()
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def snapshot(self):
+        """Profondeur des files et activité par étape"""
+        snapshot = {}
+        for stage in self.stages:
+            with stage.lock:
+                snapshot[stage.name] = {
+                    'queued': stage.queue.qsize(),
+                    'capacity': stage.queue.maxsize,
+                    'active': stage.active,
+                    'workers': stage.workers,
+                    'processed': stage.processed,
+                    'failed': stage.failed,
+                }
+        return snapshot
+
+    def format_snapshot(self):
+        """Résumé d'une ligne des files d'attente"""
+        return " | ".join(
+            f"{name}: {s['queued']}/{s['capacity']} en file, {s['active']}/{s['workers']} actifs, {s['processed']} faits"
+            for name, s in self.snapshot().items()
+        )
+
+    def start_monitor(self, interval=30):
+        """Afficher périodiquement la profondeur des files"""
+        def monitor():
+            while not self._monitor_stop.wait(interval):
+                line = self.format_snapshot()
+                print(f"📊 Files d'attente → {line}")
+                logging.info(f"QUEUES | {line}")
+
+        thread = threading.Thread(target=monitor, name="pipeline-monitor", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,210 @@
+"""
+Exécution des étapes du pipeline (vectorisation, topics, articles).
+
+Par défaut la vectorisation tourne dans le processus courant : les imports
+torch/langchain, le modèle all-MiniLM-L6-v2 et le handle Chroma ne sont chargés
+qu'une fois pour toute la durée du worker. Une étape en processus tourne dans un
+thread surveillé : passé son timeout, son drapeau d'annulation est levé et
+l'étape s'arrête au prochain check_cancelled() (entre deux plages de pages, deux
+shards ou deux topics) ; elle échoue alors par TimeoutExpired, comme en
+sous-processus, et peut être relancée depuis son dernier point de reprise. Les
+étapes LLM (topics, articles) tournent aussi en processus : chaque appel aux API
+LLM et Supabase est borné par un timeout côté client (RAG_LLM_TIMEOUT,
+RAG_SUPABASE_TIMEOUT), l'annulation est donc vue au plus tard à la fin de
+l'appel en cours. RAG_LLM_STAGE_MODE=subprocess les isole encore dans un
+processus tué au timeout ; le mode 'subprocess' global conserve l'ancien
+comportement (un processus Python isolé par étape et par fichier).
+"""
+
+import os
+import sys
+import subprocess
+import logging
+import threading
+import traceback
+
+RAG_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGE_SCRIPTS = {
+    'vectorization': os.path.join(RAG_SCRIPTS_DIR, "vectorize_books.py"),
+    'topics': os.path.join(RAG_SCRIPTS_DIR, "topic_generator.py"),
+    'articles': os.path.join(RAG_SCRIPTS_DIR, "generate_articles_from_supabase.py"),
+}
+
+EXECUTION_MODES = ('inprocess', 'subprocess')
+
+# Mode par défaut, surchargeable via RAG_STAGE_MODE ou set_execution_mode()
+execution_mode = os.environ.get("RAG_STAGE_MODE", "inprocess")
+# Étapes LLM : en processus comme les autres, sauf RAG_LLM_STAGE_MODE=subprocess
+LLM_STAGE_MODE = os.environ.get("RAG_LLM_STAGE_MODE", "inprocess")
+STAGE_MODES = {'topics': LLM_STAGE_MODE, 'articles': LLM_STAGE_MODE}
+
+# Timeouts (secondes) : base + part proportionnelle au volume à traiter
+STAGE_TIMEOUTS = {
+    'vectorization': {'base': 120, 'per_page': 3, 'per_mb': 20, 'min': 300},
+    'topics': {'base': 300},
+    'articles': {'base': 120, 'per_item': 18, 'min': 300},
+}
+# Délai laissé à une étape en processus pour s'arrêter une fois son annulation demandée
+STAGE_CANCEL_GRACE = int(os.environ.get("RAG_STAGE_CANCEL_GRACE", "120"))
+# Nombre de caractères approximatif d'une page quand on ne sait pas la compter
+CHARS_PER_PAGE = 3000
+# Taille des blocs lus pour compter les pages d'un TXT
+TXT_READ_CHARS = 1024 * 1024
+# La vectorisation d'une source non convertie inclut sa conversion (OCR, transcription) :
+# marge proportionnelle au coût estimé par file_scheduler
+CONVERSION_TIMEOUT_FACTOR = 3
+
+class StageCancelled(Exception):
+    """Étape en processus arrêtée après son timeout"""
+
+# Drapeau d'annulation de l'étape qui tourne dans le thread courant
+_current = threading.local()
+
+def check_cancelled():
+    """Lever StageCancelled si l'étape en processus du thread courant a dépassé son timeout"""
+    cancel = getattr(_current, 'cancel', None)
+    if cancel is not None and cancel.is_set():
+        raise StageCancelled("étape annulée après son timeout")
+
+def set_execution_mode(mode):
+    """Choisir entre workers chauds ('inprocess') et isolation ('subprocess')"""
+    global execution_mode
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Mode d'exécution inconnu : {mode}")
+    execution_mode = mode
+    logging.info(f"Mode d'exécution des étapes: {mode}")
+
+def _vectorize(filepath, cache_dir=None):
+    from vectorize_books import vectorize_pdf
+    if vectorize_pdf(filepath, cache_dir=cache_dir) is None:
+        raise RuntimeError(f"Vectorisation échouée pour {filepath}")
+
+def _topics(source_name):
+    from topic_generator import run_topic_generation
+    run_topic_generation(source_name)
+
+def _articles(limit, source=None):
+    from generate_articles_from_supabase import generate_articles
+    generate_articles(int(limit), source)
+
+STAGE_CALLABLES = {
+    'vectorization': _vectorize,
+    'topics': _topics,
+    'articles': _articles,
+}
+
+def count_pages(filepath):
+    """Estimer le nombre de pages d'un fichier (PDF, TXT avec sauts de page, sinon taille)"""
+    ext = os.path.splitext(filepath)[1].lower()
+    try:
+        if ext == ".pdf":
+            from pypdf import PdfReader
+            return len(PdfReader(filepath).pages)
+        if ext == ".txt":
+            # Lu par blocs : un gros livre converti n'est jamais chargé en entier
+            breaks = chars = 0
+            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+                for block in iter(lambda: f.read(TXT_READ_CHARS), ''):
+                    breaks += block.count("\f")
+                    chars += len(block)
+            if breaks:
+                return breaks + 1
+            return max(1, chars // CHARS_PER_PAGE)
+    except Exception as e:
+        logging.warning(f"Comptage des pages impossible pour {filepath}: {e}")
+    return max(1, os.path.getsize(filepath) // CHARS_PER_PAGE)
+
+def stage_timeout(stage, filepath=None, items=None):
+    """Timeout d'une étape, proportionnel à la taille et au nombre de pages du fichier"""
+    config = STAGE_TIMEOUTS[stage]
+    timeout = config['base']
+    if filepath and os.path.exists(filepath):
+        size_mb = os.path.getsize(filepath) / (1024 * 1024)
+        timeout += config.get('per_page', 0) * count_pages(filepath)
+        timeout += config.get('per_mb', 0) * size_mb
+        if stage == 'vectorization' and not filepath.lower().endswith(".txt"):
+            from file_scheduler import estimate_cost
+            timeout += CONVERSION_TIMEOUT_FACTOR * estimate_cost(filepath)
+    if items:
+        timeout += config.get('per_item', 0) * int(items)
+    return int(max(timeout, config.get('min', 0)))
+
+def warm_up():
+    """Charger le modèle d'embeddings et Chroma une fois au démarrage du worker"""
+    if execution_mode != 'inprocess':
+        return
+    from embedding_store import warm_up as warm_embedding_store
+    warm_embedding_store()
+
+def stage_mode(stage):
+    """Mode d'exécution d'une étape : 'subprocess' global, sinon celui de l'étape (LLM), sinon 'inprocess'"""
+    if execution_mode == 'subprocess':
+        return execution_mode
+    return STAGE_MODES.get(stage, execution_mode)
+
+def _run_with_deadline(stage, stage_args, args, timeout):
+    """Exécuter l'étape dans un thread surveillé ; retourne False si elle a été annulée au timeout.
+
+    TimeoutExpired si elle tourne encore STAGE_CANCEL_GRACE secondes après
+    l'annulation (aucune relance possible sans doubler ses écritures).
+    """
+    outcome = {}
+    cancel = threading.Event()
+
+    def target():
+        _current.cancel = cancel
+        try:
+            STAGE_CALLABLES[stage](*stage_args)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name=f"stage-{stage}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        cancel.set()
+        logging.warning(f"TIMEOUT | {stage} | {args[1:]} | annulation demandée après {timeout}s")
+        thread.join(STAGE_CANCEL_GRACE)
+        if thread.is_alive():
+            logging.error(f"TIMEOUT | {stage} | {args[1:]} | étape toujours en cours {STAGE_CANCEL_GRACE}s après l'annulation")
+            raise subprocess.TimeoutExpired(args, timeout)
+        return False
+    if 'error' in outcome:
+        raise outcome['error']
+    return True
+
+def run_stage(stage, *stage_args, timeout=None, mode=None, retries=0):
+    """Exécuter une étape et retourner un subprocess.CompletedProcess.
+
+    Un timeout relance l'étape jusqu'à `retries` fois ; chaque relance repart
+    du dernier point de reprise de l'étape (voir checkpoints.py). En mode
+    'inprocess' la relance n'a lieu qu'une fois l'étape annulée arrêtée.
+    subprocess.TimeoutExpired est propagé une fois les relances épuisées.
+    """
+    mode = mode or stage_mode(stage)
+    args = [stage] + [str(a) for a in stage_args]
+
+    if mode == 'subprocess':
+        for attempt in range(retries + 1):
+            try:
+                return subprocess.run([sys.executable, STAGE_SCRIPTS[stage]] + args[1:],
+                                      capture_output=True, text=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                if attempt == retries:
+                    raise
+                print(f"⏱️ Timeout de l'étape {stage} ({timeout}s), reprise depuis le dernier checkpoint...")
+                logging.warning(f"TIMEOUT | {stage} | {args[1:]} | relance {attempt + 1}/{retries}")
+
+    for attempt in range(retries + 1):
+        try:
+            if _run_with_deadline(stage, stage_args, args, timeout):
+                return subprocess.CompletedProcess(args, 0, stdout="", stderr="")
+        except subprocess.TimeoutExpired:
+            raise
+        except Exception as e:
+            logging.error(f"Étape {stage} échouée pour {args[1:]}: {e}")
+            return subprocess.CompletedProcess(args, 1, stdout="", stderr=traceback.format_exc())
+        if attempt < retries:
+            print(f"⏱️ Timeout de l'étape {stage} ({timeout}s), reprise depuis le dernier checkpoint...")
+            logging.warning(f"TIMEOUT | {stage} | {args[1:]} | relance {attempt + 1}/{retries}")
+    raise subprocess.TimeoutExpired(args, timeout)
@@ -0,0 +1,90 @@
+"""
+Compteurs de fichiers par statut, tenus à jour à chaque déplacement.
+
+Les dossiers (en attente, processing, done, failed...) ne sont parcourus qu'une
+fois, à la création des compteurs ; ensuite chaque safe_file_move ajuste les
+compteurs en O(1). snapshot() donne les comptes, la progression et l'ETA sans
+relister ni stat() les fichiers.
+"""
+
+import os
+import time
+import threading
+
+class StatusCounters:
+    """Nombre de fichiers par statut, chaque dossier surveillé correspondant à un statut"""
+
+    def __init__(self, directories, accept=None):
+        # directories : {statut: dossier ou tuple de dossiers} ; accept(nom) filtre les fichiers comptés
+        self.directories = {}
+        for status, paths in directories.items():
+            for path in (paths if isinstance(paths, (tuple, list)) else (paths,)):
+                self.directories[os.path.abspath(path)] = status
+        self.accept = accept or (lambda filename: True)
+        self.counts = {status: 0 for status in directories}
+        self.lock = threading.Lock()
+        self.rescan()
+
+    def rescan(self):
+        """Recompter les fichiers de chaque dossier (une seule passe par dossier)"""
+        counts = {status: 0 for status in self.counts}
+        for directory, status in self.directories.items():
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                counts[status] += sum(1 for entry in entries
+                                     if entry.is_file() and self.accept(entry.name))
+        with self.lock:
+            self.counts = counts
+            self.started_at = time.time()
+            self.done_at_start = counts.get('done', 0)
+
+    def status_of(self, path):
+        """Statut correspondant au dossier d'un chemin (None si non suivi)"""
+        return self.directories.get(os.path.dirname(os.path.abspath(path)))
+
+    def record_added(self, path):
+        """Prendre en compte un nouveau fichier déposé"""
+        status = self.status_of(path)
+        if status and self.accept(os.path.basename(path)):
+            with self.lock:
+                self.counts[status] += 1
+
+    def record_move(self, src, dst):
+        """Prendre en compte un déplacement réussi src → dst"""
+        if not self.accept(os.path.basename(src)):
+            return
+        src_status, dst_status = self.status_of(src), self.status_of(dst)
+        if src_status == dst_status:
+            return
+        with self.lock:
+            if src_status:
+                self.counts[src_status] = max(0, self.counts[src_status] - 1)
+            if dst_status:
+                self.counts[dst_status] += 1
+
+    def snapshot(self):
+        """Comptes par statut, progression et ETA (sans accès disque)"""
+        with self.lock:
+            counts = dict(self.counts)
+            elapsed = time.time() - self.started_at
+            done_since_start = counts.get('done', 0) - self.done_at_start
+        total = sum(counts.values())
+        remaining = total - counts.get('done', 0) - counts.get('failed', 0)
+        rate = done_since_start / elapsed if elapsed > 0 and done_since_start > 0 else None
+        return {
+            'counts': counts,
+            'total': total,
+            'remaining': remaining,
+            'progress': (counts.get('done', 0) / total * 100) if total > 0 else 0,
+            'files_per_hour': rate * 3600 if rate else None,
+            'eta_seconds': remaining / rate if rate else None,
+        }
+
+def format_eta(snapshot):
+    """ETA lisible (ou 'inconnue' tant qu'aucun fichier n'a été terminé)"""
+    eta = snapshot['eta_seconds']
+    if eta is None:
+        return "inconnue"
+    hours, rest = divmod(int(eta), 3600)
+    return f"{hours}h{rest // 60:02d}"
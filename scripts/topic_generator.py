@@ -5,10 +5,10 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import uuid
 import requests
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 import argparse
 from rag_scripts.llm_utils import generate_text
+from embedding_store import CHROMA_DIR, get_vectorstore
+from stage_workers import check_cancelled
 import re
 
 # Chargement des variables d'environnement
@@ -17,9 +17,10 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY") or os.getenv("SUPABASE_KEY")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 HUGGINGFACE_API_KEY = os.environ.get("HUGGINGFACE_API_KEY")
+# Délai maximal d'une requête REST à Supabase (s)
+SUPABASE_TIMEOUT = float(os.environ.get("RAG_SUPABASE_TIMEOUT", "30"))
 
 # Configuration
-CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
 MODEL_PATH = "/home/koffi/.cache/huggingface/hub/models--TheBloke--Mistral-7B-Instruct-v0.1-GPTQ/snapshots/6ae1e4ae2cfbaf107c705ed722ec243b4f88014d"
 
 def clean_chunk(text):
@@ -37,11 +38,8 @@ def clean_chunk(text):
 
 def extract_topics_from_source(source_name, batch_size=8):
     print("[DEBUG] Entrée dans extract_topics_from_source")
-    print("[DEBUG] Avant HuggingFaceEmbeddings")
-    embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    print("[DEBUG] Après HuggingFaceEmbeddings")
     print("[DEBUG] Avant Chroma")
-    vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
+    vectorstore = get_vectorstore(CHROMA_DIR)
     print("[DEBUG] Après Chroma")
     docs = vectorstore.get()["metadatas"]
     texts = vectorstore.get()["documents"]
@@ -61,6 +59,8 @@ def extract_topics_from_source(source_name, batch_size=8):
         if i >= batch_size * 5:
             print("[DEBUG] Arrêt anticipé pour test (5 batchs)")
             break
+        # Timeout de l'étape (exécution en processus)
+        check_cancelled()
         print(f"[DEBUG] Batch {i//batch_size+1} sur {len(filtered_chunks)//batch_size+1}")
         batch = [clean_chunk(chunk) for chunk in filtered_chunks[i:i + batch_size]]
         full_text = "\n".join(batch)
@@ -105,6 +105,7 @@ def insert_topics_to_supabase(topics, user_id, source_name):
 
     success = 0
     for topic in topics:
+        check_cancelled()
         payload = {
             "id": str(uuid.uuid4()),
             "name": topic,
@@ -115,7 +116,8 @@ def insert_topics_to_supabase(topics, user_id, source_name):
         response = requests.post(
             f"{SUPABASE_URL}/rest/v1/topics",
             headers=headers,
-            json=payload
+            json=payload,
+            timeout=SUPABASE_TIMEOUT
         )
         if response.status_code in (200, 201):
             success += 1
@@ -124,6 +126,18 @@ def insert_topics_to_supabase(topics, user_id, source_name):
 
     print(f"✅ {success} topics insérés avec succès.")
 
+def run_topic_generation(source_name, user_id=None):
+    """Extraire les topics d'une source et les insérer dans Supabase"""
+    # Si aucun user_id n'est fourni, on génère un UUID aléatoire
+    user_id = user_id if user_id else str(uuid.uuid4())
+    topics = extract_topics_from_source(source_name)
+    print("[DEBUG] Fin de extract_topics_from_source")
+    if not topics:
+        print("⚠️ Aucun topic généré pour ce document.")
+    else:
+        insert_topics_to_supabase(topics, user_id, source_name)
+    return topics
+
 if __name__ == "__main__":
     print("[DEBUG] Entrée dans le main de topic_generator.py")
     parser = argparse.ArgumentParser()
@@ -142,12 +156,5 @@ if __name__ == "__main__":
             print(f"[ERROR] DeepSeek API test failed: {e}")
         exit(0)
 
-    # Si aucun user_id n'est fourni, on génère un UUID aléatoire
-    user_id = args.user_id if args.user_id else str(uuid.uuid4())
-    topics = extract_topics_from_source(args.source_name)
-    print("[DEBUG] Fin de extract_topics_from_source")
-    if not topics:
-        print("⚠️ Aucun topic généré pour ce document.")
-    else:
-        insert_topics_to_supabase(topics, user_id, args.source_name)
+    run_topic_generation(args.source_name, args.user_id)
 
@@ -1,8 +1,8 @@
 import os
 import time
-import whisper
 import logging
 from datetime import datetime
+from transcription_engine import transcribe_to_file
 
 WATCHED_MP3 = os.path.join(os.path.dirname(__file__), '..', 'watched_mp3')
 WATCHED_TXT = os.path.join(os.path.dirname(__file__), '..', 'watched_txt')
@@ -17,12 +17,9 @@ logging.basicConfig(
 
 def transcribe_mp3(mp3_path, output_txt_path):
     try:
-        model = whisper.load_model("base")
         logging.info(f"START | {os.path.basename(mp3_path)}")
-        result = model.transcribe(mp3_path, language="fr")
-        text = result["text"]
-        with open(output_txt_path, "w", encoding="utf-8") as f:
-            f.write(text)
+        # Modèle chargé une seule fois pour tous les fichiers surveillés
+        transcribe_to_file(mp3_path, output_txt_path, language="fr")
         logging.info(f"SUCCESS | {os.path.basename(mp3_path)} | Output: {output_txt_path}")
         print(f"✅ Transcription terminée pour {mp3_path}")
     except Exception as e:
@@ -0,0 +1,268 @@
+"""
+Transcription audio résidente, découpée aux silences et parallèle sur CPU.
+
+Le modèle Whisper n'est chargé qu'une fois par processus worker (pool gardé
+ouvert entre les fichiers) au lieu d'un whisper.load_model() par fichier.
+L'audio est décodé en flux par ffmpeg (16 kHz mono) et découpé en segments de
+SEGMENT_MIN_SECONDS à SEGMENT_MAX_SECONDS, coupés au passage le plus silencieux ;
+les segments sont transcrits en parallèle et le texte sort dans l'ordre au fur
+et à mesure, sans attendre la fin du fichier ni le garder entier en mémoire.
+
+Backends :
+- 'whisper'        : openai-whisper en float32 (comportement historique) ;
+- 'whisper-int8'   : openai-whisper quantifié en int8 (torch quantize_dynamic) ;
+- 'faster-whisper' : CTranslate2, calcul int8 par défaut (WHISPER_COMPUTE_TYPE).
+"""
+
+import os
+import atexit
+import logging
+import tempfile
+import itertools
+import threading
+import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+TRANSCRIPTION_BACKENDS = ('whisper', 'whisper-int8', 'faster-whisper')
+TRANSCRIPTION_BACKEND = os.environ.get("RAG_WHISPER_BACKEND", "whisper")
+WHISPER_MODEL = os.environ.get("RAG_WHISPER_MODEL", "base")
+WHISPER_COMPUTE_TYPE = os.environ.get("RAG_WHISPER_COMPUTE_TYPE", "int8")
+# Version du découpage et de la transcription : à incrémenter quand le texte produit change (invalide le cache)
+EXTRACTOR_VERSION = 1
+
+# Un worker garde un modèle et utilise WHISPER_THREADS threads torch/CTranslate2
+WHISPER_WORKERS = int(os.environ.get("RAG_WHISPER_WORKERS", max(1, (os.cpu_count() or 1) // 4)))
+WHISPER_THREADS = int(os.environ.get("RAG_WHISPER_THREADS", max(1, (os.cpu_count() or 1) // WHISPER_WORKERS)))
+
+SAMPLE_RATE = 16000
+# Segment coupé au passage le plus silencieux entre MIN et MAX secondes
+SEGMENT_MIN_SECONDS = 60
+SEGMENT_MAX_SECONDS = 120
+# Fenêtre d'énergie (ms) pour chercher le silence
+SILENCE_WINDOW_MS = 500
+FRAME_MS = 30
+# Segment ignoré si son amplitude maximale reste sous ce seuil (silence, évite les hallucinations)
+SILENT_PEAK = 0.005
+READ_SECONDS = 10
+# Fin des erreurs ffmpeg reprise dans le message d'échec (caractères)
+FFMPEG_ERROR_CHARS = 2000
+
+def iter_audio_segments(audio_path, min_seconds=SEGMENT_MIN_SECONDS, max_seconds=SEGMENT_MAX_SECONDS):
+    """Décoder l'audio en flux (ffmpeg) et générer (début en secondes, échantillons float32) coupés aux silences"""
+    # Erreurs dans un fichier temporaire : un tube stderr plein bloquerait ffmpeg pendant qu'on lit stdout
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', audio_path,
+         '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-'],
+        stdout=subprocess.PIPE, stderr=errors
+    )
+    min_samples, max_samples = min_seconds * SAMPLE_RATE, max_seconds * SAMPLE_RATE
+    buffer = np.zeros(0, dtype=np.int16)
+    offset = 0
+    decoded = False
+    try:
+        while True:
+            data = process.stdout.read(READ_SECONDS * SAMPLE_RATE * 2)
+            if data:
+                buffer = np.concatenate([buffer, np.frombuffer(data, dtype=np.int16)])
+            while len(buffer) >= max_samples or (not data and len(buffer) > 0):
+                cut = _find_cut(buffer, min_samples, max_samples) if len(buffer) >= max_samples else len(buffer)
+                samples = buffer[:cut].astype(np.float32) / 32768.0
+                buffer = buffer[cut:]
+                if np.abs(samples).max(initial=0) >= SILENT_PEAK:
+                    yield offset / SAMPLE_RATE, samples
+                offset += cut
+            if not data:
+                decoded = True
+                break
+    finally:
+        if not decoded:
+            # Générateur fermé avant la fin (ou erreur) : ffmpeg est arrêté, son code de sortie n'a pas de sens
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        errors.seek(0)
+        error = errors.read().decode(errors='replace').strip()[-FFMPEG_ERROR_CHARS:]
+        errors.close()
+        if returncode != 0 and decoded:
+            raise RuntimeError(f"ffmpeg n'a pas pu décoder {os.path.basename(audio_path)}: {error}")
+
+def _find_cut(samples, min_samples, max_samples):
+    """Indice de coupe au centre de la fenêtre la plus silencieuse entre min et max"""
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    region = samples[min_samples:max_samples].astype(np.float32) / 32768.0
+    frames = len(region) // frame
+    if frames == 0:
+        return max_samples
+    energy = np.sqrt(np.mean(region[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+    window = max(1, SILENCE_WINDOW_MS // FRAME_MS)
+    if frames > window:
+        energy = np.convolve(energy, np.ones(window) / window, mode='valid')
+    quietest = int(np.argmin(energy))
+    return min_samples + (quietest + window // 2) * frame
+
+class WhisperEngine:
+    """Modèle openai-whisper résident, quantifié en int8 si demandé"""
+
+    def __init__(self, model_name, threads, quantize=False):
+        import torch
+        import whisper
+        torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_name, device="cpu")
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def transcribe(self, samples, language=None):
+        return self.model.transcribe(samples, language=language, fp16=False)["text"].strip()
+
+class FasterWhisperEngine:
+    """Modèle CTranslate2 résident (faster-whisper), calcul int8 par défaut"""
+
+    def __init__(self, model_name, threads, compute_type=WHISPER_COMPUTE_TYPE):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+    def transcribe(self, samples, language=None):
+        segments, _ = self.model.transcribe(samples, language=language)
+        return "".join(segment.text for segment in segments).strip()
+
+def create_engine(backend=None, model_name=None, threads=None):
+    """Charger le modèle du backend demandé"""
+    backend = backend or TRANSCRIPTION_BACKEND
+    if backend not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Backend de transcription inconnu : {backend}")
+    model_name = model_name or WHISPER_MODEL
+    threads = threads or WHISPER_THREADS
+    logging.info(f"WHISPER | chargement du modèle {model_name} ({backend}, {threads} threads)")
+    if backend == 'faster-whisper':
+        return FasterWhisperEngine(model_name, threads)
+    return WhisperEngine(model_name, threads, quantize=(backend == 'whisper-int8'))
+
+# Modèle du processus worker, chargé une fois par l'initializer du pool
+_engine = None
+
+def _init_worker(backend, model_name, threads):
+    global _engine
+    _engine = create_engine(backend, model_name, threads)
+
+def _transcribe_segment(samples, language):
+    return _engine.transcribe(samples, language)
+
+class TranscriptionService:
+    """Service de transcription gardant ses modèles chargés d'un fichier à l'autre"""
+
+    def __init__(self, backend=None, model_name=None, workers=None, threads=None):
+        self.backend = backend or TRANSCRIPTION_BACKEND
+        self.model_name = model_name or WHISPER_MODEL
+        self.workers = workers or WHISPER_WORKERS
+        self.threads = threads or WHISPER_THREADS
+        self.engine = None
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawn : le processus parent peut déjà avoir initialisé torch (modèle d'embeddings)
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.backend, self.model_name, self.threads)
+                )
+            return self.pool
+
+    def _transcribe_in_process(self, samples, language):
+        with self.lock:
+            if self.engine is None:
+                self.engine = create_engine(self.backend, self.model_name, self.threads)
+            return self.engine.transcribe(samples, language)
+
+    def iter_transcribe(self, audio_path, language=None, start=0):
+        """Générer (début du segment en secondes, texte) dans l'ordre, au fil de la transcription.
+
+        Les `start` premiers segments sont décodés mais pas transcrits (reprise).
+        """
+        audio = iter_audio_segments(audio_path)
+        segments = itertools.islice(audio, start, None)
+        in_flight = deque()
+        try:
+            if self.workers == 1:
+                for offset, samples in segments:
+                    yield offset, self._transcribe_in_process(samples, language)
+                return
+
+            pool = self._get_pool()
+            # Segments en avance sur le prochain texte à rendre (borne la mémoire des échantillons)
+            window = self.workers * 2
+            for offset, samples in segments:
+                in_flight.append((offset, pool.submit(_transcribe_segment, samples, language)))
+                if len(in_flight) >= window:
+                    break
+            while in_flight:
+                offset, future = in_flight.popleft()
+                yield offset, future.result()
+                segment = next(segments, None)
+                if segment is not None:
+                    in_flight.append((segment[0], pool.submit(_transcribe_segment, segment[1], language)))
+        finally:
+            # Transcription abandonnée en cours de route : libérer le pool partagé et arrêter ffmpeg
+            for _, future in in_flight:
+                future.cancel()
+            audio.close()
+
+    def transcribe_to_file(self, audio_path, output_path, language=None):
+        """Transcrire dans output_path, un paragraphe par segment ; retourne le nombre de caractères"""
+        chars = 0
+        segments = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for _, text in self.iter_transcribe(audio_path, language):
+                if not text:
+                    continue
+                if segments:
+                    f.write("\n\n")
+                f.write(text)
+                f.flush()
+                chars += len(text)
+                segments += 1
+        logging.info(f"WHISPER | {os.path.basename(audio_path)} | {segments} segments | {chars} caractères")
+        return chars
+
+    def close(self):
+        """Arrêter les workers (les modèles sont libérés)"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            self.engine = None
+
+_service = None
+_service_lock = threading.Lock()
+_service_options = {}
+
+def configure(backend=None, model_name=None, workers=None, threads=None):
+    """Choisir backend, modèle et parallélisme du service (avant la première transcription)"""
+    global _service
+    if backend is not None and backend not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Backend de transcription inconnu : {backend}")
+    options = {'backend': backend, 'model_name': model_name, 'workers': workers, 'threads': threads}
+    with _service_lock:
+        _service_options.update({k: v for k, v in options.items() if v is not None})
+        if _service is not None:
+            _service.close()
+            _service = None
+
+def get_service():
+    """Service de transcription du processus (créé une fois)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService(**_service_options)
+            atexit.register(_service.close)
+        return _service
+
+def transcribe_to_file(audio_path, output_path, language=None):
+    """Transcrire un fichier audio avec le service résident ; retourne le nombre de caractères"""
+    return get_service().transcribe_to_file(audio_path, output_path, language)
@@ -1,17 +1,39 @@
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredEPubLoader, UnstructuredWordDocumentLoader, TextLoader
+from langchain_community.document_loaders import UnstructuredWordDocumentLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
 import fitz  # PyMuPDF
 import os
 import sys
+import atexit
 import logging
+import itertools
+import threading
+import multiprocessing
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-CHROMA_DIR = "/home/koffi/rag_scripts/chroma_store"
+from embedding_store import CHROMA_DIR, get_vectorstore, get_embeddings, add_embedded_chunks, delete_page_chunks
+from job_ledger import compute_content_hash
+from checkpoints import file_checkpoint_key, load_checkpoint, save_checkpoint, clear_checkpoint
+from stage_workers import check_cancelled
+from document_stream import iter_document, supports
+
+# Saut de page laissé par les convertisseurs dans les fichiers TXT
+PAGE_BREAK = "\f"
+# Nombre de pages vectorisées entre deux points de reprise
+PAGES_PER_CHECKPOINT = 20
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Mode shards : un PDF ou DJVU d'au moins SHARD_MIN_PAGES pages est découpé en
+# plages de SHARD_PAGES pages chargées, découpées et vectorisées en parallèle
+SHARD_EXTENSIONS = (".pdf", ".djvu")
+SHARD_MIN_PAGES = int(os.environ.get("RAG_SHARD_MIN_PAGES", "300"))
+SHARD_PAGES = int(os.environ.get("RAG_SHARD_PAGES", "50"))
+SHARD_WORKERS = int(os.environ.get("RAG_SHARD_WORKERS", max(1, min(4, (os.cpu_count() or 1) // 2))))
 
 # Configuration du logger
 LOG_FILE = os.path.join(os.path.dirname(__file__), '..', 'vectorization.log')
@@ -23,8 +45,11 @@ logging.basicConfig(
 )
 
 class DJVULoader:
-    def __init__(self, filepath):
+    def __init__(self, filepath, start=0, stop=None):
+        # Plage de pages (indices start à stop exclu) : tout le document par défaut
         self.filepath = filepath
+        self.start = start
+        self.stop = stop
     
     def load(self):
         documents = []
@@ -33,7 +58,8 @@ class DJVULoader:
             doc = fitz.open(self.filepath)
             print(f"📖 DJVU ouvert avec PyMuPDF, {len(doc)} pages détectées")
             
-            for page_num in range(len(doc)):
+            stop = len(doc) if self.stop is None else min(self.stop, len(doc))
+            for page_num in range(self.start, stop):
                 try:
                     page = doc.load_page(page_num)
                     text = page.get_text()
@@ -54,6 +80,10 @@ class DJVULoader:
         except Exception as e:
             print(f"❌ Erreur PyMuPDF DJVU : {e}")
         
+        # Une plage de pages (shard) sans texte reste vide
+        if self.start or self.stop is not None:
+            return documents
+        
         # Fallback: essayer d'extraire au moins quelques pages
         try:
             print("🔄 Tentative de fallback DJVU...")
@@ -86,55 +116,251 @@ class DJVULoader:
         return documents
 
 def get_loader(filepath):
+    """Loader des formats non lus en flux par document_stream"""
     ext = filepath.lower().split('.')[-1]
-    if ext == 'pdf':
-        return PyPDFLoader(filepath)
-    elif ext == 'epub':
-        return UnstructuredEPubLoader(filepath)
-    elif ext in ['docx', 'doc']:
+    if ext == 'doc':
         return UnstructuredWordDocumentLoader(filepath)
-    elif ext == 'txt':
-        return TextLoader(filepath)
     elif ext == 'djvu':
         return DJVULoader(filepath)
-    elif ext == 'azw3':
-        return DJVULoader(filepath)  # PyMuPDF peut aussi lire AZW3
     else:
         raise ValueError(f"Format non supporté : {ext}")
 
-def vectorize_pdf(filepath):
-    print(f"📄 Vectorisation de : {filepath}")
-    start_time = datetime.now()
+def split_pages(documents):
+    """Redécouper les documents texte en pages sur les sauts de page (PAGE_BREAK)"""
+    pages = []
+    for doc in documents:
+        parts = doc.page_content.split(PAGE_BREAK)
+        if len(parts) == 1:
+            pages.append(doc)
+            continue
+        for page_num, part in enumerate(parts, start=1):
+            metadata = dict(doc.metadata)
+            metadata.setdefault("page", page_num)
+            pages.append(Document(page_content=part, metadata=metadata))
+    return pages
+
+def iter_pages(filepath, start=0, cache_dir=None, stop=None):
+    """Pages (Documents) d'un fichier de la page `start` à `stop` exclue : flux en mémoire, loader sinon"""
+    if supports(filepath):
+        for segment in iter_document(filepath, start=start, cache_dir=cache_dir, stop=stop):
+            yield Document(page_content=segment.text, metadata=segment.metadata)
+        return
+    if stop is not None and filepath.lower().endswith(".djvu"):
+        # Plage d'un shard : seules ses pages sont lues
+        yield from DJVULoader(filepath, start, stop).load()
+        return
+    yield from split_pages(get_loader(filepath).load())[start:stop]
+
+def chunk_id(content_hash, page, index):
+    """Id déterministe d'un chunk, tiré du contenu et non du nom : une page vectorisée à nouveau
+    remplace ses chunks au lieu de les dupliquer, deux livres du même nom ne se marchent pas dessus"""
+    return f"{content_hash}:{page}:{index}"
+
+def split_into_chunks(splitter, pages, filename, content_hash, first_position=1):
+    """Découper des pages en chunks ; retourne (chunks, ids, numéros des pages) avec le nom du fichier pour source"""
+    chunks = []
+    ids = []
+    page_numbers = []
+    for position, page in enumerate(pages, start=first_position):
+        page_number = page.metadata.get("page", position)
+        page_numbers.append(page_number)
+        for index, chunk in enumerate(splitter.split_documents([page])):
+            # Ajout du nom du fichier en tant que métadonnée "source"
+            chunk.metadata["source"] = filename
+            # Contenu et page : chunks d'une page retrouvés avant qu'elle soit vectorisée à nouveau
+            chunk.metadata["content_hash"] = content_hash
+            chunk.metadata["page"] = page_number
+            chunks.append(chunk)
+            ids.append(chunk_id(content_hash, page_number, index))
+    return chunks, ids, page_numbers
+
+def shard_page_count(filepath):
+    """Nombre de pages si le fichier doit être vectorisé en shards, None sinon"""
+    if SHARD_WORKERS < 2 or not filepath.lower().endswith(SHARD_EXTENSIONS):
+        return None
+    try:
+        with fitz.open(filepath) as doc:
+            pages = doc.page_count
+    except Exception as e:
+        logging.warning(f"SHARD | {os.path.basename(filepath)} | comptage des pages impossible: {e}")
+        return None
+    return pages if pages >= SHARD_MIN_PAGES else None
+
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+def _init_shard_worker(ocr_workers, embedding_threads):
+    # Les pages scannées d'un shard passent par le pool OCR du worker : cœurs partagés entre shards
+    import ocr_engine
+    ocr_engine.OCR_WORKERS = ocr_workers
+    # Le shard est déjà un processus parmi SHARD_WORKERS : modèle chargé ici, pas de pool d'embeddings imbriqué
+    import embedding_store
+    from embedding_workers import pin_threads
+    embedding_store.EMBEDDING_WORKERS = 1
+    embedding_store.EMBEDDING_THREADS = embedding_threads
+    pin_threads(embedding_threads)
+
+def get_shard_pool():
+    """Pool de workers des shards, gardé ouvert entre les fichiers (modèle d'embeddings chargé une fois par worker)"""
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            from ocr_engine import OCR_WORKERS
+            # spawn : le processus parent a déjà initialisé torch
+            _shard_pool = ProcessPoolExecutor(
+                max_workers=SHARD_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_shard_worker,
+                initargs=(max(1, OCR_WORKERS // SHARD_WORKERS), max(1, (os.cpu_count() or 1) // SHARD_WORKERS))
+            )
+            atexit.register(_shard_pool.shutdown)
+        return _shard_pool
+
+def _discard_shard_pool():
+    global _shard_pool
+    with _shard_pool_lock:
+        _shard_pool = None
+
+def _vectorize_shard(filepath, content_hash, start, stop):
+    """Worker : charger, découper et calculer les embeddings des pages d'indice start à stop exclu"""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    pages = list(iter_pages(filepath, start=start, stop=stop))
+    chunks, ids, page_numbers = split_into_chunks(splitter, pages, os.path.basename(filepath), content_hash, start + 1)
+    texts = [chunk.page_content for chunk in chunks]
+    embeddings = get_embeddings().embed_documents(texts) if texts else []
+    return ids, texts, [chunk.metadata for chunk in chunks], embeddings, page_numbers
+
+def vectorize_sharded(filepath, total_pages, resume=True):
+    """Vectoriser un gros PDF/DJVU par plages de pages en parallèle ; retourne le nombre de chunks.
+
+    Chaque shard (chargement, découpage, embeddings) tourne dans un worker ;
+    ce processus insère les chunks dans Chroma sous la même source au fil des
+    shards terminés. Les shards faits sont notés dans un point de reprise et
+    les ids des chunks sont déterministes : une relance ne refait que les
+    shards manquants, sans doublons.
+    """
+    filename = os.path.basename(filepath)
+    checkpoint_key = file_checkpoint_key(filepath)
+    checkpoint = load_checkpoint('vectorization_shards', checkpoint_key) if resume else None
+    if checkpoint and checkpoint.get('shard_pages') != SHARD_PAGES:
+        checkpoint = None
+    shards_done = set(checkpoint['shards_done']) if checkpoint else set()
+    chunks_done = checkpoint['chunks_done'] if checkpoint else 0
+
+    shards = [(start, min(start + SHARD_PAGES, total_pages))
+              for start in range(0, total_pages, SHARD_PAGES) if start not in shards_done]
+    print(f"🧩 {total_pages} pages en shards de {SHARD_PAGES} pages ({SHARD_WORKERS} workers)")
+    if shards_done:
+        print(f"♻️ Reprise : {len(shards_done)} shards déjà vectorisés ({chunks_done} chunks)")
+
+    vectordb = get_vectorstore(CHROMA_DIR)
+    content_hash = compute_content_hash(filepath)
+    pool = get_shard_pool()
+    futures = {pool.submit(_vectorize_shard, filepath, content_hash, start, stop): (start, stop)
+               for start, stop in shards}
     try:
-        # Chargement du document
-        loader = get_loader(filepath)
-        documents = loader.load()
+        for future in as_completed(futures):
+            # Timeout de l'étape : rien n'est inséré après l'annulation
+            check_cancelled()
+            start, stop = futures[future]
+            ids, texts, metadatas, embeddings, page_numbers = future.result()
+            # Chunks d'une tentative interrompue : ceux en trop ne seraient pas remplacés par l'upsert
+            delete_page_chunks(vectordb, content_hash, page_numbers)
+            if ids:
+                add_embedded_chunks(vectordb, ids, texts, metadatas, embeddings)
+            shards_done.add(start)
+            chunks_done += len(ids)
+            save_checkpoint('vectorization_shards', checkpoint_key, {
+                'shard_pages': SHARD_PAGES,
+                'shards_done': sorted(shards_done),
+                'chunks_done': chunks_done,
+            })
+            logging.info(f"SHARD | {filename} | pages {start + 1}-{stop} | {len(ids)} chunks")
+    except BrokenProcessPool:
+        # Worker tué (mémoire...) : nouveau pool au prochain fichier
+        _discard_shard_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+    vectordb.persist()
+    clear_checkpoint('vectorization_shards', checkpoint_key)
+    return chunks_done
+
+def _vectorize_sequential(filepath, resume=True, cache_dir=None):
+    """Vectoriser un fichier page par page dans ce processus ; retourne (chunks, pages)"""
+    # Point de reprise d'une tentative précédente interrompue (timeout, crash)
+    checkpoint_key = file_checkpoint_key(filepath)
+    checkpoint = load_checkpoint('vectorization', checkpoint_key) if resume else None
+    pages_done = checkpoint['pages_done'] if checkpoint else 0
+    chunks_done = checkpoint['chunks_done'] if checkpoint else 0
+    if pages_done:
+        print(f"♻️ Reprise à la page {pages_done + 1} ({chunks_done} chunks déjà vectorisés)")
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    filename = os.path.basename(filepath)
+    content_hash = compute_content_hash(filepath)
+    # Embeddings + insertion dans ChromaDB (modèle et handle partagés par le processus)
+    vectordb = get_vectorstore(CHROMA_DIR)
+
+    pages = iter_pages(filepath, start=pages_done, cache_dir=cache_dir)
+    while True:
+        # Timeout de l'étape : arrêt au point de reprise qui vient d'être enregistré
+        check_cancelled()
+        # Pages converties au fil du flux, vectorisées par plages
+        batch = list(itertools.islice(pages, PAGES_PER_CHECKPOINT))
+        if not batch:
+            break
 
         # Découpage du texte
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(documents)
+        chunks, ids, page_numbers = split_into_chunks(splitter, batch, filename, content_hash, pages_done + 1)
 
-        # Ajout du nom du fichier en tant que métadonnée "source"
-        filename = os.path.basename(filepath)
-        for chunk in chunks:
-            chunk.metadata["source"] = filename
+        # Chunks d'une tentative interrompue : ceux en trop ne seraient pas remplacés par l'upsert
+        delete_page_chunks(vectordb, content_hash, page_numbers)
+        if chunks:
+            vectordb.add_documents(chunks, ids=ids)
+        pages_done += len(batch)
+        chunks_done += len(chunks)
+        save_checkpoint('vectorization', checkpoint_key, {
+            'pages_done': pages_done,
+            'chunks_done': chunks_done,
+        })
+
+    vectordb.persist()
+    clear_checkpoint('vectorization', checkpoint_key)
+    return chunks_done, pages_done
 
-        # Embeddings + insertion dans ChromaDB
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectordb = Chroma(persist_directory=CHROMA_DIR, embedding_function=embeddings)
-        vectordb.add_documents(chunks)
-        vectordb.persist()
+def vectorize_pdf(filepath, resume=True, cache_dir=None):
+    """Vectoriser un fichier par plages de pages, en reprenant après la dernière plage enregistrée.
+
+    Le texte arrive directement des convertisseurs (document_stream) ; cache_dir
+    garde en plus une copie .txt réutilisée par les tentatives suivantes. Les
+    gros PDF et DJVU sont vectorisés en shards parallèles (vectorize_sharded).
+    """
+    print(f"📄 Vectorisation de : {filepath}")
+    start_time = datetime.now()
+    try:
+        filename = os.path.basename(filepath)
+        total_pages = shard_page_count(filepath)
+        if total_pages:
+            chunks_done, pages_done = vectorize_sharded(filepath, total_pages, resume), total_pages
+        else:
+            chunks_done, pages_done = _vectorize_sequential(filepath, resume, cache_dir)
 
-        print(f"✅ {len(chunks)} chunks vectorisés pour {filename}")
-        logging.info(f"SUCCESS | {filename} | {len(chunks)} chunks | Start: {start_time.strftime('%Y-%m-%d %H:%M:%S')} | End: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"✅ {chunks_done} chunks vectorisés pour {filename} ({pages_done} pages)")
+        logging.info(f"SUCCESS | {filename} | {chunks_done} chunks | Start: {start_time.strftime('%Y-%m-%d %H:%M:%S')} | End: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        return chunks_done
     except Exception as e:
         print(f"❌ Erreur lors de la vectorisation de {filepath} : {e}")
         logging.error(f"FAILURE | {os.path.basename(filepath)} | Error: {e}")
+        return None
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python vectorize_books.py <filepath>")
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python vectorize_books.py <filepath> [cache_dir]")
         sys.exit(1)
     
     filepath = sys.argv[1]
-    vectorize_pdf(filepath)
+    cache_dir = sys.argv[2] if len(sys.argv) == 3 else None
+    if vectorize_pdf(filepath, cache_dir=cache_dir) is None:
+        sys.exit(1)
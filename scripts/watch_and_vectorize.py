@@ -2,9 +2,8 @@ import shutil
 import time
 import os
 import sys
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 from vectorize_books import vectorize_pdf
+from inbox_events import start_watching, stop_watching
 import argparse
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -40,10 +39,11 @@ def process_existing_pdfs():
                 process_pdf(full_path)
 
 # 🧭 2. Surveillance des nouveaux fichiers
-class PDFHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if event.src_path.endswith(".pdf"):
-            process_pdf(event.src_path)
+def process_new_pdfs(file_paths):
+    """Vectoriser un lot de nouveaux PDF dont l'écriture est terminée"""
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            process_pdf(file_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -54,14 +54,13 @@ if __name__ == "__main__":
     process_existing_pdfs()
 
     if not args.once:
-        event_handler = PDFHandler()
-        observer = Observer()
-        observer.schedule(event_handler, WATCH_DIRECTORY, recursive=False)
-        observer.start()
+        observer, batcher = start_watching(
+            WATCH_DIRECTORY, process_new_pdfs, accept=lambda path: path.endswith(".pdf")
+        )
 
         try:
             while True:
                 time.sleep(10)
         except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
+            pass
+        stop_watching(observer, batcher)